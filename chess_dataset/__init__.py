@@ -1,7 +1,36 @@
+import importlib
+
 from .dataset import load_dataset
-from .benchmark import SarfaBenchmark
+from .result_store import ResultStore, ResultRow
+
+# modules with a CLI are only imported on first use, so `python -m` doesn't find them imported by the package already
+_LAZY_ATTRIBUTES = {
+    "SarfaBenchmark": ".benchmark",
+    "CompiledDataset": ".compiled",
+    "load_compiled_dataset": ".compiled",
+    "bitmask_metrics": ".compiled",
+    "compare_results": ".significance",
+    "format_comparison": ".significance",
+}
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
 
 __all__ = [
     "load_dataset",
-    "SarfaBenchmark"
-]
\ No newline at end of file
+    "SarfaBenchmark",
+    "ResultStore",
+    "ResultRow",
+    "CompiledDataset",
+    "load_compiled_dataset",
+    "bitmask_metrics",
+    "compare_results",
+    "format_comparison",
+]
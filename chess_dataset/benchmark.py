@@ -1,4 +1,4 @@
-from typing import Callable, Dict, List
+from typing import Any, Callable, Dict, List
 import pickle
 
 import numpy as np
@@ -7,20 +7,67 @@ import matplotlib.pyplot as plt
 
 import chess
 
-from .dataset import load_dataset
+from sarfa import profiling
+from .compiled import bitmask_metrics, load_compiled_dataset, scale_saliency
+from .result_store import COLUMNS, ResultStore, ResultRow, saliency_row, squares_mask
 
 class SarfaBenchmark:
 
     def __init__(self, saliency_algorithm: Callable[[str], Dict[str, int]]):
-        self.dataset = load_dataset()
+        self.dataset = load_compiled_dataset()
         self.saliency_algorithm: Callable[[str], Dict[str, int]] = saliency_algorithm
+        self.name = getattr(saliency_algorithm, "__name__", "saliency_algorithm")
 
         self.ground_truth_array = np.array([])
         self.predicted_values_array = np.array([])
         self.index_to_position_strs = []
-        
+        self.results: List[ResultRow] = []
+        # column views of the results, what the metrics read:
+        # FENs, (n, 64) saliency by chess square (NaN where not evaluated) and ground-truth bitboards
+        self.fens = np.empty(0, dtype=COLUMNS["fen"][0])
+        self.saliency = np.empty((0, 64), dtype=COLUMNS["saliency"][0])
+        self.ground_truth = np.empty(0, dtype=COLUMNS["ground_truth"][0])
+        self._union_squares = np.empty((0, 64), dtype=bool)
+
+    @property
+    def index_to_position_strs(self) -> List[Dict[int, str]]:
+        # built on first use for results loaded from the store, the metrics don't need it
+        if self._index_to_position_strs is None:
+            self._index_to_position_strs = [dict(enumerate(chess.square_name(square) for square in np.flatnonzero(row))) for row in self._union_squares]
+        return self._index_to_position_strs
+
+    @index_to_position_strs.setter
+    def index_to_position_strs(self, value: List[Dict[int, str]] | None):
+        self._index_to_position_strs = value
+
+    @classmethod
+    def load_results(cls, saliency_algorithm: Callable[[str], Dict[str, int]], name: str, store: ResultStore | None = None):
+        """
+        Loads the latest run of `name` from the result store, falling back to
+        the legacy `output/{name}.pkl`. The results stay column views of the
+        store, no `ResultRow` is built (`results` is empty).
+        """
+        store = store if store is not None else ResultStore()
+        rows = store.select(algorithm=name, run=-1)
+        if len(rows) == 0:
+            return cls._load_pickle(saliency_algorithm, name)
+
+        instance = cls(saliency_algorithm)
+        instance.name = name
+        instance.fens = store.column("fen")[rows]
+        instance.saliency = store.column("saliency")[rows]
+        instance.ground_truth = store.column("ground_truth")[rows]
+
+        # the aligned arrays of `get_aligned_arrays` for every puzzle at once, squares in chess square order
+        scaled, instance._union_squares, truth_squares = scale_saliency(instance.saliency, instance.ground_truth)
+        instance.ground_truth_array = truth_squares[instance._union_squares].astype(int)
+        instance.predicted_values_array = scaled[instance._union_squares]
+        instance.index_to_position_strs = None
+
+        return instance
+
     @classmethod
-    def load_results(cls, saliency_algorithm: Callable[[str], Dict[str, int]], name: str):
+    def _load_pickle(cls, saliency_algorithm: Callable[[str], Dict[str, int]], name: str):
         with open(f"output/{name}.pkl", "rb") as f:
             loaded_data = pickle.load(f)
 
@@ -34,23 +81,25 @@ class SarfaBenchmark:
         return instance
 
     @classmethod
-    def run(cls, saliency_algorithm: Callable[[str], Dict[str, int]], name: str, sanity_check = False):
+    def run(cls, saliency_algorithm: Callable[[str], Dict[str, int]], name: str, sanity_check = False, store: ResultStore | None = None, config: Dict[str, Any] | None = None):
+        """
+        Runs the benchmark and appends the saliency maps to the result store
+        as a new run of `name` (`config` records e.g. the engine runtime)
+        """
         instance = cls(saliency_algorithm)
+        instance.name = name + ".sanity" if sanity_check else name
 
         instance._run_test(sanity_check=sanity_check)
 
         # save the generated values
-        # Save to file
-        if sanity_check:
-            name += ".sanity"
-        with open(f"output/{name}.pkl", "wb") as f:
-            pickle.dump(
-                (instance.predicted_values_array, instance.ground_truth_array, instance.index_to_position_strs)
-                , f)
+        for result in instance.results:
+            result.config = config or {}
+        store = store if store is not None else ResultStore()
+        store.append(instance.results)
 
         return instance
 
-    def _run_test(self, sanity_check=False):
+    def _run_test(self, sanity_check=False, max_puzzles=None, verbose=True):
         """
         Takes the saliency_algorithm and runs it on the test dataset 
         """
@@ -59,25 +108,29 @@ class SarfaBenchmark:
             # print(i)
             if sanity_check and i == 5:
                 break
+            if max_puzzles is not None and i == max_puzzles:
+                break
 
-            if (i + 1) % 10 == 0:
+            if verbose and (i + 1) % 10 == 0:
                 print(i)
 
             fen = self.dataset.get_fen(i)
-            print(fen)
+            if verbose:
+                print(fen)
 
             # use the ground truth action provided from the dataset
-            board = chess.Board(fen)
-            action_ground_truth: chess.Move = board.parse_san(self.dataset.get_solution(i)[0])
+            action_ground_truth: chess.Move = self.dataset.root_move(i)
 
-            saliency_predicted: Dict[str, float] = self.saliency_algorithm(fen, action_ground_truth)
+            with profiling.tags(fen=fen, algorithm=self.name):
+                saliency_predicted: Dict[str, float] = self.saliency_algorithm(fen, action_ground_truth)
 
             saliency_ground_truths: List[str] = self.dataset.get_saliency_ground_truth(i)
 
             # Sanity check
             for pos in saliency_ground_truths:
                 if pos not in saliency_predicted:
-                    print(f"There is a saliency value that exists in the dataset ground truth which wasn't tested by the  algorithm: \n {fen} with pos: {pos}")
+                    if verbose:
+                        print(f"There is a saliency value that exists in the dataset ground truth which wasn't tested by the  algorithm: \n {fen} with pos: {pos}")
                     continue
             
             ground_truth_array, predicted_values_array, index_to_position_str = self.get_aligned_arrays(saliency_ground_truths, saliency_predicted)
@@ -85,6 +138,12 @@ class SarfaBenchmark:
             self.ground_truth_array = np.concatenate((self.ground_truth_array, ground_truth_array))
             self.predicted_values_array = np.concatenate((self.predicted_values_array, predicted_values_array))
             self.index_to_position_strs.append(index_to_position_str)
+            self.results.append(ResultRow(algorithm=self.name, fen=fen, saliency=saliency_predicted, action=action_ground_truth, puzzle=i, ground_truth=saliency_ground_truths))
+
+        if self.results:
+            self.fens = np.array([result.fen.encode() for result in self.results], dtype=COLUMNS["fen"][0])
+            self.saliency = np.stack([saliency_row(result.saliency) for result in self.results])
+            self.ground_truth = np.array([squares_mask(result.ground_truth) for result in self.results], dtype=COLUMNS["ground_truth"][0])
 
     
 
@@ -144,6 +203,12 @@ class SarfaBenchmark:
 
 
     
+    def bitmask_metrics(self, threshold: float = 0.5) -> dict[str, float | None]:
+        """
+        accuracy, auc, precision, recall and f1 of the results, see `chess_dataset.compiled.bitmask_metrics`
+        """
+        return bitmask_metrics(self.saliency, self.ground_truth, threshold)
+
     def roc_curve(self) -> tuple[np.array, np.array]:
         fpr, tpr, thresholds = roc_curve(self.ground_truth_array, self.predicted_values_array)
 
@@ -0,0 +1,275 @@
+"""
+Precompiled binary form of the puzzle dataset.
+
+`compile_dataset` parses the JSON dataset once. Each puzzle becomes a
+fixed-size record: the FEN, the root (first solution) move as a packed
+uint16, the ground-truth squares as a uint64 bitboard and the whole line as
+packed moves. The solution and response moves alternate in the line,
+solution moves are the even plies. The file is a 64-byte header followed by
+the records and loads with one `np.memmap`, without parsing any SAN.
+
+The file is only written by the explicit compile step below.
+`load_compiled_dataset` maps it when it is up to date and otherwise compiles
+the records in memory, so loading never writes into the working tree.
+
+```python
+dataset = load_compiled_dataset() # the compiled file, or the JSON compiled in memory
+dataset.root_move(0), dataset.ground_truth[0]
+metrics = bitmask_metrics(predicted, dataset.ground_truth) # predicted: (n, 64), NaN where not evaluated
+```
+
+```bash
+python -m chess_dataset.compiled chess_dataset/chess_saliency_dataset_v1.json --output output/chess_saliency_dataset_v1.bin
+```
+"""
+
+import argparse
+import json
+import os
+import struct
+
+import chess
+import numpy as np
+
+from .result_store import FEN_BYTES, NO_ACTION, mask_squares, pack_action, squares_mask, unpack_action
+
+MAGIC = b"SARFADS1"
+HEADER = struct.Struct("<8sIII") # magic, format version, puzzles, longest line
+HEADER_BYTES = 64
+FORMAT_VERSION = 1
+DATASET_JSON = "chess_dataset/chess_saliency_dataset_v1.json"
+COMPILED_PATH = "output/chess_saliency_dataset_v1.bin"
+
+def record_dtype(max_plies: int) -> np.dtype:
+    return np.dtype([
+        ("fen", f"S{FEN_BYTES}"),
+        ("root_move", "<u2"),
+        ("ground_truth", "<u8"),
+        ("solution_plies", "u1"),
+        ("line_plies", "u1"),
+        ("line", "<u2", (max_plies,)),
+    ])
+
+def _line(fen: str, solution: list[str], responses: list[str]) -> list[chess.Move]:
+    """
+    Solution and response moves interleaved and parsed from SAN
+    """
+    board = chess.Board(fen)
+    moves = []
+    for ply in range(max(len(solution), len(responses)) * 2):
+        sans = solution if ply % 2 == 0 else responses
+        if ply // 2 >= len(sans):
+            break
+        moves.append(board.push_san(sans[ply // 2]))
+    return moves
+
+def compile_records(json_path: str = DATASET_JSON) -> np.ndarray:
+    """
+    The records of every puzzle of the JSON dataset, dtype `record_dtype(longest line)`
+    """
+    with open(json_path) as f:
+        puzzles = json.load(f).get("puzzles", [])
+
+    lines = [_line(puzzle["fen"], puzzle.get("solution", []), puzzle.get("responseMoves", [])) for puzzle in puzzles]
+    max_plies = max((len(line) for line in lines), default=0)
+    records = np.zeros(len(puzzles), dtype=record_dtype(max_plies))
+    for record, puzzle, line in zip(records, puzzles, lines):
+        record["fen"] = puzzle["fen"].encode()
+        record["root_move"] = pack_action(line[0]) if line else NO_ACTION
+        record["ground_truth"] = squares_mask(puzzle.get("saliencyGroundTruth", []))
+        record["solution_plies"] = len(puzzle.get("solution", []))
+        record["line_plies"] = len(line)
+        record["line"][:len(line)] = [pack_action(move) for move in line]
+    return records
+
+def compile_dataset(json_path: str = DATASET_JSON, output_path: str = COMPILED_PATH) -> str:
+    records = compile_records(json_path)
+    max_plies = records.dtype["line"].shape[0]
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(records), max_plies).ljust(HEADER_BYTES, b"\0"))
+        f.write(records.tobytes())
+    os.replace(output_path + ".tmp", output_path)
+    return output_path
+
+class CompiledDataset:
+    """
+    Memory-mapped compiled dataset with the accessors of `ChessPuzzleDataset`
+    """
+
+    def __init__(self, path: str | None = COMPILED_PATH, records: np.ndarray | None = None):
+        """
+        Maps the compiled file at `path`, or wraps `records` already in memory (see `compile_records`)
+        """
+        if records is not None:
+            self.path = None
+            self.length = len(records)
+            self.records = records
+            return
+
+        with open(path, "rb") as f:
+            magic, version, count, max_plies = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a compiled dataset of version {FORMAT_VERSION}")
+        self.path = path
+        self.length = count
+        self.records = np.memmap(path, dtype=record_dtype(max_plies), mode="r", offset=HEADER_BYTES, shape=(count,)) if count else np.zeros(0, dtype=record_dtype(max_plies))
+
+    @property
+    def ground_truth(self) -> np.ndarray:
+        """
+        (n,) uint64 ground-truth bitboards
+        """
+        return self.records["ground_truth"]
+
+    @property
+    def root_moves(self) -> np.ndarray:
+        """
+        (n,) packed root moves, see `chess_dataset.result_store.pack_action`
+        """
+        return self.records["root_move"]
+
+    def _check(self, index: int):
+        if index < 0 or index >= self.length:
+            raise IndexError("Puzzle index out of range.")
+
+    def get_fen(self, index: int) -> str:
+        self._check(index)
+        return self.records["fen"][index].decode()
+
+    def root_move(self, index: int) -> chess.Move | None:
+        self._check(index)
+        return unpack_action(self.records["root_move"][index])
+
+    def line(self, index: int) -> list[chess.Move]:
+        self._check(index)
+        record = self.records[index]
+        return [unpack_action(packed) for packed in record["line"][:record["line_plies"]]]
+
+    def _line_sans(self, index: int) -> list[str]:
+        board = chess.Board(self.get_fen(index))
+        sans = []
+        for move in self.line(index):
+            sans.append(board.san(move))
+            board.push(move)
+        return sans
+
+    def get_solution(self, index: int) -> list[str]:
+        return self._line_sans(index)[0::2][:int(self.records["solution_plies"][index])]
+
+    def get_response_moves(self, index: int) -> list[str]:
+        return self._line_sans(index)[1::2]
+
+    def get_saliency_ground_truth(self, index: int) -> list[str]:
+        self._check(index)
+        return mask_squares(self.records["ground_truth"][index])
+
+    def get_puzzle(self, index: int) -> dict:
+        return {
+            "fen": self.get_fen(index),
+            "responseMoves": self.get_response_moves(index),
+            "saliencyGroundTruth": self.get_saliency_ground_truth(index),
+            "solution": self.get_solution(index),
+        }
+
+    def get_all_puzzles(self) -> list[dict]:
+        return [self.get_puzzle(index) for index in range(self.length)]
+
+    def __len__(self) -> int:
+        return self.length
+
+def load_compiled_dataset(prefix: str = "./", path: str = COMPILED_PATH) -> CompiledDataset:
+    """
+    The compiled file when it exists and is newer than the JSON, otherwise
+    the JSON compiled in memory. Nothing is written, `python -m chess_dataset.compiled` writes the file.
+    """
+    json_path = prefix + DATASET_JSON
+    if os.path.exists(path) and not (os.path.exists(json_path) and os.path.getmtime(json_path) > os.path.getmtime(path)):
+        return CompiledDataset(path)
+    return CompiledDataset(records=compile_records(json_path))
+
+def unpack_masks(masks: np.ndarray) -> np.ndarray:
+    """
+    (n,) uint64 bitboards -> (n, 64) bool indexed by chess square
+    """
+    masks = np.ascontiguousarray(masks, dtype="<u8")
+    return np.unpackbits(masks.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little").astype(bool)
+
+def pack_masks(squares: np.ndarray) -> np.ndarray:
+    """
+    (n, 64) bool indexed by chess square -> (n,) uint64 bitboards
+    """
+    return np.packbits(np.asarray(squares, dtype=bool), axis=1, bitorder="little").view("<u8").reshape(-1)
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    return unpack_masks(masks).sum(axis=1)
+
+def scale_saliency(predicted: np.ndarray, ground_truth: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Saliency maps as `SarfaBenchmark` scores them: min-max scaled per puzzle
+    over the union of evaluated and ground-truth squares, 0 where only the
+    ground truth has a square
+
+    Returns (n, 64) scaled values (NaN outside the union), union and ground truth squares
+    """
+    predicted = np.asarray(predicted, dtype=np.float64)
+    union_squares = ~np.isnan(predicted) | unpack_masks(ground_truth)
+    values = np.where(union_squares, np.nan_to_num(predicted), np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        low = np.nanmin(values, axis=1, keepdims=True)
+        high = np.nanmax(values, axis=1, keepdims=True)
+        scaled = (values - low) / (high - low)
+    return scaled, union_squares, unpack_masks(ground_truth)
+
+def bitmask_metrics(predicted: np.ndarray, ground_truth: np.ndarray, threshold: float = 0.5) -> dict[str, float | None]:
+    """
+    Metrics of (n, 64) saliency maps (NaN where a square wasn't evaluated)
+    against (n,) ground-truth bitboards.
+
+    accuracy and auc follow `SarfaBenchmark`: the union of evaluated and
+    ground-truth squares, min-max scaled per puzzle. precision, recall and
+    f1 count the squares scaled to at least `threshold` with popcounts of
+    bitboard intersections.
+    """
+    from sklearn.metrics import roc_auc_score
+
+    ground_truth = np.asarray(ground_truth, dtype="<u8")
+    scaled, union_squares, truth_squares = scale_saliency(predicted, ground_truth)
+    union = pack_masks(union_squares)
+
+    # a constant map scales to NaN (SarfaBenchmark propagates it), here it counts as fully wrong
+    error = np.abs(scaled - truth_squares)[union_squares]
+    accuracy = float(1 - np.nan_to_num(error, nan=1.0).mean()) if error.size else None
+
+    labels, scores = truth_squares[union_squares], scaled[union_squares]
+    finite = ~np.isnan(scores)
+    auc = float(roc_auc_score(labels[finite], scores[finite])) if finite.any() and 0 < labels[finite].sum() < finite.sum() else None
+
+    selected = pack_masks(np.nan_to_num(scaled) >= threshold) & union
+    true_positives = popcount(selected & ground_truth).sum()
+    selected_count = popcount(selected).sum()
+    truth_count = popcount(ground_truth).sum()
+    precision = true_positives / selected_count if selected_count else None
+    recall = true_positives / truth_count if truth_count else None
+    f1 = 2 * precision * recall / (precision + recall) if precision and recall else None
+    return {
+        "accuracy": accuracy,
+        "auc": auc,
+        "precision": None if precision is None else float(precision),
+        "recall": None if recall is None else float(recall),
+        "f1": None if f1 is None else float(f1),
+    }
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Compile a puzzle dataset into the memory-mappable binary format")
+    parser.add_argument("dataset", nargs="?", default=DATASET_JSON)
+    parser.add_argument("--output", default=COMPILED_PATH)
+    args = parser.parse_args(argv)
+
+    path = compile_dataset(args.dataset, args.output)
+    dataset = CompiledDataset(path)
+    print(f"compiled {len(dataset)} puzzles ({os.path.getsize(path)} bytes) to {path}")
+
+if __name__ == "__main__":
+    main()
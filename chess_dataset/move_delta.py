@@ -0,0 +1,37 @@
+"""
+Validates `sarfa.move_delta.MoveDelta` against full legal move generation
+for every registered perturber over the dataset and `test_fens/`.
+
+```bash
+python -m chess_dataset.move_delta --perturbers removal file_mask
+```
+"""
+
+import argparse
+import glob
+
+from sarfa.move_delta import validate
+from sarfa.utils import read_fens
+
+from .dataset import load_dataset
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Validate incremental common actions against full legal move generation")
+    parser.add_argument("--perturbers", nargs="*", help="registered perturber names, all by default")
+    args = parser.parse_args(argv)
+
+    dataset = load_dataset()
+    fens = [dataset.get_fen(i) for i in range(len(dataset))]
+    for path in sorted(glob.glob("test_fens/*.txt")):
+        fens.extend(read_fens(path))
+    stats = validate(fens, args.perturbers)
+    print(
+        f"{stats['boards']} perturbed boards, {stats['mismatches']} mismatches, "
+        f"{stats['rechecked']:.1%} regenerated in part, "
+        f"delta {stats['delta_seconds'] * 1e6 / max(stats['boards'], 1):.1f}us vs full {stats['full_seconds'] * 1e6 / max(stats['boards'], 1):.1f}us per board"
+    )
+    if stats["mismatches"]:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Reproducible performance benchmark for the saliency algorithms.
+
+Every algorithm runs over the dataset and the FEN files in `test_fens/`
+with a fixed node limit per search, recording cost (engine calls,
+engine-seconds, wall-clock, peak RSS) next to the explanation quality
+(accuracy, ROC AUC) on the dataset. The import time of the headless
+compute path is measured as well and any plotting module it pulls in
+counts as a regression. Results are written as JSON and can be checked
+against a previous run.
+
+```bash
+# CI-speed run with the deterministic fake engine
+python -m chess_dataset.perf --engine fake --output output/perf/baseline.json
+
+# later: compare against the stored baseline, exits with 1 on a regression
+python -m chess_dataset.perf --engine fake --compare output/perf/baseline.json
+```
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable
+
+import chess
+import chess.engine
+from sklearn.metrics import auc
+
+from sarfa import profiling
+from sarfa.adaptive import adaptive_sarfa_saliency
+from sarfa.algorithms import sarfa_baseline_saliency, empty_spaces_saliency, offense_defense_saliency, sequential_saliency, pairs_important_groups
+from sarfa.engine import make_engine, resolve_engine_spec
+from sarfa.tablebase import TablebaseEngine
+from sarfa.utils import read_fens
+
+from .benchmark import SarfaBenchmark
+
+DEFAULT_NODES = 20_000
+# fixed UCI options, a single thread keeps node-limited searches deterministic
+# (the calibrated layout of `sarfa.tuning` is not used)
+ENGINE_OPTIONS = {"Threads": 1, "Hash": 16}
+FEN_FILES = "test_fens/*.txt"
+
+# relative increase (or absolute drop for quality metrics) allowed before a run counts as a regression
+DEFAULT_TOLERANCES = {
+    "engine_calls": 0.0,
+    "engine_seconds": 0.25,
+    "wall_seconds": 0.25,
+    "peak_rss_mb": 0.25,
+    "import_seconds": 0.5,
+    "accuracy": 0.01,
+    "auc": 0.01,
+}
+QUALITY_METRICS = ("accuracy", "auc")
+
+# modules the headless compute path (Engine, perturbers, SarfaBaseline) must not import
+PLOTTING_MODULES = ("cv2", "cairosvg", "matplotlib", "PIL", "networkx")
+IMPORT_CHECK = """
+import json, sys, time
+start = time.perf_counter()
+from sarfa import Engine, RemovalPerturber, SarfaBaseline
+seconds = time.perf_counter() - start
+loaded = sorted(name for name in {modules!r} if name in sys.modules)
+print(json.dumps({{"import_seconds": seconds, "plotting_modules": loaded}}))
+"""
+
+def _baseline(engine, fen, action, limit) -> dict[str, float]:
+    return sarfa_baseline_saliency(engine, fen, action, limit=limit)
+
+def _add_pawn(engine, fen, action, limit) -> dict[str, float]:
+    return empty_spaces_saliency(engine, fen, action, limit=limit)[0]
+
+def _adaptive(engine, fen, action, limit) -> dict[str, float]:
+    # same full budget as the uniform baseline, capped at half of its total. It requests
+    # about 40% of the nodes on the dataset for about 1.5x the engine calls, so with the
+    # fake engine, whose calls cost the same at any budget, it is slower
+    return adaptive_sarfa_saliency(engine, fen, action, limit=limit, budget_fraction=0.5).saliency
+
+def _offense_defense(engine, fen, action, limit) -> dict[str, float]:
+    saliency_results, _ = offense_defense_saliency(engine, fen, action, limit=limit)
+    return {position: saliency for position, (_, saliency) in saliency_results.items()}
+
+def _sequential(engine, fen, action, limit) -> dict[str, float]:
+    # sequential SARFA follows its own principal line, the action is ignored like in the notebook
+    return sequential_saliency(engine, fen, limit=limit)[0]
+
+def _pairs(engine, fen, action, limit) -> dict[str, float]:
+    important_groups, _ = pairs_important_groups(engine, fen, limit=limit)
+    return {position: 1.0 for group in important_groups or [] for position in group}
+
+# every algorithm maps (engine, fen, action, limit) to a saliency map
+ALGORITHMS: dict[str, Callable[[Any, str, chess.Move | None, chess.engine.Limit], dict[str, float]]] = {
+    "baseline": _baseline,
+    "adaptive": _adaptive,
+    "add_pawn": _add_pawn,
+    "offense_defense": _offense_defense,
+    "sequential": _sequential,
+    "pairs": _pairs,
+}
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+def _finite(value: float) -> float | None:
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+def _cost(profiler: profiling.Profiler, source: str, wall_seconds: float, fens: int) -> dict[str, Any]:
+    engine_stats = profiler.aggregate(("source",)).get(source, {}).get("engine.q_values", {})
+    return {
+        "fens": fens,
+        "engine_calls": engine_stats.get("count", 0),
+        "engine_seconds": engine_stats.get("search_time", 0.0),
+        "engine_nodes": engine_stats.get("nodes", 0),
+        "wall_seconds": wall_seconds,
+    }
+
+def measure_import() -> dict[str, Any]:
+    """
+    Imports the compute path in a fresh interpreter and returns the import
+    time and the plotting modules it pulled in (should be none)
+    """
+    script = IMPORT_CHECK.format(modules=PLOTTING_MODULES)
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def run_algorithm(name: str, engine_spec: str = "auto", nodes: int = DEFAULT_NODES, max_puzzles: int | None = None, fen_files: list[str] | None = None, syzygy_path: str | None = None) -> dict[str, Any]:
+    """
+    Runs one algorithm over the dataset and the FEN files and returns its cost and quality metrics
+    """
+    fen_files = sorted(glob.glob(FEN_FILES)) if fen_files is None else fen_files
+    engine = make_engine(engine_spec, ENGINE_OPTIONS)
+    tablebase = TablebaseEngine(syzygy_path, fallback=engine) if syzygy_path else None
+
+    try:
+        results = _run_algorithm(tablebase or engine, name, nodes, max_puzzles, fen_files)
+    finally:
+        engine.close()
+        if tablebase:
+            tablebase.close()
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+def _run_algorithm(engine, name: str, nodes: int, max_puzzles: int | None, fen_files: list[str]) -> dict[str, Any]:
+    limit = chess.engine.Limit(nodes=nodes)
+    algorithm = ALGORITHMS[name]
+
+    results: dict[str, Any] = {}
+    with profiling.Profiler() as profiler:
+        benchmark = SarfaBenchmark(lambda fen, action=None: algorithm(engine, fen, action, limit))
+        benchmark.name = name
+        start = time.perf_counter()
+        with profiling.tags(source="dataset"):
+            benchmark._run_test(max_puzzles=max_puzzles, verbose=False)
+        fens = len(benchmark.index_to_position_strs)
+        results["dataset"] = _cost(profiler, "dataset", time.perf_counter() - start, fens)
+
+        fpr, tpr = benchmark.roc_curve()
+        results["dataset"]["accuracy"] = _finite(benchmark.accuracy())
+        results["dataset"]["auc"] = _finite(auc(fpr, tpr))
+
+        for path in fen_files:
+            source = os.path.basename(path)
+            fens = read_fens(path)
+            start = time.perf_counter()
+            with profiling.tags(source=source, algorithm=name):
+                for fen in fens:
+                    with profiling.tags(fen=fen):
+                        algorithm(engine, fen, None, limit)
+            results[source] = _cost(profiler, source, time.perf_counter() - start, len(fens))
+
+    return results
+
+def run_suite(algorithms: list[str] | None = None, engine_spec: str = "auto", nodes: int = DEFAULT_NODES, max_puzzles: int | None = None, fen_files: list[str] | None = None, isolate: bool = True, syzygy_path: str | None = None) -> dict[str, Any]:
+    """
+    Runs the algorithms one after the other. With `isolate` every algorithm
+    runs in a fresh process so the peak RSS is its own.
+    """
+    algorithms = list(ALGORITHMS) if algorithms is None else algorithms
+    resolved_engine = resolve_engine_spec(engine_spec)
+
+    report: dict[str, Any] = {
+        "config": {
+            "engine": resolved_engine,
+            "engine_options": None if resolved_engine == "fake" else ENGINE_OPTIONS,
+            "nodes": nodes,
+            "syzygy": syzygy_path,
+            "max_puzzles": max_puzzles,
+            "fen_files": sorted(glob.glob(FEN_FILES)) if fen_files is None else fen_files,
+            "python": platform.python_version(),
+            "chess": chess.__version__,
+            "machine": platform.machine(),
+        },
+        "import": measure_import(),
+        "algorithms": {},
+    }
+
+    for name in algorithms:
+        args = (name, resolved_engine, nodes, max_puzzles, fen_files, syzygy_path)
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                report["algorithms"][name] = executor.submit(run_algorithm, *args).result()
+        else:
+            report["algorithms"][name] = run_algorithm(*args)
+
+    return report
+
+def compare(report: dict[str, Any], baseline: dict[str, Any], tolerances: dict[str, float] | None = None) -> list[str]:
+    """
+    Returns a description of every metric that regressed against the baseline.
+    Cost metrics regress when they grow by more than the relative tolerance,
+    quality metrics when they drop by more than the absolute tolerance.
+    """
+    tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+    regressions = []
+
+    import_stats = report.get("import", {})
+    if import_stats.get("plotting_modules"):
+        regressions.append(f"import: compute path loads {', '.join(import_stats['plotting_modules'])}")
+    previous_import = baseline.get("import", {}).get("import_seconds")
+    if previous_import is not None and import_stats.get("import_seconds", 0.0) > previous_import * (1 + tolerances["import_seconds"]):
+        regressions.append(f"import: import_seconds {previous_import:.4g} -> {import_stats['import_seconds']:.4g}")
+
+    for name, results in report["algorithms"].items():
+        baseline_results = baseline.get("algorithms", {}).get(name)
+        if baseline_results is None:
+            continue
+
+        for source, metrics in results.items():
+            baseline_metrics = baseline_results.get(source)
+            if not isinstance(metrics, dict):
+                metrics, baseline_metrics = {source: metrics}, {source: baseline_metrics}
+            if baseline_metrics is None:
+                continue
+
+            for metric, tolerance in tolerances.items():
+                current, previous = metrics.get(metric), baseline_metrics.get(metric)
+                if current is None or previous is None:
+                    continue
+                if metric in QUALITY_METRICS:
+                    regressed = current < previous - tolerance
+                else:
+                    regressed = current > previous * (1 + tolerance)
+                if regressed:
+                    regressions.append(f"{name}/{source}: {metric} {previous:.4g} -> {current:.4g}")
+
+    return regressions
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Performance benchmark for the saliency algorithms")
+    parser.add_argument("--engine", default="auto", help='"fake", "fake-uci", "auto" (Stockfish if found, else fake) or a path to a UCI engine')
+    parser.add_argument("--nodes", type=int, default=DEFAULT_NODES, help="node limit per engine search")
+    parser.add_argument("--algorithms", nargs="+", choices=list(ALGORITHMS), default=list(ALGORITHMS))
+    parser.add_argument("--max-puzzles", type=int, default=None, help="only run the first N dataset puzzles")
+    parser.add_argument("--fen-files", nargs="*", default=None, help=f"defaults to {FEN_FILES}")
+    parser.add_argument("--syzygy", default=None, help="Syzygy tablebase directory answering endgame positions before the engine")
+    parser.add_argument("--no-isolate", action="store_true", help="run every algorithm in this process")
+    parser.add_argument("--output", default="output/perf/latest.json")
+    parser.add_argument("--compare", default=None, help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", nargs="*", default=[], metavar="METRIC=VALUE", help="override regression tolerances, e.g. wall_seconds=0.5")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.algorithms, args.engine, args.nodes, args.max_puzzles, args.fen_files, isolate=not args.no_isolate, syzygy_path=args.syzygy)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        tolerances = {metric: float(value) for metric, value in (item.split("=") for item in args.tolerance)}
+        regressions = compare(report, baseline, tolerances)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print("no regressions")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
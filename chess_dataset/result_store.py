@@ -0,0 +1,259 @@
+"""
+Columnar store for saliency results.
+
+Every explanation is one row: a 64-wide float32 saliency map (NaN for
+squares the algorithm did not evaluate) next to the FEN, its Zobrist hash,
+the explained action, algorithm, config, run, puzzle index and ground-truth
+squares. Each column is a raw little-endian file that is memory-mapped on
+read, `index.json` holds the row count, the column layout and the interned
+algorithm/config names. Loading is zero-copy and filtering only touches
+the columns it needs.
+
+```python
+store = ResultStore("output/results")
+store.append([ResultRow(algorithm="sarfa_baseline_20", fen=fen, saliency=saliency_map, action=move)])
+
+rows = store.select(algorithm="sarfa_baseline_20")
+saliency = store.column("saliency")[rows] # (n, 64) float32
+```
+
+Rows are only visible once `index.json` has been rewritten, so readers in
+other processes never see a half written append. Appends take an exclusive
+lock on the store.
+"""
+
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Generator, Iterable
+
+import chess
+import numpy as np
+
+from sarfa.perturbation_handler import position_hash
+
+FORMAT_VERSION = 1
+INDEX_FILE = "index.json"
+LOCK_FILE = ".lock"
+FEN_BYTES = 96 # longest legal FEN is well below 96 characters
+NO_ACTION = 0xFFFF
+NO_PUZZLE = -1
+
+# name: (dtype, shape of one row)
+COLUMNS: dict[str, tuple[str, tuple[int, ...]]] = {
+    "saliency": ("<f4", (64,)),
+    "fen_hash": ("<u8", ()),
+    "fen": (f"S{FEN_BYTES}", ()),
+    "action": ("<u2", ()),
+    "algorithm": ("<u2", ()),
+    "config": ("<u2", ()),
+    "run": ("<u4", ()),
+    "puzzle": ("<i4", ()),
+    "ground_truth": ("<u8", ()), # bitboard of the ground-truth squares
+}
+
+@dataclass()
+class ResultRow:
+    algorithm: str
+    fen: str
+    saliency: dict[str, float]
+    action: chess.Move | None = None
+    config: dict[str, Any] = field(default_factory=dict)
+    puzzle: int = NO_PUZZLE
+    ground_truth: list[str] = field(default_factory=list)
+
+def pack_action(action: chess.Move | None) -> int:
+    """
+    from square (6 bits) | to square (6 bits) | promotion piece type (3 bits)
+    """
+    if action is None:
+        return NO_ACTION
+    return action.from_square | action.to_square << 6 | (action.promotion or 0) << 12
+
+def unpack_action(packed: int) -> chess.Move | None:
+    packed = int(packed)
+    if packed == NO_ACTION:
+        return None
+    return chess.Move(packed & 0x3F, packed >> 6 & 0x3F, (packed >> 12) or None)
+
+def saliency_row(saliency: dict[str, float]) -> np.ndarray:
+    row = np.full(64, np.nan, dtype=np.float32)
+    for position_str, value in saliency.items():
+        row[chess.parse_square(position_str)] = value
+    return row
+
+def squares_mask(position_strs: Iterable[str]) -> int:
+    mask = 0
+    for position_str in position_strs:
+        mask |= chess.BB_SQUARES[chess.parse_square(position_str)]
+    return mask
+
+def mask_squares(mask: int) -> list[str]:
+    return [chess.square_name(square) for square in chess.scan_forward(int(mask))]
+
+def _config_key(config: dict[str, Any]) -> str:
+    return json.dumps(config, sort_keys=True, default=str)
+
+class ResultStore:
+    def __init__(self, path: str = "output/results"):
+        self.path = path
+        self._columns: dict[str, np.ndarray] = {}
+        self.refresh()
+
+    def refresh(self):
+        """
+        Re-reads the index to pick up rows appended by other processes
+        """
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+            if self.index["version"] != FORMAT_VERSION:
+                raise ValueError(f"unsupported result store version {self.index['version']} in {self.path}")
+        else:
+            self.index = {
+                "version": FORMAT_VERSION,
+                "rows": 0,
+                "runs": 0,
+                "columns": {name: {"dtype": dtype, "shape": list(shape)} for name, (dtype, shape) in COLUMNS.items()},
+                "algorithms": [],
+                "configs": [],
+            }
+        self._columns = {}
+
+    def __len__(self) -> int:
+        return self.index["rows"]
+
+    @property
+    def algorithms(self) -> list[str]:
+        return list(self.index["algorithms"])
+
+    def configs(self) -> list[dict[str, Any]]:
+        return [json.loads(config) for config in self.index["configs"]]
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Read-only memory map of a column, shape (rows, *row shape)
+        """
+        if name not in self._columns:
+            dtype, shape = COLUMNS[name]
+            rows = len(self)
+            if rows == 0:
+                self._columns[name] = np.empty((0, *shape), dtype=dtype)
+            else:
+                self._columns[name] = np.memmap(self._column_path(name), dtype=dtype, mode="r", shape=(rows, *shape))
+        return self._columns[name]
+
+    def algorithm_id(self, algorithm: str) -> int | None:
+        algorithms = self.index["algorithms"]
+        return algorithms.index(algorithm) if algorithm in algorithms else None
+
+    def config_id(self, config: dict[str, Any]) -> int | None:
+        configs = self.index["configs"]
+        key = _config_key(config)
+        return configs.index(key) if key in configs else None
+
+    def select(self, algorithm: str | None = None, config: dict[str, Any] | None = None, puzzles: Iterable[int] | None = None, run: int | None = None) -> np.ndarray:
+        """
+        Row indices matching every given filter, in insertion order.
+        `run=-1` selects the latest run of the matching rows.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if algorithm is not None:
+            algorithm_id = self.algorithm_id(algorithm)
+            if algorithm_id is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.column("algorithm") == algorithm_id
+        if config is not None:
+            config_id = self.config_id(config)
+            if config_id is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.column("config") == config_id
+        if puzzles is not None:
+            mask &= np.isin(self.column("puzzle"), np.fromiter(puzzles, dtype=np.int32))
+        if run is not None:
+            runs = self.column("run")
+            if run == -1:
+                if not mask.any():
+                    return np.empty(0, dtype=np.int64)
+                run = runs[mask].max()
+            mask &= runs == run
+        return np.flatnonzero(mask)
+
+    def row(self, index: int) -> ResultRow:
+        saliency = self.column("saliency")[index]
+        return ResultRow(
+            algorithm=self.index["algorithms"][self.column("algorithm")[index]],
+            fen=self.column("fen")[index].decode(),
+            saliency={chess.square_name(square): float(saliency[square]) for square in np.flatnonzero(~np.isnan(saliency))},
+            action=unpack_action(self.column("action")[index]),
+            config=json.loads(self.index["configs"][self.column("config")[index]]),
+            puzzle=int(self.column("puzzle")[index]),
+            ground_truth=mask_squares(self.column("ground_truth")[index]),
+        )
+
+    @contextmanager
+    def _locked(self) -> Generator[None, None, None]:
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def append(self, rows: Iterable[ResultRow]) -> int:
+        """
+        Appends the rows as one run and returns the run id
+        """
+        rows = list(rows)
+        with self._locked():
+            self.refresh()
+            index = self.index
+            run = index["runs"]
+
+            algorithm_ids, config_ids = [], []
+            for row in rows:
+                if row.algorithm not in index["algorithms"]:
+                    index["algorithms"].append(row.algorithm)
+                algorithm_ids.append(index["algorithms"].index(row.algorithm))
+                config_key = _config_key(row.config)
+                if config_key not in index["configs"]:
+                    index["configs"].append(config_key)
+                config_ids.append(index["configs"].index(config_key))
+
+            columns = {
+                "saliency": np.stack([saliency_row(row.saliency) for row in rows]) if rows else np.empty((0, 64)),
+                "fen_hash": [position_hash(chess.Board(row.fen)) for row in rows],
+                "fen": [row.fen.encode() for row in rows],
+                "action": [pack_action(row.action) for row in rows],
+                "algorithm": algorithm_ids,
+                "config": config_ids,
+                "run": [run] * len(rows),
+                "puzzle": [row.puzzle for row in rows],
+                "ground_truth": [squares_mask(row.ground_truth) for row in rows],
+            }
+            for name, values in columns.items():
+                dtype, shape = COLUMNS[name]
+                data = np.asarray(values, dtype=dtype).reshape(len(rows), *shape)
+                # write at the committed end so leftovers of an interrupted append get overwritten
+                offset = index["rows"] * data.dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+                with open(self._column_path(name), "r+b" if os.path.exists(self._column_path(name)) else "w+b") as f:
+                    f.seek(offset)
+                    f.write(data.tobytes())
+                    f.truncate()
+
+            index["rows"] += len(rows)
+            index["runs"] += 1
+            index_path = os.path.join(self.path, INDEX_FILE)
+            with open(index_path + ".tmp", "w") as f:
+                json.dump(index, f, indent=2)
+            os.replace(index_path + ".tmp", index_path)
+
+        self.refresh()
+        return run
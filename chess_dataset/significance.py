@@ -0,0 +1,270 @@
+"""
+Paired bootstrap comparison of stored saliency results.
+
+Puzzles explained by every compared result set are resampled with
+replacement. All sets share the same resamples, so the differences to the
+reference (the first set) are paired. Accuracy and ROC AUC follow
+`SarfaBenchmark` (union of evaluated and ground-truth squares, min-max
+scaled per puzzle) with every square weighted by how often its puzzle was
+drawn.
+
+Each resample is a vector of puzzle weights. Accuracy is a ratio of two dot
+products with the per-puzzle error sums and square counts. For AUC the
+squares are flattened puzzle by puzzle (per-puzzle offsets), sorted once by
+score and reduced into sparse (puzzle x tied score) positive and negative
+counts, merging neighbouring groups that hold only positives or only
+negatives. The weighted AUC of a block of resamples is then a sparse product
+and a cumulative sum. Blocks of resamples run in a process pool, each block
+seeded by its position, so the result doesn't depend on the number of
+processes.
+
+```python
+comparison = compare_results(ResultStore(), ["sarfa_baseline", "sarfa_baseline.fast"], resamples=10000, processes=8)
+print(format_comparison(comparison))
+comparison.difference["auc"][1] # (low, high) of fast - baseline
+```
+
+```bash
+python -m chess_dataset.significance --store output/results --algorithms sarfa_baseline sarfa_baseline.fast --resamples 10000 --processes 8
+```
+"""
+
+import argparse
+import multiprocessing
+from dataclasses import dataclass, field
+from typing import Any, Sequence
+
+import numpy as np
+import scipy.sparse
+
+from .compiled import scale_saliency
+from .result_store import ResultStore
+
+METRICS = ("accuracy", "auc")
+# upper bound of the float64 cells of a resample block, about 64MB
+BLOCK_CELLS = 1 << 23
+
+@dataclass()
+class ResultSet:
+    name: str
+    fens: np.ndarray # (n,) bytes, one row per position
+    saliency: np.ndarray # (n, 64) NaN where not evaluated
+    ground_truth: np.ndarray # (n,) uint64 bitboards
+
+def load_result_set(store: ResultStore, algorithm: str, config: dict | None = None, run: int = -1, name: str | None = None) -> ResultSet:
+    """
+    A run of `algorithm` (the latest by default), the last row per position
+    """
+    rows = store.select(algorithm=algorithm, config=config, run=run)
+    if len(rows) == 0:
+        raise ValueError(f"No stored results for {algorithm!r}")
+    fens = np.asarray(store.column("fen")[rows])
+    # last occurrence of every FEN
+    _, last = np.unique(fens[::-1], return_index=True)
+    rows = np.sort(rows[len(rows) - 1 - last])
+    return ResultSet(
+        name=name or algorithm,
+        fens=np.asarray(store.column("fen")[rows]),
+        saliency=np.asarray(store.column("saliency")[rows], dtype=np.float64),
+        ground_truth=np.asarray(store.column("ground_truth")[rows]),
+    )
+
+def align(result_sets: Sequence[ResultSet]) -> list[ResultSet]:
+    """
+    The result sets restricted to their common positions, in the same order
+    """
+    common = result_sets[0].fens
+    for result_set in result_sets[1:]:
+        common = np.intersect1d(common, result_set.fens)
+    aligned = []
+    for result_set in result_sets:
+        order = np.argsort(result_set.fens)
+        rows = order[np.searchsorted(result_set.fens, common, sorter=order)]
+        aligned.append(ResultSet(result_set.name, common, result_set.saliency[rows], result_set.ground_truth[rows]))
+    return aligned
+
+class _Scores:
+    """
+    Per-puzzle accuracy terms and sparse AUC counts of one result set
+    """
+
+    def __init__(self, result_set: ResultSet):
+        scaled, union, truth = scale_saliency(result_set.saliency, result_set.ground_truth)
+        n = len(scaled)
+        # constant maps scale to NaN and count as fully wrong, like `bitmask_metrics`
+        error = np.where(union, np.nan_to_num(np.abs(scaled - truth), nan=1.0), 0.0)
+        self.error_sums = error.sum(axis=1)
+        self.counts = union.sum(axis=1).astype(np.float64)
+
+        # flat squares puzzle by puzzle, offsets[p]:offsets[p + 1] belong to puzzle p
+        scored = union & ~np.isnan(scaled)
+        self.offsets = np.concatenate([[0], np.cumsum(scored.sum(axis=1))])
+        scores, labels = scaled[scored], truth[scored]
+        puzzles = np.repeat(np.arange(n), np.diff(self.offsets))
+
+        _, groups = np.unique(scores, return_inverse=True)
+        groups = groups.reshape(-1)
+        # consecutive tie groups holding only positives (or only negatives) merge into one run,
+        # they share the negatives ranked below them. Groups with both stay on their own.
+        kind = np.bincount(groups, weights=labels, minlength=groups.max(initial=-1) + 1) > 0
+        kind = kind.astype(np.int8) + 2 * (np.bincount(groups, weights=~labels, minlength=len(kind)) > 0)
+        runs = np.cumsum(np.concatenate([[True], (kind[1:] != kind[:-1]) | (kind[1:] == 3)])) - 1
+        columns = runs[groups]
+        shape = (int(runs[-1]) + 1 if len(runs) else 0, n)
+        # (runs, puzzles): weighted counts of a resample block are one sparse product
+        # float32 counts are exact and halve the memory traffic of the product
+        self.positives = scipy.sparse.csr_matrix((np.ones(labels.sum(), dtype=np.float32), (columns[labels], puzzles[labels])), shape=shape)
+        self.negatives = scipy.sparse.csr_matrix((np.ones((~labels).sum(), dtype=np.float32), (columns[~labels], puzzles[~labels])), shape=shape)
+
+    @property
+    def runs(self) -> int:
+        return self.positives.shape[0]
+
+    def accuracy(self, weights: np.ndarray) -> np.ndarray:
+        """
+        weights: (puzzles, resamples) -> (resamples,)
+        """
+        return 1 - (self.error_sums @ weights) / (self.counts @ weights)
+
+    def auc(self, weights: np.ndarray) -> np.ndarray:
+        """
+        Weighted Mann-Whitney AUC, ties count half
+        """
+        weights = np.ascontiguousarray(weights, dtype=np.float32)
+        # (runs, resamples), column-major so that the cumulative sum runs over contiguous memory
+        positives = np.asarray(self.positives @ weights, dtype=np.float64, order="F")
+        negatives = np.asarray(self.negatives @ weights, dtype=np.float64, order="F")
+        # negatives ranked at or below every run, ties count half
+        wins = np.einsum("gr,gr->r", positives, np.cumsum(negatives, axis=0) - 0.5 * negatives)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return wins / (positives.sum(axis=0) * negatives.sum(axis=0))
+
+_scores: list[_Scores] = []
+
+def _init_worker(scores: list[_Scores]):
+    global _scores
+    _scores = scores
+
+def _resample_block(task: tuple[np.random.SeedSequence, int]) -> np.ndarray:
+    """
+    (metrics, sets, resamples) of one block of puzzle resamples
+    """
+    seed, size = task
+    n = len(_scores[0].counts)
+    draws = np.random.default_rng(seed).integers(0, n, (size, n))
+    # (puzzles, resamples): how often every puzzle was drawn
+    weights = np.bincount((draws * size + np.arange(size)[:, None]).ravel(), minlength=n * size).reshape(n, size).astype(np.float32)
+    return np.stack([
+        np.stack([scores.accuracy(weights) for scores in _scores]),
+        np.stack([scores.auc(weights) for scores in _scores]),
+    ])
+
+@dataclass()
+class Comparison:
+    names: list[str]
+    puzzles: int
+    resamples: int
+    confidence: float
+    estimate: dict[str, list[float]] = field(default_factory=dict)
+    interval: dict[str, list[tuple[float, float]]] = field(default_factory=dict)
+    # against the first result set, the first entry compares it with itself
+    difference: dict[str, list[tuple[float, float]]] = field(default_factory=dict)
+    p_value: dict[str, list[float]] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "names": self.names,
+            "puzzles": self.puzzles,
+            "resamples": self.resamples,
+            "confidence": self.confidence,
+            "estimate": self.estimate,
+            "interval": self.interval,
+            "difference": self.difference,
+            "p_value": self.p_value,
+        }
+
+def bootstrap(result_sets: Sequence[ResultSet], resamples: int = 10000, confidence: float = 0.95, processes: int | None = None, seed: int = 0, block: int | None = None) -> tuple[Comparison, np.ndarray]:
+    """
+    Paired bootstrap over the common puzzles of the result sets
+
+    Params
+    - processes: int (pool size, defaults to the number of CPUs, 1 runs in this process)
+    - block: int (resamples per task, by default as many as fit into `BLOCK_CELLS`)
+
+    Returns the comparison and the (metrics, sets, resamples) bootstrap distribution
+    """
+    if len(result_sets) < 2:
+        raise ValueError("Compare at least two result sets")
+    aligned = align(result_sets)
+    n = len(aligned[0].fens)
+    if n == 0:
+        raise ValueError("The result sets have no position in common")
+    scores = [_Scores(result_set) for result_set in aligned]
+
+    if block is None:
+        block = max(1, min(resamples, BLOCK_CELLS // max(n, *(score.runs for score in scores))))
+    sizes = [min(block, resamples - start) for start in range(0, resamples, block)]
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+
+    if processes == 1:
+        _init_worker(scores)
+        blocks = list(map(_resample_block, tasks))
+    else:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(scores,)) as pool:
+            blocks = pool.map(_resample_block, tasks)
+    distribution = np.concatenate(blocks, axis=2)
+
+    point = np.ones((n, 1))
+    comparison = Comparison(names=[result_set.name for result_set in aligned], puzzles=n, resamples=resamples, confidence=confidence)
+    tails = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+    for m, metric in enumerate(METRICS):
+        comparison.estimate[metric] = [float((score.accuracy if metric == "accuracy" else score.auc)(point)[0]) for score in scores]
+        samples = distribution[m]
+        comparison.interval[metric] = [tuple(float(bound) for bound in np.nanpercentile(row, tails)) for row in samples]
+        differences = samples - samples[0]
+        comparison.difference[metric] = [tuple(float(bound) for bound in np.nanpercentile(row, tails)) for row in differences]
+        comparison.p_value[metric] = [
+            float(min(1.0, 2 * min(np.nanmean(row <= 0), np.nanmean(row >= 0)))) if i else 1.0
+            for i, row in enumerate(differences)
+        ]
+    return comparison, distribution
+
+def compare_results(store: ResultStore, algorithms: Sequence[str], configs: Sequence[dict | None] | None = None, **kwargs) -> Comparison:
+    """
+    `bootstrap` over the latest runs of `algorithms` in the result store, the first one is the reference
+    """
+    configs = configs if configs is not None else [None] * len(algorithms)
+    result_sets = [load_result_set(store, algorithm, config) for algorithm, config in zip(algorithms, configs)]
+    comparison, _ = bootstrap(result_sets, **kwargs)
+    return comparison
+
+def format_comparison(comparison: Comparison) -> str:
+    level = f"{comparison.confidence:.0%}"
+    lines = [f"{comparison.puzzles} puzzles, {comparison.resamples} paired resamples, {level} intervals"]
+    width = max(len(name) for name in comparison.names)
+    for metric in METRICS:
+        lines.append(f"{metric}:")
+        for i, name in enumerate(comparison.names):
+            low, high = comparison.interval[metric][i]
+            line = f"  {name:<{width}}  {comparison.estimate[metric][i]:.4f} [{low:.4f}, {high:.4f}]"
+            if i:
+                low, high = comparison.difference[metric][i]
+                line += f"  diff [{low:+.4f}, {high:+.4f}] p={comparison.p_value[metric][i]:.4f}"
+            lines.append(line)
+    return "\n".join(lines)
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Paired bootstrap confidence intervals between stored saliency results")
+    parser.add_argument("--store", default="output/results")
+    parser.add_argument("--algorithms", nargs="+", required=True, help="reference first")
+    parser.add_argument("--resamples", type=int, default=10000)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    comparison = compare_results(ResultStore(args.store), args.algorithms, resamples=args.resamples, confidence=args.confidence, processes=args.processes, seed=args.seed)
+    print(format_comparison(comparison))
+
+if __name__ == "__main__":
+    main()
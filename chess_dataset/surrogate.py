@@ -0,0 +1,107 @@
+"""
+Trains the `sarfa.surrogate` model on stored SARFA results.
+
+Positions are split by FEN into training and held-out sets. The report
+compares accuracy/ROC AUC against the ground truth of the held-out positions
+for the surrogate, the stored engine results and the routed combination of
+both.
+
+```bash
+python -m chess_dataset.surrogate train --algorithm sarfa_baseline --output output/surrogate.npz
+```
+
+```python
+model, report = train_from_store(ResultStore("output/results"), ["sarfa_baseline"])
+model.save("output/surrogate.npz")
+```
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Iterable, Sequence
+
+import chess
+import numpy as np
+
+from sarfa.surrogate import DEFAULT_ALPHA, DEFAULT_CONFIDENT_QUANTILE, DEFAULT_MEMBERS, MODEL_PATH, SurrogateModel
+
+from .compiled import unpack_masks
+from .result_store import ResultStore, unpack_action
+from .sweep import score_variants
+
+def _training_rows(store: ResultStore, algorithms: Iterable[str]) -> np.ndarray:
+    rows = [store.select(algorithm=algorithm) for algorithm in algorithms]
+    return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+def train_from_store(store: ResultStore, algorithms: Sequence[str], holdout: float = 0.2, members: int = DEFAULT_MEMBERS, alpha: float = DEFAULT_ALPHA, confident_quantile: float = DEFAULT_CONFIDENT_QUANTILE, seed: int = 0) -> tuple[SurrogateModel, dict[str, Any]]:
+    """
+    Fits a surrogate on the stored results of `algorithms` and scores it on held-out positions
+
+    Params
+    - holdout: float (share of the FENs held out for the report)
+    - members, alpha, confident_quantile, seed: as for `SurrogateModel.fit`
+    """
+    rows = _training_rows(store, algorithms)
+    if len(rows) == 0:
+        raise ValueError(f"no stored results for {list(algorithms)}")
+    fens = [fen.decode() for fen in store.column("fen")[rows]]
+    boards = [chess.Board(fen) for fen in fens]
+    actions = [unpack_action(action) for action in store.column("action")[rows]]
+    saliency = np.asarray(store.column("saliency")[rows])
+    ground_truth_masks = store.column("ground_truth")[rows]
+
+    rng = np.random.default_rng(seed)
+    unique_fens = sorted(set(fens))
+    held_out = set(rng.permutation(unique_fens)[:int(round(holdout * len(unique_fens)))].tolist())
+    test = np.array([fen in held_out for fen in fens], dtype=bool)
+    train = ~test if test.any() and (~test).any() else np.ones(len(rows), dtype=bool)
+
+    model = SurrogateModel.fit([boards[i] for i in np.flatnonzero(train)], [actions[i] for i in np.flatnonzero(train)], saliency[train], members=members, alpha=alpha, confident_quantile=confident_quantile, seed=seed)
+    model.metadata["algorithms"] = list(algorithms)
+
+    report: dict[str, Any] = {"train_positions": int(train.sum()), "test_positions": int(test.sum()), "threshold": model.threshold}
+    if not test.any():
+        return model, report
+
+    test_indices = np.flatnonzero(test)
+    test_boards = [boards[i] for i in test_indices]
+    start = time.perf_counter()
+    prediction = model.predict(test_boards, [actions[i] for i in test_indices])
+    report["predict_ms_per_position"] = (time.perf_counter() - start) * 1000 / len(test_indices)
+
+    ground_truth = unpack_masks(ground_truth_masks[test_indices])
+    stored = saliency[test_indices]
+    confident = prediction.uncertainty <= model.threshold
+    routed = np.where(confident[:, None], prediction.saliency, np.nan_to_num(stored))
+    routed_evaluated = np.where(confident[:, None], prediction.squares, ~np.isnan(stored))
+
+    accuracy, aucs = score_variants(
+        np.stack([prediction.saliency, np.nan_to_num(stored), routed]),
+        np.stack([prediction.squares, ~np.isnan(stored), routed_evaluated]),
+        ground_truth,
+    )
+    for name, variant_accuracy, variant_auc in zip(("surrogate", "engine", "routed"), accuracy, aucs):
+        report[name] = {"accuracy": float(variant_accuracy), "auc": variant_auc}
+    report["routed"]["engine_share"] = float(1 - confident.mean())
+    return model, report
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Train the surrogate saliency model on stored SARFA results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train = subparsers.add_parser("train")
+    train.add_argument("--algorithm", nargs="+", required=True, help="result store algorithm names to train on")
+    train.add_argument("--store", default="output/results")
+    train.add_argument("--holdout", type=float, default=0.2, help="share of the positions held out for the ROC report")
+    train.add_argument("--members", type=int, default=DEFAULT_MEMBERS)
+    train.add_argument("--alpha", type=float, default=DEFAULT_ALPHA)
+    train.add_argument("--confident-quantile", type=float, default=DEFAULT_CONFIDENT_QUANTILE)
+    train.add_argument("--output", default=MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    model, report = train_from_store(ResultStore(args.store), args.algorithm, holdout=args.holdout, members=args.members, alpha=args.alpha, confident_quantile=args.confident_quantile)
+    model.save(args.output)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
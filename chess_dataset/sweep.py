@@ -0,0 +1,226 @@
+"""
+Hyperparameter sweeps that run the engine once per engine configuration.
+
+Discount factor and depth of sequential SARFA, and percentile, top-k and
+`compare_q_vals` of PaIRS, only change how stored engine results are
+combined. The sweep runs the engine stage once per search limit (at the
+largest depth) and scores every post-processing variant from those results
+with numpy, producing one accuracy/ROC AUC row per configuration.
+
+```bash
+python -m chess_dataset.sweep sequential --engine fake --nodes 20000 --discounts 0.8 0.9 1.0 --depths 1 2 3
+python -m chess_dataset.sweep pairs --engine fake --nodes 20000 --percentiles 5 10 20 --topks 5 10
+```
+"""
+
+import argparse
+import itertools
+import json
+import os
+from typing import Any
+
+import chess
+import chess.engine
+import numpy as np
+from sklearn.metrics import roc_curve, auc
+
+from sarfa.algorithms import sequential_steps, pairs_q_values, get_pairwise_sensitivity
+from sarfa.engine import Engine, make_engine
+
+from .dataset import load_dataset
+
+def _limit_config(limit: chess.engine.Limit) -> dict[str, float]:
+    return {key: value for key, value in (("time", limit.time), ("nodes", limit.nodes), ("depth", limit.depth)) if value is not None}
+
+def _square_array(saliency: dict[str, float]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (64,) values and (64,) mask of the squares present in a saliency map
+    """
+    values = np.zeros(64)
+    evaluated = np.zeros(64, dtype=bool)
+    for position, value in saliency.items():
+        square = chess.parse_square(position)
+        values[square] = value
+        evaluated[square] = True
+    return values, evaluated
+
+def _ground_truth_array(position_strs: list[str]) -> np.ndarray:
+    ground_truth = np.zeros(64, dtype=bool)
+    for position in position_strs:
+        ground_truth[chess.parse_square(position)] = True
+    return ground_truth
+
+def score_variants(predicted: np.ndarray, evaluated: np.ndarray, ground_truth: np.ndarray) -> tuple[np.ndarray, list[float | None]]:
+    """
+    Accuracy and ROC AUC of every variant, computed like `SarfaBenchmark`
+    (union of predicted and ground-truth squares, min-max scaled per puzzle)
+
+    Params
+    - predicted: (variants, puzzles, 64) saliency
+    - evaluated: (variants, puzzles, 64) squares present in the saliency maps
+    - ground_truth: (puzzles, 64)
+    """
+    mask = evaluated | ground_truth[None]
+    masked = np.where(mask, predicted, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        low = np.nanmin(masked, axis=2, keepdims=True)
+        high = np.nanmax(masked, axis=2, keepdims=True)
+        scaled = (predicted - low) / (high - low)
+    error = np.where(mask, np.abs(scaled - ground_truth[None]), 0.0)
+    accuracy = 1 - error.sum(axis=(1, 2)) / mask.sum(axis=(1, 2))
+
+    aucs = []
+    for variant in range(predicted.shape[0]):
+        scores = scaled[variant][mask[variant]]
+        labels = np.broadcast_to(ground_truth, mask[variant].shape)[mask[variant]]
+        if np.isnan(scores).any() or labels.all() or not labels.any():
+            aucs.append(None)
+            continue
+        fpr, tpr, _ = roc_curve(labels, scores)
+        aucs.append(float(auc(fpr, tpr)))
+    return accuracy, aucs
+
+def _puzzles(max_puzzles: int | None) -> list[tuple[str, np.ndarray]]:
+    dataset = load_dataset()
+    count = len(dataset) if max_puzzles is None else min(max_puzzles, len(dataset))
+    return [(dataset.get_fen(i), _ground_truth_array(dataset.get_saliency_ground_truth(i))) for i in range(count)]
+
+def sequential_sweep(engine: Engine, limits: list[chess.engine.Limit], discount_factors: list[float], depths: list[int], max_puzzles: int | None = None) -> list[dict[str, Any]]:
+    """
+    Sequential SARFA over every (limit, discount factor, depth). The engine
+    runs once per limit and puzzle at the largest depth, shallower depths use
+    the first timesteps of that line.
+    """
+    puzzles = _puzzles(max_puzzles)
+    ground_truth = np.stack([truth for _, truth in puzzles])
+    max_depth = max(depths)
+    discounts = np.asarray(discount_factors, dtype=float)
+    # weights[discount, step]
+    weights = discounts[:, None] ** np.arange(max_depth)[None, :]
+
+    rows = []
+    for limit in limits:
+        # steps[puzzle, step, square], steps past the end of a line stay zero
+        steps = np.zeros((len(puzzles), max_depth, 64))
+        step_evaluated = np.zeros((len(puzzles), max_depth, 64), dtype=bool)
+        for i, (fen, _) in enumerate(puzzles):
+            saliency_per_step, _, _ = sequential_steps(engine, fen, depth=max_depth, limit=limit)
+            for step, saliency in enumerate(saliency_per_step):
+                steps[i, step], step_evaluated[i, step] = _square_array(saliency)
+
+        # cumulative[discount, puzzle, depth, square]
+        cumulative = np.cumsum(weights[:, None, :, None] * steps[None], axis=2)
+        cumulative_evaluated = np.logical_or.accumulate(step_evaluated, axis=1)
+
+        variants = list(itertools.product(range(len(discounts)), depths))
+        predicted = np.stack([cumulative[d, :, depth - 1] for d, depth in variants])
+        evaluated = np.stack([cumulative_evaluated[:, depth - 1] for _, depth in variants])
+        accuracy, aucs = score_variants(predicted, evaluated, ground_truth)
+
+        for (d, depth), variant_accuracy, variant_auc in zip(variants, accuracy, aucs):
+            rows.append({
+                **_limit_config(limit),
+                "discount_factor": float(discounts[d]),
+                "depth": depth,
+                "accuracy": float(variant_accuracy),
+                "auc": variant_auc,
+            })
+    return rows
+
+def _pair_sensitivities(perturbation_to_qvals: dict[str, tuple[dict[str, float], dict[str, float]]], compare_q_vals: bool) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (pairs, 2) squares and (pairs,) sensitivities in the order `filter_pairwise_sensitivity` sees them
+    """
+    pairwise_sensitivity = get_pairwise_sensitivity(perturbation_to_qvals, compare_q_vals)
+    pairs = list(pairwise_sensitivity)
+    squares = np.array([[chess.parse_square(pos1), chess.parse_square(pos2)] for pos1, pos2 in pairs], dtype=int).reshape(-1, 2)
+    return squares, np.fromiter(pairwise_sensitivity.values(), dtype=float, count=len(pairs))
+
+def pairs_sweep(engine: Engine, limits: list[chess.engine.Limit], percentiles: list[float], topks: list[int], compare_q_vals: list[bool] = [True, False], max_puzzles: int | None = None) -> list[dict[str, Any]]:
+    """
+    PaIRS over every (limit, compare_q_vals, percentile or top-k). The engine
+    runs once per limit and puzzle, the squares of the important groups count
+    as salient (every square of a selected pair belongs to a group).
+    """
+    puzzles = _puzzles(max_puzzles)
+    ground_truth = np.stack([truth for _, truth in puzzles])
+    filters = [("percentile", percentile) for percentile in percentiles] + [("topk", topk) for topk in topks]
+
+    rows = []
+    for limit in limits:
+        q_values = [pairs_q_values(engine, fen, limit=limit)[0] for fen, _ in puzzles]
+
+        variants = list(itertools.product(compare_q_vals, filters))
+        predicted = np.zeros((len(variants), len(puzzles), 64))
+        for i, perturbation_to_qvals in enumerate(q_values):
+            for compare in compare_q_vals:
+                squares, values = _pair_sensitivities(perturbation_to_qvals, compare)
+                if len(values) == 0:
+                    continue
+                thresholds = np.percentile(values, percentiles) if percentiles else []
+                order = np.argsort(values, kind="stable")
+                for v, (variant_compare, (kind, parameter)) in enumerate(variants):
+                    if variant_compare != compare:
+                        continue
+                    if kind == "percentile":
+                        selected = squares[values <= thresholds[percentiles.index(parameter)]]
+                    else:
+                        selected = squares[order[:parameter]]
+                    predicted[v, i, selected.ravel()] = 1.0
+
+        accuracy, aucs = score_variants(predicted, predicted > 0, ground_truth)
+        for (compare, (kind, parameter)), variant_accuracy, variant_auc in zip(variants, accuracy, aucs):
+            rows.append({
+                **_limit_config(limit),
+                "compare_q_vals": compare,
+                kind: parameter,
+                "accuracy": float(variant_accuracy),
+                "auc": variant_auc,
+            })
+    return rows
+
+def format_table(rows: list[dict[str, Any]]) -> str:
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    cells = [[("" if row.get(column) is None else f"{row[column]:.4f}" if isinstance(row.get(column), float) else str(row[column])) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines += ["  ".join(cell.ljust(width) for cell, width in zip(line, widths)) for line in cells]
+    return "\n".join(lines)
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Hyperparameter sweeps that reuse engine results across configurations")
+    parser.add_argument("algorithm", choices=["sequential", "pairs"])
+    parser.add_argument("--engine", default="auto", help='"fake", "fake-uci", "auto" (Stockfish if found, else fake) or a path to a UCI engine')
+    limit_group = parser.add_mutually_exclusive_group()
+    limit_group.add_argument("--nodes", type=int, nargs="+", default=None, help="node limits per search, one engine run each")
+    limit_group.add_argument("--runtimes", type=float, nargs="+", default=None, help="seconds per search, one engine run each")
+    parser.add_argument("--discounts", type=float, nargs="+", default=[0.9])
+    parser.add_argument("--depths", type=int, nargs="+", default=[3])
+    parser.add_argument("--percentiles", type=float, nargs="+", default=[10])
+    parser.add_argument("--topks", type=int, nargs="*", default=[])
+    parser.add_argument("--max-puzzles", type=int, default=None)
+    parser.add_argument("--output", default=None, help="write the rows as JSON")
+    args = parser.parse_args(argv)
+
+    if args.runtimes:
+        limits = [chess.engine.Limit(time=runtime) for runtime in args.runtimes]
+    else:
+        limits = [chess.engine.Limit(nodes=nodes) for nodes in (args.nodes or [20_000])]
+
+    engine = make_engine(args.engine)
+    try:
+        if args.algorithm == "sequential":
+            rows = sequential_sweep(engine, limits, args.discounts, args.depths, max_puzzles=args.max_puzzles)
+        else:
+            rows = pairs_sweep(engine, limits, args.percentiles, args.topks, max_puzzles=args.max_puzzles)
+    finally:
+        engine.close()
+
+    print(format_table(rows))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
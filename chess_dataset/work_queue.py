@@ -0,0 +1,485 @@
+"""
+Durable work queue for saliency sweeps that span several processes or machines.
+
+A job is one (FEN, action, algorithm, config) explanation. Workers lease
+jobs from a broker, extend their leases with heartbeats while the engine is
+busy and write each result exactly once. A lease that is not extended within
+the visibility timeout expires and the job goes back to the queue. A sweep
+killed on any node therefore resumes where it stopped: finished jobs stay
+finished and only the interrupted ones run again.
+
+```bash
+python -m chess_dataset.work_queue enqueue --queue output/queue.sqlite --algorithm baseline --nodes 20000
+python -m chess_dataset.work_queue worker --queue output/queue.sqlite --engine ./stockfish_15_x64_avx2 --processes 8
+python -m chess_dataset.work_queue status --queue output/queue.sqlite --watch 5
+python -m chess_dataset.work_queue export --queue output/queue.sqlite --store output/results
+```
+
+`SQLiteBroker` keeps the queue in one SQLite file and relies on SQLite's
+file locking. Every process on a machine, or nodes sharing a file system
+with working POSIX locks, can use the same file. Another backend only has
+to implement `Broker`.
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+import chess
+import chess.engine
+
+from sarfa.engine import make_engine
+
+from .dataset import load_dataset
+from .perf import ALGORITHMS
+from .result_store import ResultStore, ResultRow, NO_PUZZLE
+
+DEFAULT_QUEUE = "output/queue.sqlite"
+VISIBILITY_TIMEOUT = 300.0
+HEARTBEAT_INTERVAL = 30.0
+MAX_ATTEMPTS = 3
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+@dataclass()
+class Job:
+    fen: str
+    algorithm: str
+    config: dict[str, Any] = field(default_factory=dict) # search limit, e.g. {"nodes": 20000}
+    action: str | None = None
+    puzzle: int = NO_PUZZLE
+    ground_truth: list[str] = field(default_factory=list)
+    id: int | None = None
+    attempts: int = 0
+
+    @property
+    def key(self) -> str:
+        """
+        Identity of the explanation, enqueueing the same job twice is a no-op
+        """
+        payload = json.dumps([self.fen, self.action, self.algorithm, self.config], sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def limit(self) -> chess.engine.Limit:
+        return chess.engine.Limit(**{key: value for key, value in self.config.items() if key in ("time", "nodes", "depth")})
+
+class Broker:
+    """
+    Interface of a queue backend
+    """
+
+    def enqueue(self, jobs: Iterable[Job]) -> int:
+        """
+        Adds the jobs that aren't queued yet, returns how many were added
+        """
+        raise NotImplementedError
+
+    def lease(self, worker: str, count: int = 1, visibility_timeout: float = VISIBILITY_TIMEOUT, max_attempts: int = MAX_ATTEMPTS) -> list[Job]:
+        """
+        Pending jobs and jobs whose lease expired, leased to `worker` for `visibility_timeout` seconds.
+        An expired job that already had `max_attempts` leases is marked failed
+        instead (its worker died on it every time, e.g. OOM or a crash).
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, worker: str, job_ids: Iterable[int], visibility_timeout: float = VISIBILITY_TIMEOUT) -> list[int]:
+        """
+        Extends the leases `worker` still holds, returns the ids it lost
+        """
+        raise NotImplementedError
+
+    def complete(self, job_id: int, worker: str, saliency: dict[str, float], elapsed: float) -> bool:
+        """
+        Stores the result once, a second write for the same job is ignored. Returns whether it was written.
+        """
+        raise NotImplementedError
+
+    def fail(self, job_id: int, worker: str, error: str, max_attempts: int = MAX_ATTEMPTS):
+        """
+        Puts the job back in the queue, or marks it failed after `max_attempts`
+        """
+        raise NotImplementedError
+
+    def progress(self, window: float = 300.0) -> dict[str, Any]:
+        raise NotImplementedError
+
+    def results(self, exported: bool = True) -> Iterable[tuple[Job, dict[str, float]]]:
+        """
+        Finished jobs and their saliency, `exported=False` skips the ones already marked exported
+        """
+        raise NotImplementedError
+
+    def mark_exported(self, job_ids: Iterable[int]):
+        raise NotImplementedError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    fen TEXT NOT NULL,
+    action TEXT,
+    algorithm TEXT NOT NULL,
+    config TEXT NOT NULL,
+    puzzle INTEGER NOT NULL,
+    ground_truth TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires);
+CREATE TABLE IF NOT EXISTS results (
+    job_id INTEGER PRIMARY KEY REFERENCES jobs (id),
+    saliency TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    elapsed REAL NOT NULL,
+    finished REAL NOT NULL,
+    exported INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS results_finished ON results (finished);
+"""
+
+class SQLiteBroker(Broker):
+    def __init__(self, path: str = DEFAULT_QUEUE, timeout: float = 60.0):
+        """
+        Params
+        - timeout: float (seconds to wait for another process' write lock)
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        # queues created before results were marked on export
+        if "exported" not in [column[1] for column in self._connection.execute("PRAGMA table_info(results)")]:
+            self._connection.execute("ALTER TABLE results ADD COLUMN exported INTEGER NOT NULL DEFAULT 0")
+        # the heartbeat thread shares the connection with the worker loop
+        self._lock = threading.Lock()
+
+    def _transaction(self, statements) -> Any:
+        """
+        Runs `statements(cursor)` in one write transaction (BEGIN IMMEDIATE takes the database lock up front)
+        """
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(cursor)
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+            return result
+
+    def enqueue(self, jobs: Iterable[Job]) -> int:
+        rows = [
+            (job.key, job.fen, job.action, job.algorithm, json.dumps(job.config, sort_keys=True), job.puzzle, json.dumps(job.ground_truth), PENDING)
+            for job in jobs
+        ]
+
+        def insert(cursor) -> int:
+            before = cursor.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            cursor.executemany("INSERT OR IGNORE INTO jobs (key, fen, action, algorithm, config, puzzle, ground_truth, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            return cursor.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - before
+        return self._transaction(insert)
+
+    def lease(self, worker: str, count: int = 1, visibility_timeout: float = VISIBILITY_TIMEOUT, max_attempts: int = MAX_ATTEMPTS) -> list[Job]:
+        def take(cursor) -> list[Job]:
+            now = time.time()
+            cursor.execute(
+                "UPDATE jobs SET status = ?, lease_expires = NULL, error = ? WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, f"lease expired {max_attempts} times", LEASED, now, max_attempts),
+            )
+            rows = cursor.execute(
+                "SELECT id, fen, action, algorithm, config, puzzle, ground_truth, attempts FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT ?",
+                (PENDING, LEASED, now, count),
+            ).fetchall()
+            cursor.executemany(
+                "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                [(LEASED, worker, now + visibility_timeout, row[0]) for row in rows],
+            )
+            return [
+                Job(fen=fen, action=action, algorithm=algorithm, config=json.loads(config), puzzle=puzzle, ground_truth=json.loads(ground_truth), id=job_id, attempts=attempts + 1)
+                for job_id, fen, action, algorithm, config, puzzle, ground_truth, attempts in rows
+            ]
+        return self._transaction(take)
+
+    def heartbeat(self, worker: str, job_ids: Iterable[int], visibility_timeout: float = VISIBILITY_TIMEOUT) -> list[int]:
+        job_ids = list(job_ids)
+
+        def extend(cursor) -> list[int]:
+            lost = []
+            expires = time.time() + visibility_timeout
+            for job_id in job_ids:
+                cursor.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = ?", (expires, job_id, worker, LEASED))
+                if cursor.rowcount == 0:
+                    lost.append(job_id)
+            return lost
+        return self._transaction(extend)
+
+    def complete(self, job_id: int, worker: str, saliency: dict[str, float], elapsed: float) -> bool:
+        def write(cursor) -> bool:
+            cursor.execute("INSERT OR IGNORE INTO results (job_id, saliency, worker, elapsed, finished) VALUES (?, ?, ?, ?, ?)", (job_id, json.dumps(saliency), worker, elapsed, time.time()))
+            written = cursor.rowcount == 1
+            cursor.execute("UPDATE jobs SET status = ?, lease_expires = NULL, error = NULL WHERE id = ?", (DONE, job_id))
+            return written
+        return self._transaction(write)
+
+    def fail(self, job_id: int, worker: str, error: str, max_attempts: int = MAX_ATTEMPTS):
+        def release(cursor):
+            cursor.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, lease_expires = NULL, error = ? WHERE id = ? AND worker = ? AND status = ?",
+                (max_attempts, FAILED, PENDING, error, job_id, worker, LEASED),
+            )
+        self._transaction(release)
+
+    def progress(self, window: float = 300.0) -> dict[str, Any]:
+        with self._lock:
+            now = time.time()
+            counts = dict(self._connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            expired = self._connection.execute("SELECT COUNT(*) FROM jobs WHERE status = ? AND lease_expires < ?", (LEASED, now)).fetchone()[0]
+            recent = self._connection.execute("SELECT worker, COUNT(*), AVG(elapsed) FROM results WHERE finished >= ? GROUP BY worker", (now - window,)).fetchall()
+            oldest = self._connection.execute("SELECT MIN(finished) FROM results WHERE finished >= ?", (now - window,)).fetchone()[0]
+            first, last = self._connection.execute("SELECT MIN(finished), MAX(finished) FROM results").fetchone()
+
+        total = sum(counts.values())
+        done = counts.get(DONE, 0)
+        # a sweep younger than the window has only been producing since its oldest result
+        span = min(window, now - oldest) if oldest is not None else window
+        throughput = sum(count for _, count, _ in recent) / span if span > 0 else 0.0
+        remaining = total - done - counts.get(FAILED, 0)
+        return {
+            "total": total,
+            "pending": counts.get(PENDING, 0) + expired,
+            "leased": counts.get(LEASED, 0) - expired,
+            "done": done,
+            "failed": counts.get(FAILED, 0),
+            "throughput": throughput, # jobs per second over the window
+            "eta_seconds": remaining / throughput if throughput > 0 else None,
+            "elapsed_seconds": (last - first) if first is not None else 0.0,
+            "workers": {worker: {"jobs": count, "mean_seconds": mean} for worker, count, mean in recent},
+        }
+
+    def results(self, exported: bool = True) -> Iterable[tuple[Job, dict[str, float]]]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT jobs.id, fen, action, algorithm, config, puzzle, ground_truth, attempts, saliency FROM jobs JOIN results ON results.job_id = jobs.id "
+                + ("" if exported else "WHERE exported = 0 ")
+                + "ORDER BY jobs.id"
+            ).fetchall()
+        for job_id, fen, action, algorithm, config, puzzle, ground_truth, attempts, saliency in rows:
+            job = Job(fen=fen, action=action, algorithm=algorithm, config=json.loads(config), puzzle=puzzle, ground_truth=json.loads(ground_truth), id=job_id, attempts=attempts)
+            yield job, json.loads(saliency)
+
+    def mark_exported(self, job_ids: Iterable[int]):
+        job_ids = [(job_id,) for job_id in job_ids]
+        self._transaction(lambda cursor: cursor.executemany("UPDATE results SET exported = 1 WHERE job_id = ?", job_ids))
+
+    def close(self):
+        self._connection.close()
+
+def dataset_jobs(algorithm: str, config: dict[str, Any], max_puzzles: int | None = None) -> list[Job]:
+    """
+    One job per dataset puzzle, explaining the solution move like `SarfaBenchmark`
+    """
+    dataset = load_dataset()
+    count = len(dataset) if max_puzzles is None else min(max_puzzles, len(dataset))
+    jobs = []
+    for i in range(count):
+        fen = dataset.get_fen(i)
+        action = chess.Board(fen).parse_san(dataset.get_solution(i)[0])
+        jobs.append(Job(fen=fen, action=action.uci(), algorithm=algorithm, config=config, puzzle=i, ground_truth=dataset.get_saliency_ground_truth(i)))
+    return jobs
+
+def fen_file_jobs(path: str, algorithm: str, config: dict[str, Any]) -> list[Job]:
+    """
+    One job per FEN line, explaining the engine's best move
+    """
+    with open(path) as f:
+        return [Job(fen=line.strip(), algorithm=algorithm, config=config) for line in f if line.strip()]
+
+class _Heartbeat(threading.Thread):
+    """
+    Extends the leases of the jobs in `held` every `interval` seconds
+    """
+
+    def __init__(self, broker: Broker, worker: str, interval: float, visibility_timeout: float):
+        super().__init__(daemon=True, name=f"heartbeat-{worker}")
+        self.broker = broker
+        self.worker = worker
+        self.interval = interval
+        self.visibility_timeout = visibility_timeout
+        self.held: set[int] = set()
+        self.lost: set[int] = set()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            held = list(self.held)
+            if held:
+                self.lost.update(self.broker.heartbeat(self.worker, held, self.visibility_timeout))
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+def run_worker(broker: Broker, engine_spec: str = "auto", batch: int = 4, visibility_timeout: float = VISIBILITY_TIMEOUT, heartbeat_interval: float = HEARTBEAT_INTERVAL, max_attempts: int = MAX_ATTEMPTS, idle_exit: bool = True, poll_interval: float = 5.0, worker: str | None = None) -> int:
+    """
+    Leases and explains jobs on a local engine until the queue is empty
+    (or forever with `idle_exit=False`). Returns the number of jobs completed.
+    """
+    worker = worker or worker_id()
+    engine = make_engine(engine_spec, layout=True)
+    heartbeat = _Heartbeat(broker, worker, heartbeat_interval, visibility_timeout)
+    heartbeat.start()
+    completed = 0
+    try:
+        while True:
+            jobs = broker.lease(worker, batch, visibility_timeout, max_attempts)
+            if not jobs:
+                if idle_exit:
+                    return completed
+                time.sleep(poll_interval)
+                continue
+
+            heartbeat.held.update(job.id for job in jobs)
+            for job in jobs:
+                # the lease expired and another worker owns the job now
+                if job.id in heartbeat.lost:
+                    heartbeat.held.discard(job.id)
+                    continue
+                start = time.perf_counter()
+                try:
+                    action = chess.Move.from_uci(job.action) if job.action else None
+                    saliency = ALGORITHMS[job.algorithm](engine, job.fen, action, job.limit())
+                except Exception as error:
+                    broker.fail(job.id, worker, repr(error), max_attempts)
+                else:
+                    broker.complete(job.id, worker, {position: float(value) for position, value in saliency.items()}, time.perf_counter() - start)
+                    completed += 1
+                finally:
+                    heartbeat.held.discard(job.id)
+    finally:
+        heartbeat.stop()
+        engine.close()
+
+def _worker_process(queue_path: str, engine_spec: str, batch: int, visibility_timeout: float, heartbeat_interval: float, idle_exit: bool) -> int:
+    broker = SQLiteBroker(queue_path)
+    try:
+        return run_worker(broker, engine_spec, batch=batch, visibility_timeout=visibility_timeout, heartbeat_interval=heartbeat_interval, idle_exit=idle_exit)
+    finally:
+        broker.close()
+
+def export_results(broker: Broker, store: ResultStore) -> int:
+    """
+    Appends the finished jobs not exported yet to the result store as one new
+    run per algorithm and config, and marks them exported
+    """
+    runs: dict[tuple[str, str], list[ResultRow]] = {}
+    job_ids = []
+    for job, saliency in broker.results(exported=False):
+        job_ids.append(job.id)
+        row = ResultRow(
+            algorithm=job.algorithm,
+            fen=job.fen,
+            saliency=saliency,
+            action=chess.Move.from_uci(job.action) if job.action else None,
+            config=job.config,
+            puzzle=job.puzzle,
+            ground_truth=job.ground_truth,
+        )
+        runs.setdefault((job.algorithm, json.dumps(job.config, sort_keys=True)), []).append(row)
+    for rows in runs.values():
+        store.append(rows)
+    broker.mark_exported(job_ids)
+    return sum(len(rows) for rows in runs.values())
+
+def format_progress(progress: dict[str, Any]) -> str:
+    total = progress["total"] or 1
+    lines = [
+        f"done {progress['done']}/{progress['total']} ({100 * progress['done'] / total:.1f}%)  pending {progress['pending']}  leased {progress['leased']}  failed {progress['failed']}",
+        f"throughput {progress['throughput'] * 60:.1f} jobs/min  eta " + (f"{progress['eta_seconds'] / 60:.1f} min" if progress["eta_seconds"] is not None else "-"),
+    ]
+    for worker, stats in sorted(progress["workers"].items()):
+        lines.append(f"  {worker}: {stats['jobs']} jobs, {stats['mean_seconds']:.2f} s/job")
+    return "\n".join(lines)
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Durable work queue for saliency sweeps")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = subparsers.add_parser("enqueue", help="add jobs for the dataset puzzles or a FEN file")
+    enqueue.add_argument("--algorithm", required=True, choices=list(ALGORITHMS))
+    enqueue.add_argument("--nodes", type=int, default=None)
+    enqueue.add_argument("--runtime", type=float, default=None, help="seconds per search")
+    enqueue.add_argument("--fens", default=None, help="FEN file, defaults to the dataset puzzles")
+    enqueue.add_argument("--max-puzzles", type=int, default=None)
+
+    worker = subparsers.add_parser("worker", help="explain jobs until the queue is empty")
+    worker.add_argument("--engine", default="auto", help='"fake", "fake-uci", "auto" (Stockfish if found, else fake) or a path to a UCI engine')
+    worker.add_argument("--processes", type=int, default=1, help="worker processes, each with its own engine")
+    worker.add_argument("--batch", type=int, default=4, help="jobs leased at a time")
+    worker.add_argument("--visibility-timeout", type=float, default=VISIBILITY_TIMEOUT)
+    worker.add_argument("--heartbeat", type=float, default=HEARTBEAT_INTERVAL)
+    worker.add_argument("--forever", action="store_true", help="keep polling when the queue is empty")
+
+    status = subparsers.add_parser("status", help="progress and throughput")
+    status.add_argument("--window", type=float, default=300.0, help="seconds of results the throughput is measured over")
+    status.add_argument("--watch", type=float, default=None, metavar="SECONDS", help="refresh until every job is finished")
+    status.add_argument("--json", action="store_true")
+
+    export = subparsers.add_parser("export", help="append the finished jobs to a result store")
+    export.add_argument("--store", default="output/results")
+
+    for subparser in (enqueue, worker, status, export):
+        subparser.add_argument("--queue", default=DEFAULT_QUEUE, help="SQLite queue file")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        worker_args = (args.queue, args.engine, args.batch, args.visibility_timeout, args.heartbeat, not args.forever)
+        if args.processes == 1:
+            completed = [_worker_process(*worker_args)]
+        else:
+            with multiprocessing.Pool(args.processes) as pool:
+                completed = pool.starmap(_worker_process, [worker_args] * args.processes)
+        print(f"completed {sum(completed)} jobs")
+        return
+
+    broker = SQLiteBroker(args.queue)
+    try:
+        if args.command == "enqueue":
+            config = {"time": args.runtime} if args.runtime else {"nodes": args.nodes or 20_000}
+            jobs = fen_file_jobs(args.fens, args.algorithm, config) if args.fens else dataset_jobs(args.algorithm, config, args.max_puzzles)
+            print(f"queued {broker.enqueue(jobs)} of {len(jobs)} jobs")
+        elif args.command == "status":
+            while True:
+                progress = broker.progress(args.window)
+                print(json.dumps(progress) if args.json else format_progress(progress), flush=True)
+                if args.watch is None or progress["pending"] + progress["leased"] == 0:
+                    break
+                time.sleep(args.watch)
+        elif args.command == "export":
+            print(f"exported {export_results(broker, ResultStore(args.store))} results")
+    finally:
+        broker.close()
+
+if __name__ == "__main__":
+    main()
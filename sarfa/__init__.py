@@ -1,18 +1,77 @@
-from .visualization import BoardVisualization, OffenseDefenseBoardVisualization, PairsBoardVisualization, ProgressionVisualizer
+import importlib
+
 from . import core
+from . import profiling
+from . import algorithms
 from .engine import Engine
+from .fake_engine import FakeEngine
 from .perturbation_handler import RemovalPerturber
 from .perturbation_handler import AddPerturber
+from .perturbation_handler import AddOpponentPawnPerturber, SubstitutionPerturber, ColorSwapPerturber
+from .perturbation_handler import FileMaskPerturber, RankMaskPerturber, NeighbourhoodMaskPerturber
+from .perturbation_handler import CompositePerturber, get_perturber, register_perturber
+from .dispatch import QValueDispatcher, DispatchStats
+from .tablebase import TablebaseEngine
+from .move_delta import MoveDelta
 from .saliency_calculator import SarfaBaseline, SarfaComputeResult
-from .utils import visualize_directed_graph, dfs, get_all_pos
+from .utils import dfs, get_all_pos
+
+# the plotting stack (cv2, cairosvg, matplotlib, PIL, networkx) is only imported on first use,
+# like the modules with a CLI, so `python -m` doesn't find them imported by the package already
+_LAZY_ATTRIBUTES = {
+    "SupervisedEngine": ".supervisor",
+    "EngineUnavailable": ".supervisor",
+    "StaticEvaluator": ".static_eval",
+    "BoardVisualization": ".visualization",
+    "OffenseDefenseBoardVisualization": ".visualization",
+    "PairsBoardVisualization": ".visualization",
+    "ProgressionVisualizer": ".visualization",
+    "visualization": ".visualization",
+    "RenderJob": ".batch_render",
+    "render_batch": ".batch_render",
+    "visualize_directed_graph": ".utils",
+}
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+    value = module if name == "visualization" else getattr(module, name)
+    globals()[name] = value
+    return value
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
 
 __all__ = [
     "BoardVisualization",
     "core",
+    "profiling",
+    "algorithms",
     "Engine",
+    "SupervisedEngine",
+    "EngineUnavailable",
+    "FakeEngine",
+    "QValueDispatcher",
+    "DispatchStats",
+    "TablebaseEngine",
+    "StaticEvaluator",
+    "MoveDelta",
     "RemovalPerturber",
+    "AddPerturber",
+    "AddOpponentPawnPerturber",
+    "SubstitutionPerturber",
+    "ColorSwapPerturber",
+    "FileMaskPerturber",
+    "RankMaskPerturber",
+    "NeighbourhoodMaskPerturber",
+    "CompositePerturber",
+    "get_perturber",
+    "register_perturber",
     "SarfaBaseline",
     "SarfaComputeResult",
     "get_all_pos",
-    "ProgressionVisualizer"
+    "ProgressionVisualizer",
+    "RenderJob",
+    "render_batch",
 ]
\ No newline at end of file
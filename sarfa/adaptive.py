@@ -0,0 +1,144 @@
+"""
+Adaptive engine budget allocation for SARFA sweeps (successive halving).
+
+Instead of searching every perturbation with the same budget, all of them
+are first searched with a small fraction of it. Only the squares that are
+salient or whose score is still moving are re-searched: each round keeps
+1/eta of the squares at eta times the budget, until they reach the full
+budget or the total budget cap is spent. With the defaults (eta 3 from 1/9
+of the budget) a sweep makes about 1.5x the engine calls of a uniform one
+for 40% of its nodes.
+The original board is searched once at the full budget and shared by every
+round, and every search, the root included, counts against the cap.
+
+```python
+result = adaptive_sarfa_saliency(engine, fen, runtime=2.0, budget_fraction=0.3)
+result.saliency # same shape as `sarfa_baseline_saliency`
+result.spent / result.uniform_cost
+```
+"""
+
+import math
+from dataclasses import dataclass, field
+
+import chess
+import chess.engine
+
+from .engine import Engine
+from .perturbation_handler import Perturber, RemovalPerturber
+from .saliency_calculator import SarfaBaseline, EPSILON
+
+@dataclass()
+class AdaptiveSaliencyResult:
+    saliency: dict[str, float]
+    budget: dict[str, float] # final per-search budget of every square (seconds or nodes)
+    spent: float # total budget requested from the engine
+    uniform_cost: float # what a uniform sweep at the full budget would request
+    rounds: int
+    history: list[dict[str, float]] = field(default_factory=list) # saliency of the re-searched squares per round
+
+class _BudgetMeter:
+    """
+    Adds the budget of every engine search to `spent`
+    """
+
+    def __init__(self, engine, unit: str):
+        self.engine = engine
+        self.unit = unit
+        self.spent = 0.0
+
+    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, float], str]:
+        self.spent += getattr(limit, self.unit) if limit is not None else runtime
+        return self.engine.q_values(board, candidate_actions, multipv=multipv, runtime=runtime, limit=limit)
+
+def _budget_unit(runtime: float, limit: chess.engine.Limit | None) -> tuple[str, float]:
+    if limit is None:
+        return "time", runtime
+    if limit.nodes is not None:
+        return "nodes", limit.nodes
+    if limit.time is not None:
+        return "time", limit.time
+    raise ValueError("adaptive sweeps need a time or node limit")
+
+def _limit(unit: str, budget: float) -> chess.engine.Limit:
+    if unit == "nodes":
+        return chess.engine.Limit(nodes=max(1, int(budget)))
+    return chess.engine.Limit(time=budget)
+
+def _priority(saliency: float, previous: float | None) -> float:
+    """
+    Salient squares first, then the ones whose score is least settled: the
+    change since the previous budget, or the distance from a clear 0/1 after
+    the first round
+    """
+    uncertainty = min(saliency, 1 - saliency) if previous is None else abs(saliency - previous)
+    return saliency + max(uncertainty, 0.0)
+
+def adaptive_sarfa_saliency(engine: Engine, fen: str, action: chess.Move | None = None, runtime: float = 2.0, limit: chess.engine.Limit | None = None, initial_fraction: float = 1 / 9, budget_fraction: float = 0.5, eta: int = 3, perturber_class: type[Perturber] = RemovalPerturber) -> AdaptiveSaliencyResult:
+    """
+    Params
+    - runtime / limit: full per-search budget, the one a uniform sweep would use (time or node limit)
+    - initial_fraction: float (budget of the first round relative to the full budget, a power of 1/eta)
+    - budget_fraction: float (cap on the total budget relative to a uniform sweep)
+    - eta: int (only 1/eta of the squares of a round are searched again, at eta times the budget)
+    """
+    board = chess.Board(fen)
+    unit, full_budget = _budget_unit(runtime, limit)
+    meter = _BudgetMeter(engine, unit)
+
+    perturbations = list(perturber_class(board).process())
+    uniform_cost = full_budget * (len(perturbations) + 1)
+    cap = budget_fraction * uniform_cost
+
+    saliency: dict[str, float] = {}
+    budget: dict[str, float] = {}
+    previous: dict[str, float] = {}
+    history: list[dict[str, float]] = []
+
+    # the original board is searched once at the full budget, the rounds only change the perturbed searches
+    saliency_calculator = SarfaBaseline(meter, board, runtime=runtime, limit=_limit(unit, full_budget))
+
+    round_budget = full_budget * initial_fraction
+    candidates = perturbations
+    rounds = 0
+    while candidates:
+        # one search per candidate, shrink the round to fit the cap
+        affordable = math.floor((cap - meter.spent) / round_budget)
+        if rounds > 0 and affordable < len(candidates):
+            candidates = candidates[:max(affordable, 0)]
+            if not candidates:
+                break
+
+        saliency_calculator.limit = _limit(unit, round_budget)
+        round_saliency = {}
+        searched = []
+        for perturbed_board, perturbed_position_str in candidates:
+            result = saliency_calculator.compute(perturbed_board, action)
+            round_saliency[perturbed_position_str] = result.saliency
+            budget[perturbed_position_str] = round_budget
+            # base cases don't depend on the search budget
+            if result.dP != EPSILON:
+                searched.append((perturbed_board, perturbed_position_str))
+
+        for position_str, value in round_saliency.items():
+            if position_str in saliency:
+                previous[position_str] = saliency[position_str]
+            saliency[position_str] = value
+        history.append(round_saliency)
+        rounds += 1
+
+        round_budget *= eta
+        if round_budget > full_budget * (1 + 1e-9):
+            break
+
+        searched.sort(key=lambda item: (-_priority(saliency[item[1]], previous.get(item[1])), item[1]))
+        candidates = searched[:math.ceil(len(searched) / eta)]
+
+    return AdaptiveSaliencyResult(
+        saliency=saliency,
+        budget=budget,
+        spent=meter.spent,
+        uniform_cost=uniform_cost,
+        rounds=rounds,
+        history=history,
+    )
@@ -0,0 +1,349 @@
+"""
+Saliency algorithms from the experiment notebooks, packaged so they can be
+benchmarked and served outside of Jupyter.
+
+All of them take the engine as their first argument so any object with the
+`Engine.q_values` contract (Engine, QValueDispatcher, FakeEngine, ...) can be used.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+
+import chess
+import chess.engine
+import numpy as np
+from scipy.special import softmax
+from scipy.stats import entropy
+
+from .engine import Engine
+from .perturbation_handler import RemovalPerturber, AddPerturber
+from .saliency_calculator import SarfaBaseline, SarfaComputeResult
+from .utils import get_all_pos, dfs
+
+def sarfa_baseline_saliency(engine: Engine, fen: str, action: chess.Move | None = None, runtime: float = 2.0, limit: chess.engine.Limit | None = None) -> dict[str, float]:
+    """
+    SARFA with removal perturbations (`sarfa_baseline.ipynb`)
+    """
+    board = chess.Board(fen)
+
+    saliency_results: dict[str, float] = defaultdict(int)
+    perturber = RemovalPerturber(board)
+    saliency_calculator = SarfaBaseline(engine, board, runtime=runtime, limit=limit)
+    # one engine search per distinct perturbed board
+    for perturbed_position_str, saliency_result in perturber.score_unique(lambda perturbed_board: saliency_calculator.compute(perturbed_board, action)):
+        saliency_results[perturbed_position_str] = saliency_result.saliency
+
+    return saliency_results
+
+@dataclass()
+class MultiActionSaliency:
+    actions: list[str] # best first when chosen from the engine's q-values
+    saliency: np.ndarray # (actions, 64) indexed by chess square, 0 where nothing was perturbed
+    perturbed: np.ndarray # (64,) bool, the squares the sweep perturbed
+
+    def saliency_map(self, action: str) -> dict[str, float]:
+        """
+        Every perturbed square, including those with 0 saliency, like `sarfa_baseline_saliency`
+        """
+        row = self.saliency[self.actions.index(str(action))]
+        return {chess.square_name(square): float(row[square]) for square in np.flatnonzero(self.perturbed)}
+
+    def contrastive(self, action: str, alternative: str) -> dict[str, float]:
+        """
+        Why `action` and not `alternative`: positive where the square matters more for `action`
+        """
+        difference = self.saliency[self.actions.index(str(action))] - self.saliency[self.actions.index(str(alternative))]
+        return {chess.square_name(square): float(difference[square]) for square in np.flatnonzero(self.perturbed)}
+
+    def contrastive_maps(self) -> dict[tuple[str, str], np.ndarray]:
+        """
+        (64,) difference maps for every ordered pair of actions
+        """
+        return {
+            (action, alternative): self.saliency[i] - self.saliency[j]
+            for i, action in enumerate(self.actions)
+            for j, alternative in enumerate(self.actions)
+            if i != j
+        }
+
+def multi_action_saliency(engine: Engine, fen: str, actions: list[chess.Move] | None = None, top_k: int = 3, runtime: float = 2.0, limit: chess.engine.Limit | None = None) -> MultiActionSaliency:
+    """
+    SARFA saliency of several actions (the engine's top `top_k` by default)
+    from a single removal sweep, one engine search per perturbed board
+    """
+    board = chess.Board(fen)
+    saliency_calculator = SarfaBaseline(engine, board, runtime=runtime, limit=limit)
+    if actions is None:
+        ranked = sorted(saliency_calculator.q_vals_original_board.items(), key=lambda item: (-item[1], item[0]))
+        actions = [chess.Move.from_uci(move) for move, _ in ranked[:top_k]]
+
+    action_strs = [str(action) for action in actions]
+    saliency = np.zeros((len(actions), 64), dtype=np.float32)
+    perturbed = np.zeros(64, dtype=bool)
+    for perturbed_position_str, results in RemovalPerturber(board).score_unique(lambda perturbed_board: saliency_calculator.compute_actions(perturbed_board, actions)):
+        square = chess.parse_square(perturbed_position_str)
+        perturbed[square] = True
+        for i, action in enumerate(action_strs):
+            saliency[i, square] = results[action].saliency
+
+    return MultiActionSaliency(actions=action_strs, saliency=saliency, perturbed=perturbed)
+
+def empty_spaces_saliency(engine: Engine, fen: str, action: chess.Move | None = None, runtime: float = 2.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, float], chess.Move]:
+    """
+    SARFA with additive pawn perturbations on the empty squares (`sarfa_empty_spaces.ipynb`)
+    """
+    board = chess.Board(fen)
+
+    saliency_results: dict[str, float] = defaultdict(int)
+    perturber = AddPerturber(board)
+    saliency_calculator = SarfaBaseline(engine, board, runtime=runtime, limit=limit)
+    optimal_move_original_board = action
+
+    for perturbed_position_str, sarfa_compute_result in perturber.score_unique(lambda perturbed_board: saliency_calculator.compute(perturbed_board, action)):
+        saliency = sarfa_compute_result.saliency
+        optimal_move = sarfa_compute_result.optimal_move
+
+        if (optimal_move_original_board == None and optimal_move != None):
+            optimal_move_original_board = chess.Move.from_uci(str(optimal_move))
+
+        saliency_results[perturbed_position_str] = saliency
+
+    return saliency_results, optimal_move_original_board
+
+def offense_defense_saliency(engine: Engine, fen: str, action: chess.Move | None = None, runtime: float = 2.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, tuple[str, float]], chess.Move]:
+    """
+    SARFA that labels every salient piece as offensive or defensive (`sarfa_offense_defense.ipynb`)
+    """
+    board = chess.Board(fen)
+
+    saliency_results: dict[str, tuple[str, float]] = defaultdict(int)
+    perturber = RemovalPerturber(board)
+    saliency_calculator = SarfaBaseline(engine, board, runtime=runtime, limit=limit)
+    optimal_move_original_board = action
+
+    for perturbed_position_str, sarfa_compute_result in perturber.score_unique(lambda perturbed_board: saliency_calculator.compute(perturbed_board, action, allow_defense=True)):
+        saliency = sarfa_compute_result.saliency
+        dP = sarfa_compute_result.dP
+        optimal_move = sarfa_compute_result.optimal_move
+
+        if (optimal_move_original_board == None and optimal_move != None):
+            optimal_move_original_board = chess.Move.from_uci(str(optimal_move))
+
+        saliency_type = ""
+        if dP < 0:
+            saliency_type = "defensive"
+            saliency = abs(saliency)
+        else:
+            saliency_type = "offensive"
+
+        saliency_results[perturbed_position_str] = [saliency_type, saliency]
+
+    return saliency_results, optimal_move_original_board
+
+def sequential_steps(engine: Engine, fen: str, depth: int = 3, runtime: float = 2.0, limit: chess.engine.Limit | None = None) -> tuple[list[dict[str, float]], list[tuple[dict[str, float], chess.Board]], list[chess.Move]]:
+    """
+    Engine stage of sequential SARFA: runs SARFA along the engine's principal
+    line without discounting.
+
+    Returns the undiscounted saliency of every timestep mapped back to the
+    squares of the original board, the saliency map and board of every
+    timestep and the moves taken.
+    """
+    saliency_results_original_per_step = []
+    saliency_results_per_step = []
+    moves_taken = []
+    board = chess.Board(fen)
+
+    perturber = RemovalPerturber(board)
+
+    current_to_original_pos_mapping = {pos: pos for pos in get_all_pos()}
+
+    for curr_step in range(0, depth):
+        saliency_calculator = SarfaBaseline(engine, board, runtime=runtime, limit=limit)
+
+        optimal_move, optimal_move_q = None, 0
+        saliency_results_timestep = defaultdict(int)
+        saliency_results_original = defaultdict(int)
+
+        for perturbed_position_str, sarfa_compute_result in perturber.score_unique(lambda perturbed_board: saliency_calculator.compute(perturbed_board, None)):
+
+            # update the optimal action for this depth
+            # don't take an action that is coming from perturbation
+            # leading to check
+            if sarfa_compute_result.optimal_move_q_val != float("inf") and \
+                (not optimal_move or sarfa_compute_result.optimal_move_q_val > optimal_move_q):
+                optimal_move = sarfa_compute_result.optimal_move
+                optimal_move_q = sarfa_compute_result.optimal_move_q_val
+
+            # update original board position saliency for the result
+            perturbed_position_original_str = current_to_original_pos_mapping[perturbed_position_str]
+            saliency_results_original[perturbed_position_original_str] += sarfa_compute_result.saliency
+
+            # make a copy that is used for visualizing timestamp saliencing
+            saliency_results_timestep[perturbed_position_str] += sarfa_compute_result.saliency
+        saliency_results_original_per_step.append(dict(saliency_results_original))
+        if not optimal_move:
+            # no valid move found
+            break
+        saliency_results_per_step.append((saliency_results_timestep.copy(), board.copy()))
+
+        # take optimal action on the current board
+        # use this new board is the action for next iteration
+        optimal_move_obj = chess.Move.from_uci(optimal_move)
+        moves_taken.append(optimal_move_obj)
+        board.push(optimal_move_obj)
+
+        # update mapping
+        if (not board.is_game_over()):
+            start_move_pos = optimal_move[0:2]
+            end_move_pos = optimal_move[2:4]
+            current_to_original_pos_mapping[end_move_pos] = current_to_original_pos_mapping[start_move_pos]
+        else:
+            # game finished early
+            break
+
+    return saliency_results_original_per_step, saliency_results_per_step, moves_taken
+
+def discount_steps(saliency_per_step: list[dict[str, float]], discount_factor: float = 0.9) -> dict[str, float]:
+    """
+    Scoring stage of sequential SARFA: discounted sum of the timestep saliencies
+    """
+    saliency_results: dict[str, float] = defaultdict(int)
+    for curr_step, saliency_results_original in enumerate(saliency_per_step):
+        for position, saliency in saliency_results_original.items():
+            saliency_results[position] += (saliency * (discount_factor ** curr_step))
+    return saliency_results
+
+def sequential_saliency(engine: Engine, fen: str, discount_factor: float = 0.9, depth: int = 3, runtime: float = 2.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, float], list[tuple[dict[str, float], chess.Board]], list[chess.Move]]:
+    """
+    Sequential SARFA: runs SARFA along the engine's principal line and
+    discounts the saliency of later timesteps (`sequential_sarfa.ipynb`)
+
+    Returns the combined saliency map, the saliency map and board of every
+    timestep and the moves taken.
+    """
+    saliency_per_step, saliency_results_per_step, moves_taken = sequential_steps(engine, fen, depth=depth, runtime=runtime, limit=limit)
+    return discount_steps(saliency_per_step, discount_factor), saliency_results_per_step, moves_taken
+
+def get_pairwise_sensitivity(perturbation_to_qvals: dict[str, tuple[dict[str, float], dict[str, float]]], compare_q_vals: bool) -> dict[tuple[str, str], float]:
+    """
+    With the perturbed q-values, get the pairwise_sensitivity between all combination of pieces
+    """
+    pairwise_sensitivity = {}
+    all_pieces_removed = perturbation_to_qvals.keys()
+
+    for piece_1 in all_pieces_removed:
+        for piece_2 in all_pieces_removed:
+            if (piece_1 != piece_2):
+                valid_actions_perturb_1 = set(perturbation_to_qvals[piece_1][0].keys())
+                valid_actions_perturb_2 = set(perturbation_to_qvals[piece_2][0].keys())
+                intersection_actions = valid_actions_perturb_1.intersection(valid_actions_perturb_2)
+
+                curr_sensitivity = 0
+                if (compare_q_vals):
+                    # Directly compares Q-val distribution
+                    for action in intersection_actions:
+                        delta_1 = perturbation_to_qvals[piece_1][1][action] - perturbation_to_qvals[piece_1][0][action]
+                        delta_2 = perturbation_to_qvals[piece_2][1][action] - perturbation_to_qvals[piece_2][0][action]
+                        curr_sensitivity += abs(delta_1-delta_2)
+
+                else:
+                    # KL-divergence of action distribution (softmax of q-vals)
+                    distribution_1_after = [perturbation_to_qvals[piece_1][1][action] for action in intersection_actions]
+                    distribution_2_after = [perturbation_to_qvals[piece_2][1][action] for action in intersection_actions]
+
+                    distribution_1_after = softmax(np.array(distribution_1_after))
+                    distribution_2_after = softmax(np.array(distribution_2_after))
+
+                    curr_sensitivity = entropy(distribution_1_after, distribution_2_after)
+
+                pairwise_sensitivity[(piece_1, piece_2)] = curr_sensitivity
+
+    return pairwise_sensitivity
+
+def filter_pairwise_sensitivity(pairwise_sensitivity: dict[tuple[str, str], float], use_percentile=True, use_topk=False, percentile=10, topk=10) -> list[tuple[str, str]] | None:
+    """
+    Select the most important pairs of pieces (relationships) based off the pairwise sensitivity values.
+    """
+    if (not use_percentile and not use_topk):
+        return None
+    pairwise_sensitivity_list = list(pairwise_sensitivity.items())
+    values = [x[1] for x in pairwise_sensitivity_list]
+
+    if (use_percentile):
+        bottom_percentile = np.percentile(values, percentile)
+        bottom_percentile_pairs = [item[0] for item in pairwise_sensitivity_list if item[1] <= bottom_percentile]
+        return bottom_percentile_pairs
+    elif (use_topk):
+        pairwise_sensitivity_list.sort(key=lambda x: x[1])
+        top_k_matches = [item[0] for item in pairwise_sensitivity_list[0:topk]]
+        return top_k_matches
+
+def find_groups_important_relationships(most_related_pairs: list[tuple[str, str]], visualize: bool = False) -> list[list[str]] | None:
+    # check if there is any pairs at all
+    if (not most_related_pairs):
+        return None
+
+    # create graph of important pairs
+    graph = {}
+    for pos1, pos2 in most_related_pairs:
+        if (pos1 not in graph):
+            graph[pos1] = []
+        if (pos2 not in graph):
+            graph[pos2] = []
+        graph[pos1].append(pos2)
+        graph[pos2].append(pos1)
+
+    if visualize:
+        from .utils import visualize_directed_graph
+        visualize_directed_graph(graph)
+
+    # find connected nodes in the graph
+    important_groups = []
+    visited_set = set()
+    for curr_node in graph:
+        if (curr_node in visited_set):
+            continue
+        else:
+            curr_visited_set = visited_set.copy()
+            dfs(curr_node, graph, visited_set)
+            important_groups.append(list(visited_set-curr_visited_set))
+    return important_groups
+
+def pairs_q_values(engine: Engine, fen: str, runtime: float = 3.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, tuple[dict[str, float], dict[str, float]]], chess.Move | None]:
+    """
+    Engine stage of PaIRS: the (original, perturbed) q-values of every removal perturbation
+    """
+    board = chess.Board(fen)
+
+    perturbation_to_qvals: dict[str, tuple[dict[str, float], dict[str, float]]] = {}
+    perturber = RemovalPerturber(board)
+    q_val_calculator = SarfaBaseline(engine, board, runtime=runtime, limit=limit)
+    optimal_move_original_board = None
+
+    # get the q values for each perturbation
+    for perturbed_position_str, (q_vals_original_board_common, q_vals_perturbed_board, optimal_move) in perturber.score_unique(q_val_calculator.compute_q_values):
+
+        if (optimal_move_original_board == None):
+            optimal_move_original_board = chess.Move.from_uci(optimal_move)
+
+        perturbation_to_qvals[perturbed_position_str] = (q_vals_original_board_common, q_vals_perturbed_board)
+
+    return perturbation_to_qvals, optimal_move_original_board
+
+def pairs_important_groups(engine: Engine, fen: str, compare_q_vals=True, use_percentile=True, use_topk=False, percentile=10, topk=10, runtime: float = 3.0, limit: chess.engine.Limit | None = None, visualize: bool = False) -> tuple[list[list[str]] | None, chess.Move | None]:
+    """
+    Pairwise Importance for RL Sensitivity (`pairs_groups.ipynb`)
+    """
+    perturbation_to_qvals, optimal_move_original_board = pairs_q_values(engine, fen, runtime=runtime, limit=limit)
+
+    # get pairwise sensitivity values among pieces
+    pairwise_sensitivity = get_pairwise_sensitivity(perturbation_to_qvals=perturbation_to_qvals, compare_q_vals=compare_q_vals)
+
+    # get the most important pairs among pieces
+    most_related_pairs = filter_pairwise_sensitivity(pairwise_sensitivity, use_percentile=use_percentile, use_topk=use_topk, percentile=percentile, topk=topk)
+
+    # get the most important groups among pieces
+    important_groups = find_groups_important_relationships(most_related_pairs, visualize=visualize)
+
+    return important_groups, optimal_move_original_board
@@ -0,0 +1,224 @@
+"""
+Batch rendering of explanations into PNGs and contact sheets.
+
+Every job renders through its own drawing file, so a process pool renders
+many boards at once. Finished boards are tiled with their names into contact
+sheets, also in the pool.
+
+```python
+jobs = [RenderJob(fen, saliency, move, style="heatmap", name="b0_raw"), ...]
+report = render_batch(jobs, "output/renders", processes=8, columns=6, rows=4)
+report.paths, report.sheets, report.images_per_second
+```
+
+`style` selects the visualization:
+- "heatmap": `BoardVisualization`, saliency is {square: value}
+- "offense_defense": `OffenseDefenseBoardVisualization`, saliency is {square: ("offensive" | "defensive", value)}
+- "pairs": `PairsBoardVisualization`, saliency is a list of square groups
+
+```bash
+python -m sarfa.batch_render --store output/results --algorithm sarfa_baseline --output output/renders --processes 8
+python -m sarfa.batch_render --jobs jobs.jsonl --output output/renders # one JSON job per line
+```
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+import chess
+import cv2
+import numpy as np
+
+from .visualization import BoardVisualization, OffenseDefenseBoardVisualization, PairsBoardVisualization
+
+STYLES = {
+    "heatmap": BoardVisualization,
+    "offense_defense": OffenseDefenseBoardVisualization,
+    "pairs": PairsBoardVisualization,
+}
+CAPTION_HEIGHT = 24
+
+@dataclass()
+class RenderJob:
+    fen: str
+    saliency: Any
+    move: chess.Move | str | None = None
+    style: str = "heatmap"
+    name: str = ""
+
+    def to_dict(self) -> dict[str, Any]:
+        move = self.move.uci() if isinstance(self.move, chess.Move) else self.move
+        return {"fen": self.fen, "saliency": self.saliency, "move": move, "style": self.style, "name": self.name}
+
+@dataclass()
+class RenderReport:
+    paths: list[str] = field(default_factory=list)
+    sheets: list[str] = field(default_factory=list)
+    failures: list[tuple[str, str]] = field(default_factory=list)
+    render_seconds: float = 0.0
+    sheet_seconds: float = 0.0
+
+    @property
+    def images_per_second(self) -> float:
+        return len(self.paths) / self.render_seconds if self.render_seconds else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.paths)} images in {self.render_seconds:.1f}s ({self.images_per_second:.1f}/s), "
+            f"{len(self.sheets)} contact sheets in {self.sheet_seconds:.1f}s, {len(self.failures)} failures"
+        )
+
+def _file_name(job: RenderJob, index: int) -> str:
+    name = job.name or f"{index:06d}_{job.style}"
+    return re.sub(r"[^\w.-]", "_", name) + ".png"
+
+def render_job(job: RenderJob, path: str, drawing_directory: str | None = None) -> str:
+    """
+    Renders one job to `path` through a private drawing file
+    """
+    if job.style not in STYLES:
+        raise ValueError(f"Unknown style {job.style!r}, expected one of {sorted(STYLES)}")
+    move = chess.Move.from_uci(job.move) if isinstance(job.move, str) else job.move
+
+    with tempfile.TemporaryDirectory(dir=drawing_directory) as directory:
+        visualization = STYLES[job.style](chess.Board(job.fen), drawing_file=os.path.join(directory, "board"))
+        os.replace(visualization.show_heatmap(job.saliency, move), path)
+    return path
+
+def _render_task(task: tuple[int, RenderJob, str]) -> tuple[int, str | None, str | None]:
+    index, job, path = task
+    try:
+        return index, render_job(job, path), None
+    except Exception as e:
+        return index, None, f"{type(e).__name__}: {e}"
+
+def contact_sheet(paths: list[str], names: list[str], path: str, columns: int = 6) -> str:
+    """
+    Tiles the images row by row with their names underneath
+    """
+    tiles = [cv2.imread(image_path) for image_path in paths]
+    height = max(tile.shape[0] for tile in tiles)
+    width = max(tile.shape[1] for tile in tiles)
+    rows = -(-len(tiles) // columns)
+    sheet = np.full((rows * (height + CAPTION_HEIGHT), columns * width, 3), 255, dtype=np.uint8)
+    for i, (tile, name) in enumerate(zip(tiles, names)):
+        top = (i // columns) * (height + CAPTION_HEIGHT)
+        left = (i % columns) * width
+        sheet[top:top + tile.shape[0], left:left + tile.shape[1]] = tile
+        cv2.putText(sheet, name[:48], (left + 5, top + height + CAPTION_HEIGHT - 7), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 1)
+    cv2.imwrite(path, sheet)
+    return path
+
+def _sheet_task(task: tuple[list[str], list[str], str, int]) -> str:
+    return contact_sheet(*task)
+
+def render_batch(jobs: Iterable[RenderJob], output_dir: str, processes: int | None = None, columns: int = 6, rows: int = 4, chunksize: int = 4, verbose: bool = False) -> RenderReport:
+    """
+    Renders every job into `output_dir` and tiles them `columns` x `rows` per
+    contact sheet into `output_dir/sheets` (rows=0 skips the sheets)
+
+    Params
+    - processes: int (pool size, defaults to the number of CPUs, 1 renders in this process)
+    """
+    jobs = list(jobs)
+    tasks = [(i, job, os.path.join(output_dir, _file_name(job, i))) for i, job in enumerate(jobs)]
+    paths: dict[str, int] = {}
+    for i, _, path in tasks:
+        if path in paths:
+            raise ValueError(f"jobs {paths[path]} and {i} both render to {path}, give them distinct names")
+        paths[path] = i
+    os.makedirs(output_dir, exist_ok=True)
+    report = RenderReport()
+    rendered: dict[int, str] = {}
+
+    pool = multiprocessing.Pool(processes) if processes != 1 else None
+    try:
+        start = time.perf_counter()
+        results = pool.imap_unordered(_render_task, tasks, chunksize) if pool else map(_render_task, tasks)
+        for done, (index, path, error) in enumerate(results, 1):
+            if error is None:
+                rendered[index] = path
+            else:
+                report.failures.append((jobs[index].name or str(index), error))
+            if verbose and done % 100 == 0:
+                print(f"{done}/{len(tasks)} rendered")
+        report.render_seconds = time.perf_counter() - start
+        report.paths = [rendered[index] for index in sorted(rendered)]
+
+        if rows > 0 and report.paths:
+            start = time.perf_counter()
+            sheet_dir = os.path.join(output_dir, "sheets")
+            os.makedirs(sheet_dir, exist_ok=True)
+            per_sheet = columns * rows
+            ordered = sorted(rendered)
+            sheet_tasks = [
+                (
+                    [rendered[index] for index in ordered[first:first + per_sheet]],
+                    [jobs[index].name or str(index) for index in ordered[first:first + per_sheet]],
+                    os.path.join(sheet_dir, f"sheet_{first // per_sheet:04d}.png"),
+                    columns,
+                )
+                for first in range(0, len(ordered), per_sheet)
+            ]
+            report.sheets = pool.map(_sheet_task, sheet_tasks) if pool else list(map(_sheet_task, sheet_tasks))
+            report.sheet_seconds = time.perf_counter() - start
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return report
+
+def jobs_from_store(store, algorithm: str | None = None, config: dict | None = None) -> list[RenderJob]:
+    """
+    One heatmap job per stored saliency map of the latest run of `algorithm`
+    in a `chess_dataset.ResultStore`, or of every run without an algorithm.
+    The store only keeps {square: value} maps, offense/defense labels and
+    pairs are not stored. Names carry the config and run ids, so maps of
+    different runs don't collide.
+    """
+    rows = store.select(algorithm=algorithm, config=config, run=-1 if algorithm is not None else None)
+    jobs = []
+    for row in rows:
+        result = store.row(row)
+        puzzle = f"p{result.puzzle}" if result.puzzle >= 0 else f"r{row}"
+        name = f"{puzzle}_{result.algorithm}_c{int(store.column('config')[row])}_run{int(store.column('run')[row])}"
+        jobs.append(RenderJob(result.fen, result.saliency, result.action, style="heatmap", name=name))
+    return jobs
+
+def jobs_from_jsonl(path: str) -> list[RenderJob]:
+    with open(path) as f:
+        return [RenderJob(**json.loads(line)) for line in f if line.strip()]
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Render explanations into PNGs and contact sheets")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--store", help="result store directory")
+    source.add_argument("--jobs", help="JSON lines file of jobs (fen, saliency, move, style, name)")
+    parser.add_argument("--algorithm", help="only the latest run of this algorithm in the store")
+    parser.add_argument("--output", default="output/renders")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--columns", type=int, default=6)
+    parser.add_argument("--rows", type=int, default=4, help="rows per contact sheet, 0 skips the sheets")
+    args = parser.parse_args(argv)
+
+    if args.store:
+        from chess_dataset.result_store import ResultStore
+
+        jobs = jobs_from_store(ResultStore(args.store), algorithm=args.algorithm)
+    else:
+        jobs = jobs_from_jsonl(args.jobs)
+
+    report = render_batch(jobs, args.output, processes=args.processes, columns=args.columns, rows=args.rows, verbose=True)
+    for name, error in report.failures[:10]:
+        print(f"failed {name}: {error}")
+    print(report.summary())
+
+if __name__ == "__main__":
+    main()
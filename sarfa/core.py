@@ -7,6 +7,8 @@ import numpy as np
 from scipy.stats import entropy, wasserstein_distance
 from scipy.spatial.distance import jensenshannon
 
+from . import profiling
+
 def your_softmax(x):
     """Compute softmax values for each sets of scores in x."""
     e_x = np.exp(x - np.max(x))
@@ -47,6 +49,7 @@ def cross_entropy(dictP, dictQ, original_action):
     return 1./(KL + 1.)
 
 
+@profiling.profiled("core.sarfa_score")
 def computeSaliencyUsingSarfa(original_action: str, dict_q_vals_before_perturbation: dict[str, float], dict_q_vals_after_perturbation: dict[str, float], allow_defense_check=False):
     answer = 0
     
@@ -0,0 +1,134 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, asdict
+from typing import Hashable, Iterable
+
+import chess
+import chess.engine
+
+from . import profiling
+from .engine import Engine
+from .perturbation_handler import position_hash
+
+@dataclass()
+class DispatchStats:
+    requests: int = 0
+    engine_calls: int = 0
+    cache_hits: int = 0
+    coalesced: int = 0 # requests that waited on an identical in-flight call
+
+    @property
+    def dedup_ratio(self) -> float:
+        """
+        Fraction of requests that were answered without a new engine call
+        """
+        if self.requests == 0:
+            return 0.0
+        return 1 - self.engine_calls / self.requests
+
+    def summary(self) -> dict[str, float]:
+        return {**asdict(self), "dedup_ratio": self.dedup_ratio}
+
+class QValueDispatcher:
+    """
+    Drop-in replacement for `Engine` that sits between the perturbers and
+    `Engine.q_values`. Every request is canonicalised to
+    (Zobrist hash, candidate move set, multipv, limit) so identical positions
+    coming from different perturbation strategies, saliency calculators or
+    FENs only run one engine search. Concurrent identical requests wait on
+    the in-flight call and all receive its result.
+
+    ```python
+    dispatcher = QValueDispatcher(Engine("./stockfish_15_x64_avx2"))
+    saliency_calculator = SarfaBaseline(dispatcher, board)
+    ...
+    dispatcher.stats.dedup_ratio
+    ```
+    """
+
+    def __init__(self, engine: Engine, cache_size: int | None = 100_000):
+        """
+        Params
+        - engine: Engine (or anything with the `q_values` contract)
+        - cache_size: int (number of finished results kept, None keeps everything, 0 only coalesces in-flight calls)
+        """
+        self.engine = engine
+        self.cache_size = cache_size
+        self.stats = DispatchStats()
+
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[Hashable, tuple[dict[str, float], str]] = OrderedDict()
+        self._in_flight: dict[Hashable, Future] = {}
+
+    @staticmethod
+    def request_key(board: chess.Board, candidate_actions: Iterable[chess.Move], multipv: int, runtime: float, limit: chess.engine.Limit | None = None) -> Hashable:
+        if limit is None:
+            limit_key = ("time", runtime)
+        else:
+            limit_key = (limit.time, limit.depth, limit.nodes, limit.mate)
+        actions_key = frozenset(str(action) for action in candidate_actions)
+        return position_hash(board), actions_key, multipv, limit_key
+
+    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, float], str]:
+        """
+        Same contract as `Engine.q_values`
+        """
+        with profiling.span("dispatch.q_values") as span_attrs:
+            return self._dispatch(board, candidate_actions, multipv, runtime, limit, span_attrs)
+
+    def _dispatch(self, board, candidate_actions, multipv, runtime, limit, span_attrs) -> tuple[dict[str, float], str]:
+        key = self.request_key(board, candidate_actions, multipv, runtime, limit)
+
+        with self._lock:
+            self.stats.requests += 1
+            if key in self._cache:
+                self.stats.cache_hits += 1
+                span_attrs["outcome"] = "cache_hit"
+                self._cache.move_to_end(key)
+                scores, optimal_action = self._cache[key]
+                return dict(scores), optimal_action
+
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.stats.coalesced += 1
+
+        if not is_owner:
+            span_attrs["outcome"] = "coalesced"
+            scores, optimal_action = future.result()
+            return dict(scores), optimal_action
+
+        span_attrs["outcome"] = "engine"
+        try:
+            result = self.engine.q_values(board, candidate_actions, multipv=multipv, runtime=runtime, limit=limit)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            self.stats.engine_calls += 1
+            self._store(key, result)
+        future.set_result(result)
+
+        scores, optimal_action = result
+        return dict(scores), optimal_action
+
+    def _store(self, key: Hashable, result: tuple[dict[str, float], str]):
+        if self.cache_size == 0:
+            return
+        self._cache[key] = result
+        if self.cache_size is not None:
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.stats = DispatchStats()
@@ -1,22 +1,109 @@
+import json
+import os
+import shutil
+import threading
+import time
 import chess
 import chess.engine
 from collections import defaultdict
+from dataclasses import dataclass, asdict, field
+from typing import Any
+
+from . import profiling
+
+STOCKFISH_PATHS = ["./stockfish_15_x64_avx2", "stockfish"]
+# best (processes x Threads x Hash) layout written by `python -m sarfa.tuning`
+LAYOUT_PATH = os.environ.get("SARFA_ENGINE_LAYOUT", "output/engine_layout.json")
+
+@dataclass()
+class EngineLayout:
+    engine: str # engine spec the layout was calibrated for
+    processes: int
+    threads: int
+    hash_mb: int
+    measurements: dict[str, Any] = field(default_factory=dict)
+
+    def engine_options(self) -> dict[str, int]:
+        return {"Threads": self.threads, "Hash": self.hash_mb}
+
+def save_layout(layout: EngineLayout, path: str = LAYOUT_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(asdict(layout), f, indent=2)
+
+def load_layout(engine_spec: str | None = None, path: str = LAYOUT_PATH) -> EngineLayout | None:
+    """
+    The persisted layout, None if there is none or it was calibrated for another engine
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        layout = EngineLayout(**json.load(f))
+    if engine_spec is not None and layout.engine != engine_spec:
+        return None
+    return layout
 
 class Engine:
-    def __init__(self, engine_path: str):
+    def __init__(self, engine_path: str | list[str], options: dict[str, Any] | None = None):
         """
         Params
-        - engine_path: str (expecting path to the 'stockfish_15_x64_avx2' file)
+        - engine_path: str (expecting path to the 'stockfish_15_x64_avx2' file, or a command list such as `fake_engine_command()`)
+        - options: dict (UCI options such as {"Threads": 4, "Hash": 64})
         """
         self.engine_path = engine_path
-        self.chess_engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+        self.options = dict(options or {})
+        self.chess_engine = self._open()
+        # one search at a time, makes the time spent waiting for the engine measurable
+        self._lock = threading.Lock()
+
+    def _open(self) -> chess.engine.SimpleEngine:
+        chess_engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+        if self.options:
+            chess_engine.configure(self.options)
+        return chess_engine
+
+    def _analyse(self, board: chess.Board, limit: chess.engine.Limit, multipv: int) -> list[chess.engine.InfoDict]:
+        return self.chess_engine.analyse(board, limit, multipv=multipv)
+
+    def close(self):
+        """
+        Quits the engine process, safe to call more than once
+        """
+        try:
+            self.chess_engine.quit()
+        except chess.engine.EngineTerminatedError:
+            pass
+
+    def __enter__(self) -> "Engine":
+        return self
 
-    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0) -> tuple[dict[str, float], str]:
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, float], str]:
         """
         Compute the q-values Q(s,a) for a given board
+
+        Params
+        - limit: chess.engine.Limit (optional, overrides `runtime` e.g. for node or depth limited search)
         """
-        
-        options = self.chess_engine.analyse(board, chess.engine.Limit(time=runtime), multipv=multipv)
+        if limit is None:
+            limit = chess.engine.Limit(time=runtime)
+
+        with profiling.span("engine.q_values", multipv=multipv) as span_attrs:
+            wait_start = time.perf_counter()
+            with self._lock:
+                search_start = time.perf_counter()
+                options = self._analyse(board, limit, multipv)
+                search_end = time.perf_counter()
+
+            span_attrs["wait_time"] = search_start - wait_start
+            span_attrs["search_time"] = search_end - search_start
+            if options:
+                span_attrs["depth"] = options[0].get("depth")
+                span_attrs["nodes"] = options[0].get("nodes")
+                span_attrs["nps"] = options[0].get("nps")
+
         score_per_move = defaultdict(lambda: float("-inf"))
 
         for option in options:
@@ -35,4 +122,43 @@ class Engine:
             score_per_move[curr_action] = score
         optimal_action: str = max(score_per_move, key=score_per_move.get)
         
-        return dict(score_per_move), optimal_action
\ No newline at end of file
+        return dict(score_per_move), optimal_action
+
+def find_stockfish() -> str | None:
+    for path in STOCKFISH_PATHS:
+        resolved = path if os.path.isfile(path) else shutil.which(path)
+        if resolved:
+            return resolved
+    return None
+
+def resolve_engine_spec(engine_spec: str) -> str:
+    if engine_spec == "auto":
+        return find_stockfish() or "fake"
+    return engine_spec
+
+def make_engine(engine_spec: str, options: dict[str, Any] | None = None, layout: bool = False):
+    """
+    "fake" for the in-process deterministic fake engine, "fake-uci" for the
+    same engine behind the UCI subprocess path (measures framework overhead),
+    "auto" for Stockfish when it can be found (falling back to "fake") or a
+    path to a UCI engine.
+
+    UCI engines are supervised (restarted after a crash or hang, see
+    `sarfa.supervisor`) and get `options`. With `layout` and no `options`
+    they get the Threads/Hash of the calibrated layout for this engine when
+    there is one. It is opt-in because a multi-threaded search isn't
+    deterministic, even with a node limit.
+    """
+    engine_spec = resolve_engine_spec(engine_spec)
+    if engine_spec == "fake":
+        from .fake_engine import FakeEngine
+        return FakeEngine()
+
+    from .supervisor import SupervisedEngine
+    if options is None and layout:
+        calibrated = load_layout(engine_spec)
+        options = calibrated.engine_options() if calibrated else None
+    if engine_spec == "fake-uci":
+        from .fake_uci import fake_engine_command
+        return SupervisedEngine(fake_engine_command(), options)
+    return SupervisedEngine(engine_spec, options)
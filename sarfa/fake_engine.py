@@ -0,0 +1,126 @@
+"""
+Deterministic stand-in for Stockfish.
+
+Moves are scored with a one-ply material/mobility heuristic so results are
+identical on every machine and no engine binary is needed. Useful for
+CI-speed benchmark runs and for measuring framework overhead; the saliency
+maps it produces are not meaningful explanations.
+
+`FakeEngine` scores in-process, `sarfa.fake_uci` serves the same heuristic
+over UCI.
+"""
+
+import time
+
+import chess
+import chess.engine
+from collections import defaultdict
+
+from . import profiling
+
+PIECE_VALUES = {
+    chess.PAWN: 1,
+    chess.KNIGHT: 3,
+    chess.BISHOP: 3,
+    chess.ROOK: 5,
+    chess.QUEEN: 9,
+    chess.KING: 0,
+}
+MATE_SCORE = 40
+MOBILITY_WEIGHT = 0.05
+
+def material(board: chess.Board, color: chess.Color) -> int:
+    return sum(PIECE_VALUES[piece_type] * len(board.pieces(piece_type, color)) for piece_type in chess.PIECE_TYPES)
+
+def mobility(board: chess.Board, color: chess.Color) -> int:
+    """
+    Number of squares attacked by the pieces of `color`
+    """
+    return sum(len(board.attacks(square)) for square in chess.scan_forward(board.occupied_co[color]))
+
+def evaluate(board: chess.Board, color: chess.Color) -> float:
+    """
+    Static evaluation in pawns from the point of view of `color`
+    """
+    material_balance = material(board, color) - material(board, not color)
+    mobility_balance = mobility(board, color) - mobility(board, not color)
+    return material_balance + MOBILITY_WEIGHT * mobility_balance
+
+def hanging_threat(board: chess.Board, color: chess.Color) -> float:
+    """
+    Largest material gain available to the side to move by capturing a piece of
+    `color`, counting the capturing piece as lost when the target is defended.
+    """
+    threat = 0
+    for move in board.generate_legal_captures():
+        captured = board.piece_at(move.to_square)
+        if captured is None: # en passant
+            gain = PIECE_VALUES[chess.PAWN]
+        else:
+            gain = PIECE_VALUES[captured.piece_type]
+        if board.is_attacked_by(color, move.to_square):
+            gain -= PIECE_VALUES[board.piece_type_at(move.from_square)]
+        threat = max(threat, gain)
+    return threat
+
+def score_move(board: chess.Board, move: chess.Move) -> float:
+    """
+    Q-value of `move` on the same scale as `Engine.q_values` (pawns, mate = 40)
+    """
+    mover = board.turn
+    board.push(move)
+    try:
+        if board.is_checkmate():
+            return MATE_SCORE
+        if board.is_stalemate() or board.is_insufficient_material():
+            return 0.0
+        return round(evaluate(board, mover) - hanging_threat(board, mover), 2)
+    finally:
+        board.pop()
+
+def score_moves(board: chess.Board, moves=None) -> list[tuple[chess.Move, float]]:
+    """
+    Scores the moves (all legal moves by default), best first.
+    Ties are broken by the UCI string so the order is deterministic.
+    """
+    board = board.copy(stack=False)
+    if moves is None:
+        moves = board.legal_moves
+    scored = [(move, score_move(board, move)) for move in moves]
+    scored.sort(key=lambda item: (-item[1], item[0].uci()))
+    return scored
+
+class FakeEngine:
+    """
+    In-process replacement for `Engine` with the same `q_values` contract
+    """
+
+    def __init__(self, engine_path: str = "fake"):
+        self.engine_path = engine_path
+
+    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, float], str]:
+        with profiling.span("engine.q_values", multipv=multipv) as span_attrs:
+            search_start = time.perf_counter()
+            scored = score_moves(board)[:multipv]
+            span_attrs["wait_time"] = 0.0
+            span_attrs["search_time"] = time.perf_counter() - search_start
+            span_attrs["depth"] = 1
+            span_attrs["nodes"] = len(scored)
+
+        score_per_move = defaultdict(lambda: float("-inf"))
+        for move, score in scored:
+            if move not in candidate_actions:
+                continue
+            score_per_move[str(move)] = score
+        optimal_action: str = max(score_per_move, key=score_per_move.get)
+
+        return dict(score_per_move), optimal_action
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> "FakeEngine":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
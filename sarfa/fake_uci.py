@@ -0,0 +1,227 @@
+"""
+Pure-Python UCI engine on top of the deterministic `sarfa.fake_engine` heuristic.
+
+Supports multipv, searchmoves, depth/nodes/movetime (and clock) limits and an
+artificial per-iteration latency, so the whole `Engine` subprocess path, engine
+pools and caches can be load-tested without Stockfish:
+
+```bash
+python -m sarfa.fake_uci --latency 5
+```
+
+```python
+engine = Engine(fake_engine_command(latency=5))
+```
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+import chess
+
+from .fake_engine import MATE_SCORE, score_moves
+
+# deepest iteration reported when the search isn't limited by depth, nodes or time
+MAX_DEPTH = 20
+
+def fake_engine_command(latency: float = 0.0) -> list[str]:
+    """
+    Command that launches the UCI fake engine, for `Engine(...)`
+
+    Params
+    - latency: float (artificial milliseconds spent per search iteration)
+    """
+    return [sys.executable, "-m", "sarfa.fake_uci", "--latency", str(latency)]
+
+class UciFakeEngine:
+    """
+    Minimal UCI front end over `score_moves`.
+
+    Every search iteration ("depth") re-reports the same deterministic scores
+    and sleeps for the configured latency, so time, depth and node limits
+    behave like they would for a real engine while the results stay fixed.
+    """
+    NAME = "sarfa fake engine"
+    GO_VALUE_PARAMS = ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "mate")
+
+    def __init__(self, latency: float = 0.0, output=None):
+        """
+        Params
+        - latency: float (milliseconds per search iteration)
+        """
+        self.latency = latency
+        self.multipv = 1
+        self.board = chess.Board()
+        self.output = output if output is not None else sys.stdout
+
+        self._output_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._search_thread: threading.Thread | None = None
+
+    def send(self, line: str):
+        with self._output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self, input=None):
+        input = input if input is not None else sys.stdin
+        for line in input:
+            if not self.handle(line.strip()):
+                break
+        self._wait_for_search()
+
+    def handle(self, line: str) -> bool:
+        """
+        Handles one UCI command. Returns False when the engine should quit.
+        """
+        command, _, args = line.partition(" ")
+
+        if command == "uci":
+            self.send(f"id name {self.NAME}")
+            self.send("id author xAI-chess")
+            self.send("option name MultiPV type spin default 1 min 1 max 500")
+            self.send("option name Latency type spin default 0 min 0 max 60000")
+            self.send("option name Threads type spin default 1 min 1 max 1024")
+            self.send("option name Hash type spin default 16 min 1 max 33554432")
+            self.send("uciok")
+        elif command == "isready":
+            self._wait_for_search()
+            self.send("readyok")
+        elif command == "setoption":
+            self._set_option(args)
+        elif command == "ucinewgame":
+            self.board = chess.Board()
+        elif command == "position":
+            self._set_position(args)
+        elif command == "go":
+            self._wait_for_search()
+            self._stop.clear()
+            self._search_thread = threading.Thread(target=self._search, args=(args.split(),), daemon=True)
+            self._search_thread.start()
+        elif command == "stop":
+            self._stop.set()
+            self._wait_for_search()
+        elif command == "quit":
+            self._stop.set()
+            return False
+
+        return True
+
+    def _wait_for_search(self):
+        if self._search_thread is not None:
+            self._search_thread.join()
+            self._search_thread = None
+
+    def _set_option(self, args: str):
+        # setoption name <id> [value <x>]
+        name, _, value = args.removeprefix("name ").partition(" value ")
+        name = name.strip().lower()
+        if name == "multipv":
+            self.multipv = max(1, int(value))
+        elif name == "latency":
+            self.latency = float(value)
+
+    def _set_position(self, args: str):
+        tokens = args.split()
+        moves: list[str] = []
+        if "moves" in tokens:
+            index = tokens.index("moves")
+            tokens, moves = tokens[:index], tokens[index + 1:]
+
+        if tokens and tokens[0] == "fen":
+            self.board = chess.Board(" ".join(tokens[1:]))
+        else:
+            self.board = chess.Board()
+        for move in moves:
+            self.board.push_uci(move)
+
+    def _parse_go(self, tokens: list[str]) -> tuple[dict[str, int], list[chess.Move], bool]:
+        params: dict[str, int] = {}
+        searchmoves: list[chess.Move] = []
+        infinite = False
+
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token in self.GO_VALUE_PARAMS and i + 1 < len(tokens):
+                params[token] = int(tokens[i + 1])
+                i += 2
+                continue
+            if token == "infinite":
+                infinite = True
+            elif token == "searchmoves":
+                while i + 1 < len(tokens) and tokens[i + 1] not in self.GO_VALUE_PARAMS + ("infinite", "ponder"):
+                    i += 1
+                    searchmoves.append(chess.Move.from_uci(tokens[i]))
+            i += 1
+
+        return params, searchmoves, infinite
+
+    def _time_budget(self, params: dict[str, int]) -> float | None:
+        if "movetime" in params:
+            return params["movetime"] / 1000
+        remaining = params.get("wtime" if self.board.turn == chess.WHITE else "btime")
+        if remaining is not None:
+            return remaining / 1000 / params.get("movestogo", 30)
+        return None
+
+    def _search(self, tokens: list[str]):
+        start = time.perf_counter()
+        params, searchmoves, infinite = self._parse_go(tokens)
+        time_budget = self._time_budget(params)
+        legal_moves = set(self.board.legal_moves)
+        moves = [move for move in searchmoves if move in legal_moves] if searchmoves else list(legal_moves)
+
+        if not moves:
+            self.send("info depth 0 score mate 0" if self.board.is_check() else "info depth 0 score cp 0")
+            self.send("bestmove (none)")
+            return
+
+        scored = score_moves(self.board, moves)
+        lines = scored[:self.multipv]
+
+        nodes, depth = 0, 0
+        while True:
+            depth += 1
+            if self.latency and self._stop.wait(self.latency / 1000):
+                break
+            nodes += len(scored)
+
+            elapsed = time.perf_counter() - start
+            for multipv, (move, score) in enumerate(lines, start=1):
+                if score == MATE_SCORE:
+                    score_str = "mate 1"
+                else:
+                    score_str = f"cp {int(round(score * 100))}"
+                self.send(
+                    f"info depth {depth} seldepth {depth} multipv {multipv} score {score_str} "
+                    f"nodes {nodes} nps {int(nodes / max(elapsed, 1e-6))} time {int(elapsed * 1000)} pv {move.uci()}"
+                )
+
+            if self._stop.is_set():
+                break
+            if "depth" in params and depth >= params["depth"]:
+                break
+            if "nodes" in params and nodes >= params["nodes"]:
+                break
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+            if not infinite and depth >= MAX_DEPTH:
+                break
+
+        if infinite:
+            self._stop.wait()
+
+        self.send(f"bestmove {lines[0][0].uci()}")
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Deterministic pure-Python UCI engine")
+    parser.add_argument("--latency", type=float, default=0.0, help="artificial milliseconds per search iteration")
+    args = parser.parse_args(argv)
+
+    UciFakeEngine(latency=args.latency).run()
+
+if __name__ == "__main__":
+    main()
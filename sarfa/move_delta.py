@@ -0,0 +1,195 @@
+"""
+Common actions of a perturbed board without regenerating its legal moves.
+
+The common actions of SARFA are the root moves that are still legal after a
+perturbation, so only root moves have to be decided. A root move can only
+change its legality when a perturbed square touches
+- its from or to square or the squares it passes (sliders, pawn pushes)
+- the line between its piece and the king and behind it up to the next
+  piece (pins)
+- for king moves, the lines, knight and king squares around the destination
+Any other change around the king can only matter by giving or blocking a
+check, so a different set of checkers rechecks every move.
+
+`MoveDelta` precomputes that dependency mask per root move. For a perturbed
+board it XORs the piece bitboards and regenerates only the moves whose mask
+is hit, restricted to their from and to squares. Castling and en passant
+moves are rechecked on any change. A different side to move or king square
+falls back to full generation.
+
+```python
+delta = MoveDelta(board)
+for perturbed_board, position_str in RemovalPerturber(board).process():
+    common_actions = delta.common_actions(perturbed_board) # == delta.root_actions & set(perturbed_board.legal_moves)
+```
+
+```bash
+python -m chess_dataset.move_delta # validates against full generation over the dataset and test FENs
+```
+"""
+
+import time
+from typing import Iterable
+
+import chess
+
+# engines return at most one line per legal move, so this many lines means all of them
+ALL_LINES = 218 # most legal moves of any chess position
+
+_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+def king_zone(square: chess.Square, occupied: chess.Bitboard) -> chess.Bitboard:
+    """
+    Every square where a change can attack a king on `square` or uncover an
+    attack: knight and king squares, and every line up to its second piece
+    (behind that a change needs both blockers gone, and they are changes too)
+    """
+    zone = chess.BB_KNIGHT_ATTACKS[square] | chess.BB_KING_ATTACKS[square]
+    for file_step, rank_step in _DIRECTIONS:
+        file, rank = chess.square_file(square), chess.square_rank(square)
+        pieces = 0
+        while pieces < 2:
+            file, rank = file + file_step, rank + rank_step
+            if not (0 <= file < 8 and 0 <= rank < 8):
+                break
+            bb = chess.BB_SQUARES[chess.square(file, rank)]
+            zone |= bb
+            pieces += bool(occupied & bb)
+    return zone
+
+def changed_squares(board: chess.Board, other: chess.Board) -> chess.Bitboard:
+    """
+    Squares with a different piece (or color) on the two boards
+    """
+    return (
+        (board.pawns ^ other.pawns)
+        | (board.knights ^ other.knights)
+        | (board.bishops ^ other.bishops)
+        | (board.rooks ^ other.rooks)
+        | (board.queens ^ other.queens)
+        | (board.kings ^ other.kings)
+        | (board.occupied_co[chess.WHITE] ^ other.occupied_co[chess.WHITE])
+    )
+
+def pin_line(king: chess.Square, square: chess.Square, occupied: chess.Bitboard) -> chess.Bitboard:
+    """
+    Squares deciding whether the piece on `square` is pinned to the king: the
+    squares in between and the line behind it up to the next piece
+    """
+    line = chess.ray(king, square)
+    if not line:
+        return 0
+    behind = 0
+    step = square
+    file_step = (chess.square_file(square) > chess.square_file(king)) - (chess.square_file(square) < chess.square_file(king))
+    rank_step = (chess.square_rank(square) > chess.square_rank(king)) - (chess.square_rank(square) < chess.square_rank(king))
+    while True:
+        file, rank = chess.square_file(step) + file_step, chess.square_rank(step) + rank_step
+        if not (0 <= file < 8 and 0 <= rank < 8):
+            break
+        step = chess.square(file, rank)
+        behind |= chess.BB_SQUARES[step]
+        if occupied & chess.BB_SQUARES[step]:
+            break
+    return chess.between(king, square) | behind
+
+class MoveDelta:
+    def __init__(self, board: chess.Board):
+        self.board = board
+        self.root_actions: set[chess.Move] = set(board.legal_moves)
+        self.king_mask = board.pieces_mask(chess.KING, board.turn)
+        self.checkers = board.checkers_mask()
+        king = board.king(board.turn)
+
+        # per square: the root moves whose legality depends on it and the from and to squares
+        # to regenerate them with (python-chess generates castling as the king taking its rook)
+        self._from_masks = [0] * 64
+        self._to_masks = [0] * 64
+        affected: list[set[chess.Move]] = [set() for _ in chess.SQUARES]
+        for move in self.root_actions:
+            if board.is_castling(move) or board.is_en_passant(move) or king is None:
+                mask = chess.BB_ALL
+            else:
+                mask = chess.BB_SQUARES[move.from_square] | chess.BB_SQUARES[move.to_square] | chess.between(move.from_square, move.to_square)
+                if move.from_square == king:
+                    mask |= king_zone(move.to_square, board.occupied & ~chess.BB_SQUARES[king])
+                else:
+                    # other changes around the king only matter when they give or block a check
+                    mask |= pin_line(king, move.from_square, board.occupied)
+            destination = chess.BB_ALL if board.is_castling(move) else chess.BB_SQUARES[move.to_square]
+            for square in chess.scan_forward(mask):
+                affected[square].add(move)
+                self._from_masks[square] |= chess.BB_SQUARES[move.from_square]
+                self._to_masks[square] |= destination
+        self._affected = [frozenset(moves) for moves in affected]
+
+        # statistics over every `common_actions` call
+        self.calls = 0
+        self.rechecked = 0 # calls with a restricted generation
+        self.full_generations = 0
+
+    def common_actions(self, perturbed_board: chess.Board) -> set[chess.Move]:
+        """
+        The root moves that are legal on `perturbed_board`
+        """
+        self.calls += 1
+        board = self.board
+        if (
+            perturbed_board.turn != board.turn
+            or perturbed_board.pieces_mask(chess.KING, board.turn) != self.king_mask
+            or chess.popcount(self.king_mask) != 1
+        ):
+            self.full_generations += 1
+            return self.root_actions & set(perturbed_board.legal_moves)
+
+        changed = changed_squares(board, perturbed_board)
+        if perturbed_board.castling_rights != board.castling_rights or perturbed_board.ep_square != board.ep_square:
+            changed |= chess.BB_ALL
+        if not changed:
+            return set(self.root_actions)
+        if perturbed_board.checkers_mask() != self.checkers:
+            changed |= chess.BB_ALL
+
+        affected: set[chess.Move] = set()
+        from_mask = to_mask = 0
+        for square in chess.scan_forward(changed):
+            affected |= self._affected[square]
+            from_mask |= self._from_masks[square]
+            to_mask |= self._to_masks[square]
+        common_actions = self.root_actions - affected
+        if affected:
+            # one generation over the squares of the touched moves instead of every piece
+            self.rechecked += 1
+            common_actions.update(move for move in perturbed_board.generate_legal_moves(from_mask, to_mask) if move in affected)
+        return common_actions
+
+def validate(fens: Iterable[str], perturbers: Iterable[str] | None = None) -> dict[str, float]:
+    """
+    Compares `MoveDelta.common_actions` with full legal move generation for
+    every perturbation of every FEN
+
+    Returns counts of boards and mismatches, seconds of both methods and the share of boards that needed a restricted generation
+    """
+    from .perturbation_handler import PERTURBERS, get_perturber
+
+    perturber_classes = [get_perturber(name) for name in (perturbers or PERTURBERS)]
+    stats = {"boards": 0, "mismatches": 0, "delta_seconds": 0.0, "full_seconds": 0.0}
+    rechecked = 0
+    for fen in fens:
+        board = chess.Board(fen)
+        delta = MoveDelta(board)
+        for perturber_class in perturber_classes:
+            for perturbed_board, _ in perturber_class(board).process():
+                start = time.perf_counter()
+                incremental = delta.common_actions(perturbed_board)
+                middle = time.perf_counter()
+                full = delta.root_actions & set(perturbed_board.legal_moves)
+                end = time.perf_counter()
+
+                stats["boards"] += 1
+                stats["mismatches"] += incremental != full
+                stats["delta_seconds"] += middle - start
+                stats["full_seconds"] += end - middle
+        rechecked += delta.rechecked
+    stats["rechecked"] = rechecked / stats["boards"] if stats["boards"] else 0.0
+    return stats
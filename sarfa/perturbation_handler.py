@@ -1,11 +1,79 @@
 import chess
+import chess.polyglot
+from . import profiling
 from .utils import get_pos_obj, get_all_pos
-from typing import Generator
+from typing import Any, Callable, Generator, Iterable
+
+# registry of perturbation strategies by name, filled by `register_perturber`
+PERTURBERS: dict[str, type["Perturber"]] = {}
+
+# lower-value piece each piece type is substituted with
+SUBSTITUTIONS: dict[chess.PieceType, chess.PieceType] = {
+    chess.QUEEN: chess.ROOK,
+    chess.ROOK: chess.BISHOP,
+    chess.BISHOP: chess.PAWN,
+    chess.KNIGHT: chess.PAWN,
+}
+
+def register_perturber(name: str) -> Callable[[type["Perturber"]], type["Perturber"]]:
+    """
+    Class decorator that makes a perturbation strategy available by `name`
+    through `get_perturber` and `CompositePerturber`.
+    """
+    def decorator(cls: type["Perturber"]) -> type["Perturber"]:
+        PERTURBERS[name] = cls
+        cls.name = name
+        return cls
+    return decorator
+
+def get_perturber(name: str) -> type["Perturber"]:
+    if name not in PERTURBERS:
+        raise KeyError(f"Unknown perturbation strategy '{name}'. Available: {sorted(PERTURBERS)}")
+    return PERTURBERS[name]
+
+def position_hash(board: chess.Board) -> int:
+    """
+    Zobrist hash of the position (pieces, turn, castling rights, en passant)
+    """
+    return chess.polyglot.zobrist_hash(board)
+
+def unique_perturbations(original_board: chess.Board, perturbations: Iterable[tuple[chess.Board, str]]) -> Generator[tuple[chess.Board, list[str]], None, None]:
+    """
+    Groups perturbations that result in the same position so each distinct board
+    is only sent to the engine once. Perturbations that leave the original
+    position unchanged are dropped.
+
+    Yields every distinct board as soon as it is first produced, with the
+    list of the position strings that produced it. Later duplicates are
+    appended to that list, so it is only complete once the generator is
+    exhausted.
+    """
+    original_hash = position_hash(original_board)
+    groups: dict[int, list[str]] = {}
+
+    for perturbed_board, position_str in perturbations:
+        board_hash = position_hash(perturbed_board)
+        if board_hash == original_hash:
+            continue
+        if board_hash in groups:
+            groups[board_hash].append(position_str)
+            continue
+        groups[board_hash] = [position_str]
+        yield perturbed_board, groups[board_hash]
 
 class Perturber:
+    name = None
+
     def __init__(self, board: chess.Board):
         self.board = board
 
+    def candidate_squares(self) -> chess.Bitboard:
+        """
+        Bitboard of the squares this strategy can perturb. Only these squares
+        are visited by `process`.
+        """
+        return chess.BB_ALL
+
     def perturb_position(self, position_str: str) -> chess.Board | None:
         raise NotImplementedError("Need to implement perturb position function.")
 
@@ -14,19 +82,49 @@ class Perturber:
         Generator that iterates over all board positions and yields perturbed instances.
         Each yield contains the perturbed board and the position string that was perturbed.
         """
+        candidates = self.candidate_squares()
         for position_str in get_all_pos():
-            perturbed_board = self.perturb_position(position_str)
+            if not candidates & chess.BB_SQUARES[get_pos_obj(position_str)]:
+                continue
+            with profiling.span("perturbation.generate", strategy=self.name):
+                perturbed_board = self.perturb_position(position_str)
             if perturbed_board:
                 yield perturbed_board, position_str
-        
+
+    def process_unique(self) -> Generator[tuple[chess.Board, list[str]], None, None]:
+        """
+        Same as `process` but deduplicated by resulting position hash.
+        Yields the perturbed board and all position strings that lead to it
+        (complete once the generator is exhausted, see `unique_perturbations`).
+        """
+        yield from unique_perturbations(self.board, self.process())
+
+    def score_unique(self, score: Callable[[chess.Board], Any]) -> list[tuple[str, Any]]:
+        """
+        Calls `score` once per distinct perturbed board (`process_unique`) and
+        returns (position string, score) for every position string that
+        produced the board. The scores are copied to the position strings
+        after the sweep, once every group is complete.
+        """
+        scored = [(position_strs, score(perturbed_board)) for perturbed_board, position_strs in self.process_unique()]
+        return [(position_str, result) for position_strs, result in scored for position_str in position_strs]
+
+    def _removable_pieces(self) -> chess.Bitboard:
+        # every piece apart from the kings
+        return self.board.occupied & ~self.board.kings
+
+@register_perturber("removal")
 class RemovalPerturber(Perturber):
     """
     Removes piece from position where a piece currently exists
     """
-        
+
+    def candidate_squares(self) -> chess.Bitboard:
+        return self._removable_pieces()
+
     def perturb_position(self, position_str: str) -> chess.Board | None:
         position = get_pos_obj(position_str)
-        
+
         piece = self.board.piece_at(position)
         # don't remove it if its a king
         if not piece or piece == chess.Piece(chess.KING, chess.WHITE) or piece == chess.Piece(chess.KING, chess.BLACK):
@@ -34,15 +132,18 @@ class RemovalPerturber(Perturber):
 
         perturbed_board = self.board.copy()
         perturbed_board.remove_piece_at(position)
-        
+
         return perturbed_board
-        
 
+@register_perturber("add")
 class AddPerturber(Perturber):
     """
     Adds a pawn to a empty space on the board where no piece already exists.
     """
-        
+
+    def candidate_squares(self) -> chess.Bitboard:
+        return ~self.board.occupied & chess.BB_ALL
+
     def perturb_position(self, position_str: str) -> chess.Board | None:
         position = get_pos_obj(position_str)
         piece = self.board.piece_at(position)
@@ -56,4 +157,157 @@ class AddPerturber(Perturber):
             perturbed_board.set_piece_at(position, new_piece)
 
         return perturbed_board
-        
\ No newline at end of file
+
+@register_perturber("add_opponent_pawn")
+class AddOpponentPawnPerturber(Perturber):
+    """
+    Adds a pawn of the opponent's color to an empty space. Back ranks are
+    skipped since a pawn can never stand there.
+    """
+
+    def candidate_squares(self) -> chess.Bitboard:
+        return ~self.board.occupied & ~chess.BB_BACKRANKS & chess.BB_ALL
+
+    def perturb_position(self, position_str: str) -> chess.Board | None:
+        position = get_pos_obj(position_str)
+        if self.board.piece_at(position):
+            return None
+
+        perturbed_board = self.board.copy()
+        perturbed_board.set_piece_at(position, chess.Piece(chess.PAWN, not self.board.turn))
+
+        return perturbed_board
+
+@register_perturber("substitute")
+class SubstitutionPerturber(Perturber):
+    """
+    Replaces a piece with a lower-value piece of the same color
+    (queen -> rook, rook -> bishop, bishop/knight -> pawn).
+    Pawns and kings are left untouched.
+    """
+
+    def candidate_squares(self) -> chess.Bitboard:
+        board = self.board
+        # minor pieces on the back rank can't become pawns
+        minor_pieces = (board.bishops | board.knights) & ~chess.BB_BACKRANKS
+        return board.queens | board.rooks | minor_pieces
+
+    def perturb_position(self, position_str: str) -> chess.Board | None:
+        position = get_pos_obj(position_str)
+        piece = self.board.piece_at(position)
+        if not piece or piece.piece_type not in SUBSTITUTIONS:
+            return None
+
+        substitute_type = SUBSTITUTIONS[piece.piece_type]
+        if substitute_type == chess.PAWN and chess.BB_SQUARES[position] & chess.BB_BACKRANKS:
+            return None
+
+        perturbed_board = self.board.copy()
+        perturbed_board.set_piece_at(position, chess.Piece(substitute_type, piece.color))
+
+        return perturbed_board
+
+@register_perturber("swap_color")
+class ColorSwapPerturber(Perturber):
+    """
+    Flips the color of a piece, turning a defender into an attacker and vice versa.
+    Kings are left untouched.
+    """
+
+    def candidate_squares(self) -> chess.Bitboard:
+        return self._removable_pieces()
+
+    def perturb_position(self, position_str: str) -> chess.Board | None:
+        position = get_pos_obj(position_str)
+        piece = self.board.piece_at(position)
+        if not piece or piece.piece_type == chess.KING:
+            return None
+
+        perturbed_board = self.board.copy()
+        perturbed_board.set_piece_at(position, chess.Piece(piece.piece_type, not piece.color))
+
+        return perturbed_board
+
+class RegionPerturber(Perturber):
+    """
+    Removes every piece (apart from the kings) inside a region around
+    the position. Squares that share a region produce the same board,
+    which `process_unique` collapses into a single engine call.
+    """
+
+    def region_mask(self, square: chess.Square) -> chess.Bitboard:
+        raise NotImplementedError("Need to implement region mask function.")
+
+    def candidate_squares(self) -> chess.Bitboard:
+        removable = self._removable_pieces()
+        candidates = chess.BB_EMPTY
+        for square in chess.SQUARES:
+            if self.region_mask(square) & removable:
+                candidates |= chess.BB_SQUARES[square]
+        return candidates
+
+    def perturb_position(self, position_str: str) -> chess.Board | None:
+        mask = self.region_mask(get_pos_obj(position_str)) & self._removable_pieces()
+        if not mask:
+            return None
+
+        perturbed_board = self.board.copy()
+        for square in chess.scan_forward(mask):
+            perturbed_board.remove_piece_at(square)
+
+        return perturbed_board
+
+@register_perturber("file_mask")
+class FileMaskPerturber(RegionPerturber):
+    """
+    Removes all pieces on the file of the position.
+    """
+
+    def region_mask(self, square: chess.Square) -> chess.Bitboard:
+        return chess.BB_FILES[chess.square_file(square)]
+
+@register_perturber("rank_mask")
+class RankMaskPerturber(RegionPerturber):
+    """
+    Removes all pieces on the rank of the position.
+    """
+
+    def region_mask(self, square: chess.Square) -> chess.Bitboard:
+        return chess.BB_RANKS[chess.square_rank(square)]
+
+@register_perturber("neighbourhood_mask")
+class NeighbourhoodMaskPerturber(RegionPerturber):
+    """
+    Removes all pieces in the 3x3 neighbourhood centered on the position.
+    """
+
+    def region_mask(self, square: chess.Square) -> chess.Bitboard:
+        return chess.BB_KING_ATTACKS[square] | chess.BB_SQUARES[square]
+
+class CompositePerturber(Perturber):
+    """
+    Chains several perturbation strategies over the same board.
+
+    ```python
+    perturber = CompositePerturber(board, ["removal", "substitute", SubstitutionPerturber])
+    for position_str, result in perturber.score_unique(lambda perturbed_board: saliency_calculator.compute(perturbed_board, action)):
+        ...
+    ```
+    """
+
+    def __init__(self, board: chess.Board, strategies: list[str | type[Perturber]]):
+        super().__init__(board)
+        self.perturbers: list[Perturber] = [
+            (get_perturber(strategy) if isinstance(strategy, str) else strategy)(board)
+            for strategy in strategies
+        ]
+
+    def candidate_squares(self) -> chess.Bitboard:
+        candidates = chess.BB_EMPTY
+        for perturber in self.perturbers:
+            candidates |= perturber.candidate_squares()
+        return candidates
+
+    def process(self) -> Generator[tuple[chess.Board, str], None, None]:
+        for perturber in self.perturbers:
+            yield from perturber.process()
@@ -0,0 +1,312 @@
+"""
+Index of explained positions for reusing saliency maps of near-duplicates.
+
+Every position is keyed by its 12 piece bitboards and the zones around both
+kings (14 packed 64-bit words). Candidates are found with MinHash LSH over
+the occupied piece-square features: the hashes are split into bands, a
+band plus the side to move is one sorted lookup table. Candidates are
+ranked by the exact Hamming distance between the packed words, optionally
+only those with the same material signature (piece counts).
+
+```python
+index = PositionIndex.from_store(ResultStore("output/results"), algorithm="sarfa_baseline")
+neighbours = index.query(fen, k=3, max_distance=4)
+neighbours[0].fen, neighbours[0].distance, neighbours[0].saliency
+
+saliency = indexed_saliency(index, engine, fen, action, max_distance=4) # engine only when nothing is close
+```
+
+A position one tempo or one pawn step away from an explained one is at
+distance 2 (one bit leaves, one bit arrives).
+
+New entries go to an unsorted tail that queries scan linearly. Every
+`MERGE_BATCH` entries the tail is sorted and merged into the sorted bands in
+linear time, so adding while querying (`indexed_saliency(learn=True)`)
+never re-sorts the whole index.
+"""
+
+from dataclasses import dataclass
+from typing import Sequence
+
+import chess
+import chess.engine
+import numpy as np
+
+from .algorithms import sarfa_baseline_saliency
+from .perturbation_handler import Perturber, RemovalPerturber
+
+PIECE_PLANES = 12
+WORDS = PIECE_PLANES + 2 # piece bitboards, then the white and black king zones
+FEATURE_BITS = PIECE_PLANES * 64
+DEFAULT_BANDS = 12
+DEFAULT_ROWS = 4
+MERGE_BATCH = 4096 # tail entries scanned linearly before they are merged into the sorted bands
+_MERSENNE = (1 << 31) - 1
+_NO_FEATURE = np.iinfo(np.uint64).max
+_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+def position_words(board: chess.Board) -> np.ndarray:
+    """
+    (WORDS,) uint64: piece bitboards (white pawn .. white king, black pawn .. black king) and king zones
+    """
+    words = np.zeros(WORDS, dtype=np.uint64)
+    for color in chess.COLORS:
+        for piece_type in chess.PIECE_TYPES:
+            words[(piece_type - 1) + (0 if color == chess.WHITE else 6)] = board.pieces_mask(piece_type, color)
+    for i, color in enumerate(chess.COLORS[::-1]):
+        king = board.king(color)
+        if king is not None:
+            words[PIECE_PLANES + i] = chess.BB_KING_ATTACKS[king] | chess.BB_SQUARES[king]
+    return words
+
+def material_signature(words: np.ndarray, turn: np.ndarray | bool) -> np.ndarray:
+    """
+    Piece counts of both sides (4 bits per non-king piece type) and the side to move, one uint64 per position
+    """
+    words = np.atleast_2d(words)
+    counts = popcount(words[:, :PIECE_PLANES, None]).reshape(len(words), PIECE_PLANES)
+    non_kings = [plane for plane in range(PIECE_PLANES) if plane % 6 != chess.KING - 1]
+    signature = np.zeros(len(words), dtype=np.uint64)
+    for slot, plane in enumerate(non_kings):
+        signature |= np.minimum(counts[:, plane], 15).astype(np.uint64) << np.uint64(4 * slot)
+    return signature << np.uint64(1) | np.asarray(turn, dtype=np.uint64)
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """
+    Set bits per row of (..., n) uint64 words, summed over the last axis
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    # numpy < 2: byte lookup table
+    as_bytes = np.ascontiguousarray(words).view(np.uint8)
+    return _POPCOUNT[as_bytes].sum(axis=-1, dtype=np.int64)
+
+def hamming(words: np.ndarray, query: np.ndarray) -> np.ndarray:
+    return popcount(words ^ query)
+
+@dataclass()
+class Neighbour:
+    entry: int
+    fen: str
+    distance: int
+    saliency: dict[str, float]
+    action: chess.Move | None
+
+class PositionIndex:
+    def __init__(self, bands: int = DEFAULT_BANDS, rows: int = DEFAULT_ROWS, seed: int = 0):
+        """
+        Params
+        - bands, rows: int (MinHash bands and hashes per band, more rows make a band more selective)
+        """
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.default_rng(seed)
+        a = rng.integers(1, _MERSENNE, bands * rows, dtype=np.uint64)
+        b = rng.integers(0, _MERSENNE, bands * rows, dtype=np.uint64)
+        features = np.arange(FEATURE_BITS, dtype=np.uint64)
+        # (hashes, FEATURE_BITS + 1), the last column pads positions with fewer pieces
+        self._feature_hashes = np.concatenate([
+            ((a[:, None] * features[None, :] + b[:, None]) % np.uint64(_MERSENNE)),
+            np.full((bands * rows, 1), _NO_FEATURE, dtype=np.uint64),
+        ], axis=1)
+        self._band_weights = rng.integers(1, np.iinfo(np.int64).max, (bands, rows), dtype=np.uint64) | np.uint64(1)
+
+        # preallocated, the first `len(self)` entries are in use
+        self._words = np.empty((0, WORDS), dtype=np.uint64)
+        self._saliency = np.empty((0, 64), dtype=np.float32)
+        self._keys = np.empty((bands, 0), dtype=np.uint64)
+        self.actions: list[chess.Move | None] = []
+        self.fens: list[str] = []
+        # per band: sorted keys and the entry of every key of the first `_merged` entries, the rest is the tail
+        self._sorted_keys = np.empty((bands, 0), dtype=np.uint64)
+        self._sorted_entries = np.empty((bands, 0), dtype=np.int64)
+        self._merged = 0
+
+    def __len__(self) -> int:
+        return len(self.fens)
+
+    @property
+    def words(self) -> np.ndarray:
+        return self._words[:len(self)]
+
+    @property
+    def saliency(self) -> np.ndarray:
+        return self._saliency[:len(self)]
+
+    def _reserve(self, extra: int):
+        """
+        Grows the entry arrays geometrically, so appending one entry is amortized O(1)
+        """
+        size = len(self)
+        if size + extra <= len(self._words):
+            return
+        capacity = max(size + extra, 2 * len(self._words), 1024)
+        words = np.empty((capacity, WORDS), dtype=np.uint64)
+        words[:size] = self._words[:size]
+        saliency = np.empty((capacity, 64), dtype=np.float32)
+        saliency[:size] = self._saliency[:size]
+        keys = np.empty((self.bands, capacity), dtype=np.uint64)
+        keys[:, :size] = self._keys[:, :size]
+        self._words, self._saliency, self._keys = words, saliency, keys
+
+    def _band_keys(self, words: np.ndarray, turns: np.ndarray) -> np.ndarray:
+        """
+        (bands, n) uint64 LSH keys
+        """
+        n = len(words)
+        bits = np.unpackbits(np.ascontiguousarray(words[:, :PIECE_PLANES]).view(np.uint8), axis=1, bitorder="little").astype(bool)
+        rows, columns = np.nonzero(bits)
+        counts = np.bincount(rows, minlength=n)
+        # (n, most pieces) feature ids, padded with the no-feature column
+        features = np.full((n, max(int(counts.max(initial=0)), 1)), FEATURE_BITS, dtype=np.int64)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        features[rows, np.arange(len(rows)) - starts[rows]] = columns
+
+        minhash = self._feature_hashes[:, features].min(axis=2) # (hashes, n)
+        with np.errstate(over="ignore"):
+            banded = minhash.reshape(self.bands, self.rows, n) * self._band_weights[:, :, None]
+            keys = np.bitwise_xor.reduce(banded, axis=1)
+            return keys ^ np.asarray(turns, dtype=np.uint64)[None, :] * np.uint64(0x9E3779B97F4A7C15)
+
+    def add_arrays(self, words: np.ndarray, turns: np.ndarray, saliency: np.ndarray, fens: Sequence[str], actions: Sequence[chess.Move | None] | None = None, chunk: int = 65536):
+        """
+        Bulk insert of packed positions
+
+        Params
+        - words: (n, WORDS) uint64 from `position_words`
+        - turns: (n,) bool, True for white to move
+        - saliency: (n, 64) by chess square, NaN where nothing was evaluated
+        """
+        size, count = len(self), len(words)
+        self._reserve(count)
+        for start in range(0, count, chunk):
+            self._keys[:, size + start:size + start + chunk] = self._band_keys(words[start:start + chunk], turns[start:start + chunk])
+        self._words[size:size + count] = words
+        self._saliency[size:size + count] = saliency
+        self.fens.extend(fens)
+        self.actions.extend(actions if actions is not None else [None] * len(fens))
+        if len(self) - self._merged >= MERGE_BATCH:
+            self._merge()
+
+    def add(self, fen: str, saliency: dict[str, float], action: chess.Move | None = None):
+        board = chess.Board(fen)
+        row = np.full((1, 64), np.nan, dtype=np.float32)
+        for position_str, value in saliency.items():
+            row[0, chess.parse_square(position_str)] = value
+        self.add_arrays(position_words(board)[None], np.array([board.turn]), row, [fen], [action])
+
+    @classmethod
+    def from_store(cls, store, algorithm: str | None = None, config: dict | None = None, **kwargs) -> "PositionIndex":
+        """
+        Index over the latest run of `algorithm` in a `chess_dataset.ResultStore`
+        """
+        from chess_dataset.result_store import unpack_action
+
+        index = cls(**kwargs)
+        rows = store.select(algorithm=algorithm, config=config, run=-1 if algorithm is not None else None)
+        fens = [fen.decode() for fen in store.column("fen")[rows]]
+        boards = [chess.Board(fen) for fen in fens]
+        words = np.stack([position_words(board) for board in boards]) if boards else np.empty((0, WORDS), dtype=np.uint64)
+        index.add_arrays(words, np.array([board.turn for board in boards], dtype=bool), np.asarray(store.column("saliency")[rows]), fens, [unpack_action(action) for action in store.column("action")[rows]])
+        return index
+
+    def _merge(self):
+        """
+        Sorts the tail and merges it into the sorted bands, equal keys keep insertion order
+        """
+        tail = self._keys[:, self._merged:len(self)]
+        order = np.argsort(tail, axis=1, kind="stable")
+        tail_keys = np.take_along_axis(tail, order, axis=1)
+        tail_entries = order + self._merged
+        sorted_keys, sorted_entries = [], []
+        for band in range(self.bands):
+            positions = np.searchsorted(self._sorted_keys[band], tail_keys[band], side="right")
+            sorted_keys.append(np.insert(self._sorted_keys[band], positions, tail_keys[band]))
+            sorted_entries.append(np.insert(self._sorted_entries[band], positions, tail_entries[band]))
+        self._sorted_keys = np.stack(sorted_keys)
+        self._sorted_entries = np.stack(sorted_entries)
+        self._merged = len(self)
+
+    def candidates(self, words: np.ndarray, turn: bool) -> np.ndarray:
+        """
+        Entries sharing at least one band with the position
+        """
+        keys = self._band_keys(words[None], np.array([turn]))[:, 0]
+        found = []
+        for band, key in enumerate(keys):
+            low = np.searchsorted(self._sorted_keys[band], key, side="left")
+            high = np.searchsorted(self._sorted_keys[band], key, side="right")
+            if high > low:
+                found.append(self._sorted_entries[band, low:high])
+        # the unmerged tail, at most MERGE_BATCH entries per band
+        _, tail = np.nonzero(self._keys[:, self._merged:len(self)] == keys[:, None])
+        if len(tail):
+            found.append(tail + self._merged)
+        # may repeat entries found by several bands, cheaper than deduplicating every candidate
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def query(self, fen: str, k: int = 1, max_distance: int | None = None, same_material: bool = False, exhaustive: bool = False) -> list[Neighbour]:
+        """
+        The `k` closest explained positions by Hamming distance, nearest first
+
+        Params
+        - max_distance: int (ignore entries further away)
+        - same_material: bool (ignore entries with other piece counts, e.g. after a capture)
+        - exhaustive: bool (scan every entry instead of the LSH candidates, exact but linear)
+        """
+        board = chess.Board(fen)
+        words = position_words(board)
+        entries = np.arange(len(self)) if exhaustive else self.candidates(words, board.turn)
+        if len(entries) == 0:
+            return []
+
+        if same_material:
+            entries = entries[material_signature(self.words[entries], board.turn) == material_signature(words, board.turn)]
+        distances = hamming(self.words[entries], words)
+        if max_distance is not None:
+            keep = distances <= max_distance
+            entries, distances = entries[keep], distances[keep]
+        neighbours: list[Neighbour] = []
+        seen: set[int] = set()
+        # ties by entry, so the order doesn't depend on which band or the tail found an entry
+        for i in np.lexsort((entries, distances)):
+            entry = int(entries[i])
+            if entry in seen:
+                continue
+            seen.add(entry)
+            neighbours.append(self._neighbour(entry, int(distances[i])))
+            if len(neighbours) == k:
+                break
+        return neighbours
+
+    def _neighbour(self, entry: int, distance: int) -> Neighbour:
+        row = self.saliency[entry]
+        return Neighbour(
+            entry=entry,
+            fen=self.fens[entry],
+            distance=distance,
+            saliency={chess.square_name(square): float(row[square]) for square in np.flatnonzero(~np.isnan(row))},
+            action=self.actions[entry],
+        )
+
+def transfer_saliency(neighbour: Neighbour, board: chess.Board, perturber_class: type[Perturber] = RemovalPerturber) -> dict[str, float]:
+    """
+    The neighbour's saliency on the squares a sweep of `board` would explain, 0 where the neighbour has none
+    """
+    return {chess.square_name(square): neighbour.saliency.get(chess.square_name(square), 0.0) for square in chess.scan_forward(perturber_class(board).candidate_squares())}
+
+def indexed_saliency(index: PositionIndex, engine, fen: str, action: chess.Move | None = None, max_distance: int = 2, runtime: float = 2.0, limit: chess.engine.Limit | None = None, learn: bool = True) -> dict[str, float]:
+    """
+    `sarfa_baseline_saliency` that reuses the saliency map of an explained
+    position within `max_distance` explaining the same move, and adds new
+    explanations to the index when `learn` is set
+    """
+    board = chess.Board(fen)
+    for neighbour in index.query(fen, k=4, max_distance=max_distance):
+        if action is None or neighbour.action is None or neighbour.action == action:
+            return transfer_saliency(neighbour, board)
+
+    saliency = dict(sarfa_baseline_saliency(engine, fen, action, runtime=runtime, limit=limit))
+    if learn:
+        index.add(fen, saliency, action)
+    return saliency
@@ -0,0 +1,197 @@
+"""
+Opt-in timing instrumentation for the saliency pipeline.
+
+Nothing is recorded until a `Profiler` is enabled, so the instrumented code
+paths only pay for a global lookup when profiling is off.
+
+```python
+with Profiler() as profiler:
+    with profiling.tags(fen=fen, algorithm="sarfa_baseline"):
+        saliency_algorithm(fen)
+
+profiler.to_json("output/profile.json")
+profiler.to_chrome_trace("output/profile.trace.json") # open in chrome://tracing or Perfetto
+```
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Generator
+
+# currently enabled profiler, None when profiling is off
+_profiler: "Profiler | None" = None
+_local = threading.local()
+
+@dataclass()
+class Span:
+    name: str
+    start: float # perf_counter seconds
+    duration: float = 0.0
+    thread_id: int = 0
+    tags: dict[str, Any] = field(default_factory=dict)
+    attrs: dict[str, Any] = field(default_factory=dict)
+
+class Profiler:
+    def __init__(self):
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def __enter__(self) -> "Profiler":
+        enable(self)
+        return self
+
+    def __exit__(self, *exc):
+        disable()
+
+    def record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def aggregate(self, group_by: tuple[str, ...] = ()) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        Aggregates the spans per span name and optionally per tag (e.g. ("fen",) or ("algorithm",)).
+
+        Returns {group: {span name: {count, total, mean, max, <numeric attr totals and means>}}}
+        """
+        groups: dict[str, dict[str, dict[str, float]]] = defaultdict(dict)
+        with self._lock:
+            spans = list(self.spans)
+
+        for span in spans:
+            group = "/".join(str(span.tags.get(tag)) for tag in group_by) or "all"
+            stats = groups[group].setdefault(span.name, {"count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += span.duration
+            stats["max"] = max(stats["max"], span.duration)
+            for key, value in span.attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stats[key] = stats.get(key, 0) + value
+                    stats[f"{key}_count"] = stats.get(f"{key}_count", 0) + 1
+                elif value is not None:
+                    # count categorical attributes such as base cases
+                    counter = f"{key}={value}"
+                    stats[counter] = stats.get(counter, 0) + 1
+
+        for spans_by_name in groups.values():
+            for stats in spans_by_name.values():
+                stats["mean"] = stats["total"] / stats["count"]
+                for key in [key for key in stats if key.endswith("_count") and key != "count"]:
+                    attr = key[:-len("_count")]
+                    stats[f"{attr}_mean"] = stats[attr] / stats.pop(key)
+
+        return dict(groups)
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "spans": self.aggregate(),
+            "per_fen": self.aggregate(("fen",)),
+            "per_algorithm": self.aggregate(("algorithm",)),
+        }
+
+    def to_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def to_chrome_trace(self, path: str):
+        """
+        Writes the spans in the Chrome trace event format
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = [{
+                "name": span.name,
+                "cat": span.name.split(".")[0],
+                "ph": "X",
+                "ts": (span.start - self._origin) * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {**span.tags, **span.attrs},
+            } for span in self.spans]
+
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+def enable(profiler: Profiler | None = None) -> Profiler:
+    global _profiler
+    _profiler = profiler if profiler is not None else Profiler()
+    return _profiler
+
+def disable():
+    global _profiler
+    _profiler = None
+
+def active() -> Profiler | None:
+    return _profiler
+
+def _span_stack() -> list[Span]:
+    if not hasattr(_local, "spans"):
+        _local.spans = []
+    return _local.spans
+
+def _current_tags() -> dict[str, Any]:
+    return getattr(_local, "tags", {})
+
+@contextmanager
+def tags(**new_tags) -> Generator[None, None, None]:
+    """
+    Tags every span recorded by this thread inside the block (e.g. fen, algorithm)
+    """
+    previous = _current_tags()
+    _local.tags = {**previous, **new_tags}
+    try:
+        yield
+    finally:
+        _local.tags = previous
+
+@contextmanager
+def span(name: str, **attrs) -> Generator[dict[str, Any], None, None]:
+    """
+    Times the block. Yields the span attributes so the caller can attach
+    measurements (depth, nodes, ...) while the span is open.
+    """
+    profiler = _profiler
+    if profiler is None:
+        yield attrs
+        return
+
+    current = Span(name=name, start=time.perf_counter(), thread_id=threading.get_ident(), tags=_current_tags(), attrs=attrs)
+    stack = _span_stack()
+    stack.append(current)
+    try:
+        yield current.attrs
+    finally:
+        current.duration = time.perf_counter() - current.start
+        stack.pop()
+        profiler.record(current)
+
+def annotate(**attrs):
+    """
+    Attaches attributes to the innermost open span of this thread
+    """
+    if _profiler is None:
+        return
+    stack = _span_stack()
+    if stack:
+        stack[-1].attrs.update(attrs)
+
+def profiled(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator that wraps every call of the function in a span
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,134 @@
+"""
+Anytime SARFA: saliency snapshots that get refined while the caller waits.
+
+The first pass searches every perturbation at a very low depth so a coarse
+map is available almost immediately, later passes repeat the sweep deeper.
+Callers display whatever snapshot they have and stop iterating at their
+deadline.
+
+```python
+for snapshot in progressive_saliency(engine, fen, deadline=2.0):
+    render(snapshot.saliency, snapshot.depth, snapshot.confidence)
+
+async for snapshot in progressive_saliency_async(engine, fen):
+    ...
+```
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncGenerator, Generator, Sequence
+
+import chess
+import chess.engine
+
+from .engine import Engine
+from .perturbation_handler import Perturber, RemovalPerturber
+from .saliency_calculator import SarfaBaseline, EPSILON
+
+DEFAULT_DEPTHS = (1, 4, 8, 12, 16)
+
+@dataclass()
+class SaliencySnapshot:
+    saliency: dict[str, float]
+    level: int # index of the pass in the schedule
+    depth: int | None # search depth of the pass, None for time or node limited passes
+    limit: chess.engine.Limit
+    confidence: float # mean of `square_confidence`
+    square_confidence: dict[str, float] # 1 - change since the previous pass, 0 after the first pass, 1 for base cases
+    squares_refined: int # squares searched at this level so far
+    squares_total: int
+    complete: bool # every square has been searched at this level
+    optimal_move: str | None
+    elapsed: float
+
+def _schedule_limits(schedule: Sequence[int | chess.engine.Limit]) -> list[chess.engine.Limit]:
+    return [chess.engine.Limit(depth=step) if isinstance(step, int) else step for step in schedule]
+
+def progressive_saliency(engine: Engine, fen: str, action: chess.Move | None = None, schedule: Sequence[int | chess.engine.Limit] = DEFAULT_DEPTHS, deadline: float | None = None, snapshot_every: int | None = None, perturber_class: type[Perturber] = RemovalPerturber) -> Generator[SaliencySnapshot, None, None]:
+    """
+    Yields a snapshot after every pass of the schedule (depths or limits)
+
+    Params
+    - deadline: float (seconds, no new pass or search is started after it)
+    - snapshot_every: int (also yield a partial snapshot every N refined squares)
+    """
+    start = time.perf_counter()
+    board = chess.Board(fen)
+    perturbations = list(perturber_class(board).process())
+    limits = _schedule_limits(schedule)
+
+    saliency: dict[str, float] = {}
+    square_confidence: dict[str, float] = {}
+    settled: set[str] = set() # base cases, the same at every depth
+
+    def out_of_time() -> bool:
+        return deadline is not None and time.perf_counter() - start > deadline
+
+    def snapshot(level: int, limit: chess.engine.Limit, refined: int, complete: bool, optimal_move: str | None) -> SaliencySnapshot:
+        return SaliencySnapshot(
+            saliency=dict(saliency),
+            level=level,
+            depth=limit.depth,
+            limit=limit,
+            confidence=sum(square_confidence.values()) / len(square_confidence) if square_confidence else 0.0,
+            square_confidence=dict(square_confidence),
+            squares_refined=refined,
+            squares_total=len(perturbations),
+            complete=complete,
+            optimal_move=optimal_move,
+            elapsed=time.perf_counter() - start,
+        )
+
+    for level, limit in enumerate(limits):
+        if out_of_time():
+            return
+
+        saliency_calculator = SarfaBaseline(engine, board, limit=limit)
+        optimal_move = action.uci() if action else None
+        refined = 0
+        for perturbed_board, perturbed_position_str in perturbations:
+            if perturbed_position_str in settled:
+                refined += 1
+                continue
+            if out_of_time():
+                yield snapshot(level, limit, refined, False, optimal_move)
+                return
+
+            result = saliency_calculator.compute(perturbed_board, action)
+            if result.dP == EPSILON:
+                settled.add(perturbed_position_str)
+                square_confidence[perturbed_position_str] = 1.0
+            elif perturbed_position_str in saliency:
+                square_confidence[perturbed_position_str] = max(0.0, 1 - abs(result.saliency - saliency[perturbed_position_str]))
+            else:
+                square_confidence[perturbed_position_str] = 0.0
+            saliency[perturbed_position_str] = result.saliency
+            if optimal_move is None and result.optimal_move is not None:
+                optimal_move = str(result.optimal_move)
+
+            refined += 1
+            if snapshot_every and refined % snapshot_every == 0 and refined < len(perturbations):
+                yield snapshot(level, limit, refined, False, optimal_move)
+
+        yield snapshot(level, limit, refined, True, optimal_move)
+
+async def progressive_saliency_async(engine: Engine, fen: str, action: chess.Move | None = None, schedule: Sequence[int | chess.engine.Limit] = DEFAULT_DEPTHS, deadline: float | None = None, snapshot_every: int | None = None, perturber_class: type[Perturber] = RemovalPerturber) -> AsyncGenerator[SaliencySnapshot, None]:
+    """
+    `progressive_saliency` as an async iterator, the engine calls run in a worker thread
+    """
+    snapshots = progressive_saliency(engine, fen, action, schedule=schedule, deadline=deadline, snapshot_every=snapshot_every, perturber_class=perturber_class)
+    done = object()
+    try:
+        while True:
+            snapshot = await asyncio.to_thread(next, snapshots, done)
+            if snapshot is done:
+                return
+            yield snapshot
+    finally:
+        try:
+            snapshots.close()
+        except ValueError:
+            # cancelled while the worker thread is still inside the generator
+            pass
@@ -1,8 +1,11 @@
 from dataclasses import dataclass
 
 import chess
+import chess.engine
+from . import profiling
 from .engine import Engine
 from .core import computeSaliencyUsingSarfa
+from .move_delta import ALL_LINES, MoveDelta
 
 EPSILON = 1e-9
 
@@ -14,21 +17,39 @@ class SarfaComputeResult:
     optimal_move_q_val: float
 
 class SarfaBaseline:
-    def __init__(self, engine: Engine, original_board: chess.Board, runtime: float=2.0):
+    def __init__(self, engine: Engine, original_board: chess.Board, runtime: float=2.0, limit: chess.engine.Limit | None = None):
+        """
+        Params
+        - engine: Engine (or anything with the `q_values` contract)
+        - runtime: float (seconds of search per position)
+        - limit: chess.engine.Limit (optional, overrides `runtime` e.g. node limited search for reproducible runs)
+        """
         self.engine = engine
         self.runtime = runtime
+        self.limit = limit
 
         self.original_board = original_board
-        self.original_board_actions = set(self.original_board.legal_moves) 
+        # common actions of perturbed boards are derived from the root moves, see `MoveDelta`
+        self.move_delta = MoveDelta(self.original_board)
+        self.original_board_actions = self.move_delta.root_actions
 
         # calculate the q-values for the original board
-        self.q_vals_original_board, _ = self.engine.q_values(self.original_board, self.original_board_actions, multipv=len(self.original_board_actions),runtime=runtime)
+        self.q_vals_original_board, _ = self.engine.q_values(self.original_board, self.original_board_actions, multipv=len(self.original_board_actions),runtime=runtime, limit=limit)
+        self._original_moves = {move: chess.Move.from_uci(move) for move in self.q_vals_original_board}
 
+    def _q_vals_common(self, common_actions: set[chess.Move]) -> dict[str, float]:
+        """
+        Q-values of the original board restricted to the common actions
+        """
+        return {move: q_val for move, q_val in self.q_vals_original_board.items() if self._original_moves[move] in common_actions}
+
+    @profiling.profiled("sarfa.compute")
     def compute(self, perturbed_board: chess.Board, action: chess.Move | None = None, allow_defense: bool = False) -> SarfaComputeResult:
 
         # BASE CASES
         # Case 1: Perturbed piece puts it into check
         if perturbed_board.was_into_check():
+            profiling.annotate(base_case="into_check")
             return SarfaComputeResult(
                 saliency=0,
                 dP=EPSILON,
@@ -38,6 +59,7 @@ class SarfaBaseline:
         
         # Case 2: if the original move is illegal in this perturbed state
         if action and not perturbed_board.is_legal(action):
+            profiling.annotate(base_case="illegal_action")
             return SarfaComputeResult(
                 saliency=1,
                 dP=EPSILON,
@@ -46,14 +68,13 @@ class SarfaBaseline:
             )
 
         # action space shared by the original board
-        # and the original board
-        perturbed_board_actions = set(perturbed_board.legal_moves)
-        common_actions: set[chess.Move] = self.original_board_actions & perturbed_board_actions
+        # and the perturbed board
+        common_actions: set[chess.Move] = self.move_delta.common_actions(perturbed_board)
 
-        
 
         # was the action you ran posssible in these boards
         if action and action not in common_actions or len(common_actions) < 1:
+            profiling.annotate(base_case="no_common_action")
             return SarfaComputeResult(
                 saliency=1,
                 dP=EPSILON,
@@ -63,11 +84,12 @@ class SarfaBaseline:
         
         # only keep the keys which are in the common set 
         # of legal actions
-        q_vals_original_board_common: dict[str, float] = {move: q_val for move, q_val in self.q_vals_original_board.items() if chess.Move.from_uci(move) in common_actions}
+        q_vals_original_board_common: dict[str, float] = self._q_vals_common(common_actions)
         # final optimal action by max q-value
         optimal_move_original_board: str = max(q_vals_original_board_common, key=q_vals_original_board_common.get)
 
-        q_vals_perturbed_board, _ = self.engine.q_values(perturbed_board, common_actions, multipv=len(perturbed_board_actions), runtime=self.runtime)
+        # every line of the perturbed board, engines cap multipv at its legal move count
+        q_vals_perturbed_board, _ = self.engine.q_values(perturbed_board, common_actions, multipv=ALL_LINES, runtime=self.runtime, limit=self.limit)
 
         
         # overrride optimal action if provided
@@ -86,19 +108,64 @@ class SarfaBaseline:
             optimal_move_q_val = max(q_vals_original_board_common.values())
         )
     
+    @profiling.profiled("sarfa.compute_actions")
+    def compute_actions(self, perturbed_board: chess.Board, actions: list[chess.Move], allow_defense: bool = False) -> dict[str, SarfaComputeResult]:
+        """
+        `compute` for several target actions at once. The perturbed board is
+        searched once (the same request `compute` makes) and every action is
+        scored from that multipv output.
+        """
+        # Case 1: Perturbed piece puts it into check
+        if perturbed_board.was_into_check():
+            profiling.annotate(base_case="into_check")
+            return {str(action): SarfaComputeResult(saliency=0, dP=EPSILON, optimal_move=action, optimal_move_q_val=float("inf")) for action in actions}
+
+        common_actions: set[chess.Move] = self.move_delta.common_actions(perturbed_board)
+
+        results: dict[str, SarfaComputeResult] = {}
+        scored_actions = []
+        for action in actions:
+            # Case 2 and 3: the action is illegal or not shared by both boards
+            if not perturbed_board.is_legal(action) or action not in common_actions:
+                results[str(action)] = SarfaComputeResult(saliency=1, dP=EPSILON, optimal_move=action, optimal_move_q_val=0)
+            else:
+                scored_actions.append(action)
+
+        if not scored_actions:
+            profiling.annotate(base_case="no_common_action")
+            return results
+
+        q_vals_original_board_common: dict[str, float] = self._q_vals_common(common_actions)
+        q_vals_perturbed_board, _ = self.engine.q_values(perturbed_board, common_actions, multipv=ALL_LINES, runtime=self.runtime, limit=self.limit)
+
+        for action in scored_actions:
+            saliency, dP, _, _, _, _ = computeSaliencyUsingSarfa(
+                str(action),
+                q_vals_original_board_common, q_vals_perturbed_board,
+                allow_defense_check=allow_defense)
+            results[str(action)] = SarfaComputeResult(
+                saliency=saliency,
+                dP=dP,
+                optimal_move=str(action),
+                optimal_move_q_val=max(q_vals_original_board_common.values())
+            )
+
+        return results
+
+    @profiling.profiled("sarfa.compute_q_values")
     def compute_q_values(self, perturbed_board: chess.Board) -> tuple[dict[str, float], dict[str, float], str]:
 
         # action space shared by the original board
-        # and the original board
-        common_actions: set[chess.Move] = self.original_board_actions & set(perturbed_board.legal_moves)
+        # and the perturbed board
+        common_actions: set[chess.Move] = self.move_delta.common_actions(perturbed_board)
         
         # only keep the keys which are in the common set 
         # of legal actions
-        q_vals_original_board_common: dict[str, float] = {move: q_val for move, q_val in self.q_vals_original_board.items() if chess.Move.from_uci(move) in common_actions}
+        q_vals_original_board_common: dict[str, float] = self._q_vals_common(common_actions)
         # final optimal action by max q-value
         optimal_move_original_board: str = max(q_vals_original_board_common, key=q_vals_original_board_common.get)
 
-        q_vals_perturbed_board, _ = self.engine.q_values(perturbed_board, common_actions, runtime=self.runtime)
+        q_vals_perturbed_board, _ = self.engine.q_values(perturbed_board, common_actions, runtime=self.runtime, limit=self.limit)
 
         return q_vals_original_board_common, q_vals_perturbed_board, optimal_move_original_board
 
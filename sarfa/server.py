@@ -0,0 +1,486 @@
+"""
+Local HTTP explanation service.
+
+```bash
+python -m sarfa.server --engine ./stockfish_15_x64_avx2 --pool-size 4 --port 8000
+
+curl -s localhost:8000/explain -d '{"fen": "...", "algorithm": "baseline", "budget": {"nodes": 20000}}'
+curl -s localhost:8000/metrics
+```
+
+`POST /explain` takes a JSON body with
+- fen: str
+- algorithm: str (one of `ALGORITHMS`, default "baseline")
+- action: str (optional UCI move to explain, defaults to the engine's best move)
+- budget: dict (optional search limit per engine call with `nodes`, `time` and/or `depth`)
+- deadline: float (optional seconds for the whole request)
+- png: bool (optional, adds the base64 heatmap rendered by the board visualization)
+- svg: bool (optional, adds the same heatmap as an SVG string, rendered without cairo)
+
+Engine searches run on a fixed pool of engines behind a shared
+`QValueDispatcher`, so identical positions are only searched once across
+requests. Concurrent identical requests share one computation. A request
+that misses its deadline gets a 504. A computation stops before its next
+engine search once every request waiting for it is past its deadline.
+Malformed bodies and positions without legal moves get a 400, failures
+while computing an explanation a 500.
+"""
+
+import argparse
+import base64
+import bisect
+import json
+import math
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Generator, Hashable
+
+import chess
+import chess.engine
+
+from .algorithms import sarfa_baseline_saliency, empty_spaces_saliency, offense_defense_saliency, sequential_saliency
+from .dispatch import QValueDispatcher
+from .engine import make_engine, load_layout, resolve_engine_spec
+from .tablebase import TablebaseEngine
+
+DEFAULT_BUDGET = {"nodes": 20_000}
+DEFAULT_DEADLINE = 60.0
+DEFAULT_POOL_SIZE = 4
+BUDGET_KEYS = ("nodes", "time", "depth")
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _baseline(engine, fen, action, limit) -> dict[str, float]:
+    return sarfa_baseline_saliency(engine, fen, action, limit=limit)
+
+def _add_pawn(engine, fen, action, limit) -> dict[str, float]:
+    return empty_spaces_saliency(engine, fen, action, limit=limit)[0]
+
+def _offense_defense(engine, fen, action, limit) -> dict[str, tuple[str, float]]:
+    return offense_defense_saliency(engine, fen, action, limit=limit)[0]
+
+def _sequential(engine, fen, action, limit) -> dict[str, float]:
+    # follows the engine's principal line, the action is ignored
+    return sequential_saliency(engine, fen, limit=limit)[0]
+
+# name: (engine, fen, action, limit) -> saliency map
+ALGORITHMS: dict[str, Callable[[Any, str, chess.Move | None, chess.engine.Limit], dict]] = {
+    "baseline": _baseline,
+    "add_pawn": _add_pawn,
+    "offense_defense": _offense_defense,
+    "sequential": _sequential,
+}
+
+class DeadlineExceeded(Exception):
+    pass
+
+class BadRequest(ValueError):
+    """
+    Invalid /explain body, answered with 400. Errors raised while computing an explanation are answered with 500.
+    """
+
+class EnginePool:
+    """
+    Fixed set of engines with the `q_values` contract. Every call borrows an
+    idle engine, so at most `size` searches run at the same time.
+    """
+
+    def __init__(self, engines: list):
+        self.engines = list(engines)
+        self.size = len(self.engines)
+        self._idle: queue.Queue = queue.Queue()
+        for engine in self.engines:
+            self._idle.put(engine)
+
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._searches = 0
+        self._started = time.monotonic()
+
+    @classmethod
+    def from_spec(cls, engine_spec: str, size: int | None = None, options: dict[str, Any] | None = None) -> "EnginePool":
+        """
+        `size` engines, defaulting to the process count of the calibrated layout (or DEFAULT_POOL_SIZE)
+        """
+        if size is None:
+            layout = load_layout(resolve_engine_spec(engine_spec))
+            size = layout.processes if layout else DEFAULT_POOL_SIZE
+        return cls([make_engine(engine_spec, options, layout=True) for _ in range(size)])
+
+    @contextmanager
+    def borrow(self) -> Generator[Any, None, None]:
+        engine = self._idle.get()
+        start = time.perf_counter()
+        with self._lock:
+            self._busy += 1
+        try:
+            yield engine
+        finally:
+            with self._lock:
+                self._busy -= 1
+                self._busy_seconds += time.perf_counter() - start
+                self._searches += 1
+            self._idle.put(engine)
+
+    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, float], str]:
+        with self.borrow() as engine:
+            return engine.q_values(board, candidate_actions, multipv=multipv, runtime=runtime, limit=limit)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            uptime = time.monotonic() - self._started
+            return {
+                "size": self.size,
+                "busy": self._busy,
+                "searches": self._searches,
+                "busy_seconds": self._busy_seconds,
+                "utilisation": self._busy_seconds / (self.size * uptime) if uptime > 0 else 0.0,
+            }
+
+    def close(self):
+        for engine in self.engines:
+            engine.close()
+
+class _Computation:
+    """
+    An in-flight explanation shared by identical requests. Its deadline is the
+    latest deadline of the requests waiting for it, so it stops only when
+    none of them is left.
+    """
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.future: Future | None = None
+
+class _DeadlineEngine:
+    """
+    Refuses to start new searches once the computation's deadline has passed
+    """
+
+    def __init__(self, engine, computation: _Computation):
+        self.engine = engine
+        self.computation = computation
+
+    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, float], str]:
+        if time.monotonic() > self.computation.deadline:
+            raise DeadlineExceeded()
+        return self.engine.q_values(board, candidate_actions, multipv=multipv, runtime=runtime, limit=limit)
+
+class LatencyHistogram:
+    """
+    Cumulative latency buckets (Prometheus style) plus percentiles over the most recent samples
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS, window: int = 10_000):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            self.samples.append(seconds)
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            samples = sorted(self.samples)
+            cumulative, buckets = 0, {}
+            for bound, count in zip((*self.buckets, math.inf), self.counts):
+                cumulative += count
+                buckets["+Inf" if bound == math.inf else str(bound)] = cumulative
+
+            def percentile(p: float) -> float | None:
+                if not samples:
+                    return None
+                return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+            return {
+                "count": self.count,
+                "sum": self.total,
+                "buckets": buckets,
+                "p50": percentile(0.50),
+                "p90": percentile(0.90),
+                "p99": percentile(0.99),
+            }
+
+class ExplanationService:
+    def __init__(self, pool: EnginePool, workers: int | None = None, cache_size: int | None = 100_000, default_budget: dict[str, float] | None = None, default_deadline: float = DEFAULT_DEADLINE, syzygy_path: str | None = None):
+        """
+        Params
+        - pool: EnginePool
+        - workers: int (explanations computed at the same time, defaults to the pool size)
+        - cache_size: int (q-values kept by the shared dispatcher)
+        - syzygy_path: str (optional Syzygy tablebase directory answering endgame positions before the pool)
+        """
+        self.pool = pool
+        self.tablebase = TablebaseEngine(syzygy_path, fallback=pool) if syzygy_path else None
+        self.dispatcher = QValueDispatcher(self.tablebase or pool, cache_size=cache_size)
+        self.default_budget = default_budget or DEFAULT_BUDGET
+        self.default_deadline = default_deadline
+        self.executor = ThreadPoolExecutor(max_workers=workers or pool.size, thread_name_prefix="explain")
+
+        self._lock = threading.Lock()
+        self._in_flight: dict[Hashable, _Computation] = {}
+        self._queued = 0
+        self.counters = {"requests": 0, "coalesced": 0, "deadline_exceeded": 0, "bad_requests": 0, "errors": 0}
+        self.latency = LatencyHistogram()
+        self.latency_per_algorithm: dict[str, LatencyHistogram] = {name: LatencyHistogram() for name in ALGORITHMS}
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def parse_request(self, request: dict[str, Any]) -> tuple[str, str, chess.Move | None, dict[str, float], float, bool, bool]:
+        """
+        Validates an /explain body, raises BadRequest on bad input
+        """
+        try:
+            return self._parse_request(request)
+        except ValueError as e:
+            # python-chess raises ValueError subclasses for unparsable FENs and moves
+            raise BadRequest(str(e)) from e
+
+    def _parse_request(self, request: dict[str, Any]) -> tuple[str, str, chess.Move | None, dict[str, float], float, bool, bool]:
+        if not isinstance(request, dict) or not isinstance(request.get("fen"), str):
+            raise ValueError("expected a JSON object with a 'fen'")
+        board = chess.Board(request["fen"])
+        fen = board.fen()
+        if not board.is_valid():
+            raise ValueError(f"invalid position {fen}")
+        if not any(board.legal_moves):
+            raise ValueError(f"no legal moves in {fen}, nothing to explain")
+
+        algorithm = request.get("algorithm", "baseline")
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"unknown algorithm {algorithm!r}, expected one of {sorted(ALGORITHMS)}")
+
+        action = None
+        if request.get("action"):
+            if not isinstance(request["action"], str):
+                raise ValueError("action must be a UCI move string")
+            action = chess.Move.from_uci(request["action"])
+            if not board.is_legal(action):
+                raise ValueError(f"illegal action {request['action']} in {fen}")
+
+        budget = request.get("budget") or self.default_budget
+        if not isinstance(budget, dict) or not budget or set(budget) - set(BUDGET_KEYS):
+            raise ValueError(f"budget must be an object with {', '.join(BUDGET_KEYS)}")
+        if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0 for value in budget.values()):
+            raise ValueError(f"budget values must be positive numbers, got {budget}")
+        budget = {key: float(value) if key == "time" else int(value) for key, value in budget.items()}
+
+        deadline = request.get("deadline", self.default_deadline)
+        if not isinstance(deadline, (int, float)) or isinstance(deadline, bool) or not deadline > 0:
+            raise ValueError(f"deadline must be a positive number of seconds, got {deadline!r}")
+        deadline = float(deadline)
+        return fen, algorithm, action, budget, deadline, bool(request.get("png", False)), bool(request.get("svg", False))
+
+    def explain(self, request: dict[str, Any]) -> dict[str, Any]:
+        """
+        Computes (or joins an identical in-flight computation of) an explanation.
+        Raises BadRequest for bad requests and DeadlineExceeded when the deadline passes.
+        """
+        start = time.monotonic()
+        self._count("requests")
+        try:
+            fen, algorithm, action, budget, deadline, png, svg = self.parse_request(request)
+        except BadRequest:
+            self._count("bad_requests")
+            raise
+
+        key = (fen, algorithm, action, tuple(sorted(budget.items())), png, svg)
+        coalesced = False
+        while True:
+            with self._lock:
+                computation = self._in_flight.get(key)
+                if computation is not None:
+                    coalesced = True
+                    self.counters["coalesced"] += 1
+                    # keeps the shared computation alive until this request's own deadline
+                    computation.deadline = max(computation.deadline, start + deadline)
+                else:
+                    self._queued += 1
+                    computation = _Computation(start + deadline)
+                    computation.future = self.executor.submit(self._compute, key, computation, fen, algorithm, action, budget, png, svg)
+                    self._in_flight[key] = computation
+
+            try:
+                result = computation.future.result(timeout=max(0.0, start + deadline - time.monotonic()))
+                break
+            except DeadlineExceeded:
+                if time.monotonic() < start + deadline:
+                    # joined a computation that had already given up, start over
+                    continue
+                self._count("deadline_exceeded")
+                raise
+            except FutureTimeoutError:
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded()
+            except Exception:
+                self._count("errors")
+                raise
+
+        elapsed = time.monotonic() - start
+        self.latency.record(elapsed)
+        self.latency_per_algorithm[algorithm].record(elapsed)
+        return {**result, "coalesced": coalesced, "elapsed": elapsed}
+
+    def _compute(self, key: Hashable, computation: _Computation, fen: str, algorithm: str, action: chess.Move | None, budget: dict[str, float], png: bool, svg: bool) -> dict[str, Any]:
+        with self._lock:
+            self._queued -= 1
+        try:
+            engine = _DeadlineEngine(self.dispatcher, computation)
+            limit = chess.engine.Limit(**budget)
+            board = chess.Board(fen)
+
+            saliency = ALGORITHMS[algorithm](engine, fen, action, limit)
+            best_move = action
+            if best_move is None:
+                # same request as the one SarfaBaseline makes for the original board, answered from the cache
+                legal_moves = set(board.legal_moves)
+                _, optimal_action = engine.q_values(board, legal_moves, multipv=len(legal_moves), limit=limit)
+                best_move = chess.Move.from_uci(optimal_action)
+
+            result = {
+                "fen": fen,
+                "algorithm": algorithm,
+                "action": action.uci() if action else None,
+                "best_move": best_move.uci(),
+                "saliency": dict(saliency),
+            }
+            if png or svg:
+                result.update(self._render(board, algorithm, saliency, best_move, png, svg))
+            return result
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is computation:
+                    del self._in_flight[key]
+
+    def _render(self, board: chess.Board, algorithm: str, saliency: dict, best_move: chess.Move, png: bool, svg: bool) -> dict[str, str]:
+        from .visualization import BoardVisualization, OffenseDefenseBoardVisualization
+
+        visualization_class = OffenseDefenseBoardVisualization if algorithm == "offense_defense" else BoardVisualization
+        images = {}
+        if svg:
+            images["svg"] = str(visualization_class(board).svg(saliency, best_move))
+        if png:
+            with tempfile.TemporaryDirectory() as directory:
+                path = visualization_class(board, drawing_file=os.path.join(directory, "board")).show_heatmap(saliency, best_move)
+                with open(path, "rb") as f:
+                    images["png"] = base64.b64encode(f.read()).decode()
+        return images
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            queue_depth = self._queued
+            in_flight = len(self._in_flight)
+        return {
+            **counters,
+            "queue_depth": queue_depth,
+            "in_flight": in_flight,
+            "engine": self.pool.stats(),
+            "dispatcher": self.dispatcher.stats.summary(),
+            "tablebase": {"hits": self.tablebase.hits, "fallbacks": self.tablebase.fallbacks} if self.tablebase else None,
+            "latency": self.latency.summary(),
+            "latency_per_algorithm": {name: histogram.summary() for name, histogram in self.latency_per_algorithm.items() if histogram.count},
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.pool.close()
+        if self.tablebase:
+            self.tablebase.close()
+
+class ExplanationRequestHandler(BaseHTTPRequestHandler):
+    server: "ExplanationServer"
+
+    def _send_json(self, status: int, payload: dict[str, Any]):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.server.service.metrics())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/explain":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._send_json(400, {"error": f"invalid request body: {e}"})
+            return
+
+        try:
+            self._send_json(200, self.server.service.explain(request))
+        except BadRequest as e:
+            self._send_json(400, {"error": str(e)})
+        except DeadlineExceeded:
+            self._send_json(504, {"error": "deadline exceeded"})
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format: str, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class ExplanationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], service: ExplanationService, verbose: bool = False):
+        super().__init__(address, ExplanationRequestHandler)
+        self.service = service
+        self.verbose = verbose
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Local HTTP saliency explanation service")
+    parser.add_argument("--engine", default="auto", help='"fake", "fake-uci", "auto" (Stockfish if found, else fake) or a path to a UCI engine')
+    parser.add_argument("--pool-size", type=int, default=None, help="number of engine processes, defaults to the calibrated layout (python -m sarfa.tuning) or 4")
+    parser.add_argument("--workers", type=int, default=None, help="explanations computed concurrently, defaults to the pool size")
+    parser.add_argument("--cache-size", type=int, default=100_000, help="q-values kept by the shared dispatcher")
+    parser.add_argument("--nodes", type=int, default=DEFAULT_BUDGET["nodes"], help="default node budget per engine search")
+    parser.add_argument("--deadline", type=float, default=DEFAULT_DEADLINE, help="default deadline per request in seconds")
+    parser.add_argument("--syzygy", default=None, help="Syzygy tablebase directory for exact endgame q-values")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    pool = EnginePool.from_spec(args.engine, args.pool_size)
+    service = ExplanationService(pool, workers=args.workers, cache_size=args.cache_size, default_budget={"nodes": args.nodes}, default_deadline=args.deadline, syzygy_path=args.syzygy)
+    server = ExplanationServer((args.host, args.port), service, verbose=args.verbose)
+    print(f"serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+In-process static evaluator with the `Engine.q_values` contract.
+
+Every (board, move) pair of a batch is played and evaluated in one
+vectorized numpy pass over 12 piece bitboards per pair:
+- material plus piece-square tables (the "simplified evaluation function")
+- minus the best capture the opponent has afterwards, a one-ply static
+  exchange approximation: the captured value, less the capturing piece's
+  value when the target is defended. Sliding attacks come from Kogge-Stone
+  fills.
+
+There is no search, so mates and deeper tactics are invisible. It is a
+coarse, cheap screening stage, not a replacement for Stockfish.
+
+```python
+evaluator = StaticEvaluator()
+saliency = static_saliency(evaluator, fen, action) # every perturbation x common action in one pass
+```
+
+```bash
+python -m sarfa.static_eval --engine ./stockfish_15_x64_avx2 --nodes 20000 # agreement report on the dataset
+```
+"""
+
+import argparse
+import json
+import time
+from collections import OrderedDict
+
+import chess
+import chess.engine
+import numpy as np
+
+from . import profiling
+from .algorithms import sarfa_baseline_saliency
+from .perturbation_handler import Perturber, RemovalPerturber, position_hash
+
+# centipawns, indexed by piece type
+PIECE_VALUES = np.array([0, 100, 320, 330, 500, 900, 0], dtype=np.int32)
+
+# piece-square tables for white, rank 8 first (as the board is printed)
+_PST_RANKS = {
+    chess.PAWN: [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [50, 50, 50, 50, 50, 50, 50, 50],
+        [10, 10, 20, 30, 30, 20, 10, 10],
+        [5, 5, 10, 25, 25, 10, 5, 5],
+        [0, 0, 0, 20, 20, 0, 0, 0],
+        [5, -5, -10, 0, 0, -10, -5, 5],
+        [5, 10, 10, -20, -20, 10, 10, 5],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+    ],
+    chess.KNIGHT: [
+        [-50, -40, -30, -30, -30, -30, -40, -50],
+        [-40, -20, 0, 0, 0, 0, -20, -40],
+        [-30, 0, 10, 15, 15, 10, 0, -30],
+        [-30, 5, 15, 20, 20, 15, 5, -30],
+        [-30, 0, 15, 20, 20, 15, 0, -30],
+        [-30, 5, 10, 15, 15, 10, 5, -30],
+        [-40, -20, 0, 5, 5, 0, -20, -40],
+        [-50, -40, -30, -30, -30, -30, -40, -50],
+    ],
+    chess.BISHOP: [
+        [-20, -10, -10, -10, -10, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 10, 10, 5, 0, -10],
+        [-10, 5, 5, 10, 10, 5, 5, -10],
+        [-10, 0, 10, 10, 10, 10, 0, -10],
+        [-10, 10, 10, 10, 10, 10, 10, -10],
+        [-10, 5, 0, 0, 0, 0, 5, -10],
+        [-20, -10, -10, -10, -10, -10, -10, -20],
+    ],
+    chess.ROOK: [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [5, 10, 10, 10, 10, 10, 10, 5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [0, 0, 0, 5, 5, 0, 0, 0],
+    ],
+    chess.QUEEN: [
+        [-20, -10, -10, -5, -5, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 5, 5, 5, 0, -10],
+        [-5, 0, 5, 5, 5, 5, 0, -5],
+        [0, 0, 5, 5, 5, 5, 0, -5],
+        [-10, 5, 5, 5, 5, 5, 0, -10],
+        [-10, 0, 5, 0, 0, 0, 0, -10],
+        [-20, -10, -10, -5, -5, -10, -10, -20],
+    ],
+    chess.KING: [
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-20, -30, -30, -40, -40, -30, -30, -20],
+        [-10, -20, -20, -20, -20, -20, -20, -10],
+        [20, 20, 0, 0, 0, 0, 20, 20],
+        [20, 30, 10, 0, 0, 10, 30, 20],
+    ],
+}
+
+def _plane(piece_type: chess.PieceType, color: chess.Color) -> int:
+    return (piece_type - 1) + (0 if color == chess.WHITE else 6)
+
+def _square_values() -> np.ndarray:
+    """
+    (12, 64) centipawns of a piece on a square, material plus piece-square table,
+    negative for black
+    """
+    values = np.zeros((12, 64), dtype=np.int32)
+    for piece_type, ranks in _PST_RANKS.items():
+        white = np.array(ranks[::-1], dtype=np.int32).reshape(64) + PIECE_VALUES[piece_type]
+        values[_plane(piece_type, chess.WHITE)] = white
+        values[_plane(piece_type, chess.BLACK)] = -white[[chess.square_mirror(square) for square in chess.SQUARES]]
+    return values
+
+SQUARE_VALUES = _square_values()
+
+_FILE_A = np.uint64(chess.BB_FILE_A)
+_FILE_H = np.uint64(chess.BB_FILE_H)
+_NOT_A = ~_FILE_A
+_NOT_H = ~_FILE_H
+_NOT_AB = ~(_FILE_A | np.uint64(chess.BB_FILE_B))
+_NOT_GH = ~(_FILE_H | np.uint64(chess.BB_FILE_G))
+_ONE = np.uint64(1)
+
+def _shift(bitboards: np.ndarray, amount: int, mask: np.uint64) -> np.ndarray:
+    if amount > 0:
+        return (bitboards << np.uint64(amount)) & mask
+    return (bitboards >> np.uint64(-amount)) & mask
+
+_ALL = np.uint64(chess.BB_ALL)
+# (shift, mask of the squares a shifted bit may land on)
+_ORTHOGONAL = ((8, _ALL), (-8, _ALL), (1, _NOT_A), (-1, _NOT_H))
+_DIAGONAL = ((9, _NOT_A), (7, _NOT_H), (-7, _NOT_A), (-9, _NOT_H))
+_KNIGHT = ((17, _NOT_A), (15, _NOT_H), (10, _NOT_AB), (6, _NOT_GH), (-6, _NOT_AB), (-10, _NOT_GH), (-15, _NOT_A), (-17, _NOT_H))
+
+def _slide(sliders: np.ndarray, empty: np.ndarray, directions) -> np.ndarray:
+    """
+    Kogge-Stone style fill: squares attacked by `sliders`, stopping at the first occupied square
+    """
+    attacks = np.zeros_like(sliders)
+    for amount, mask in directions:
+        ray = sliders
+        for _ in range(7):
+            ray = _shift(ray, amount, mask)
+            attacks |= ray
+            ray &= empty
+    return attacks
+
+def _attacks_by_type(planes: np.ndarray, color: chess.Color | np.ndarray, occupied: np.ndarray) -> np.ndarray:
+    """
+    (n, 6) squares attacked by the pawns .. kings of `color` (per row when `color` is an array)
+    """
+    white = np.asarray(color, dtype=bool)
+    offset = np.where(white, 0, 6)
+    rows = np.arange(len(planes))
+    empty = ~occupied
+    pieces = [planes[rows, offset + piece_type - 1] for piece_type in chess.PIECE_TYPES]
+
+    pawns = pieces[0]
+    white_pawn_attacks = _shift(pawns, 9, _NOT_A) | _shift(pawns, 7, _NOT_H)
+    black_pawn_attacks = _shift(pawns, -7, _NOT_A) | _shift(pawns, -9, _NOT_H)
+    knights = np.zeros_like(pawns)
+    for amount, mask in _KNIGHT:
+        knights |= _shift(pieces[1], amount, mask)
+    kings = np.zeros_like(pawns)
+    for amount, mask in _ORTHOGONAL + _DIAGONAL:
+        kings |= _shift(pieces[5], amount, mask)
+
+    return np.stack([
+        np.where(white, white_pawn_attacks, black_pawn_attacks),
+        knights,
+        _slide(pieces[2], empty, _DIAGONAL),
+        _slide(pieces[3], empty, _ORTHOGONAL),
+        _slide(pieces[4], empty, _DIAGONAL) | _slide(pieces[4], empty, _ORTHOGONAL),
+        kings,
+    ], axis=1)
+
+def board_planes(board: chess.Board) -> np.ndarray:
+    """
+    (12,) uint64 piece bitboards, white pawn .. white king, black pawn .. black king
+    """
+    return np.array([board.pieces_mask(piece_type, color) for color in (chess.WHITE, chess.BLACK) for piece_type in chess.PIECE_TYPES], dtype=np.uint64)
+
+def _move_parameters(board: chess.Board, move: chess.Move) -> tuple[int, int, int, int, int, int, int]:
+    """
+    moved plane, result plane, from, to, castling rook from/to (-1), en passant victim square (-1)
+    """
+    piece_type = board.piece_type_at(move.from_square)
+    moved = _plane(piece_type, board.turn)
+    result = _plane(move.promotion, board.turn) if move.promotion else moved
+    rook_from = rook_to = ep_square = -1
+    if board.is_castling(move):
+        # standard chess, the king moves two squares and the rook comes from the corner
+        rank = chess.square_rank(move.from_square)
+        kingside = board.is_kingside_castling(move)
+        rook_from = chess.square(7 if kingside else 0, rank)
+        rook_to = chess.square(5 if kingside else 3, rank)
+    elif board.is_en_passant(move):
+        ep_square = chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square))
+    return moved, result, move.from_square, move.to_square, rook_from, rook_to, ep_square
+
+def evaluate_moves(boards: list[chess.Board], moves: list[list[chess.Move]]) -> list[np.ndarray]:
+    """
+    Q-values (pawns, from the point of view of the side to move) of `moves[i]` on `boards[i]`,
+    every pair in one vectorized pass
+    """
+    board_index, parameters = [], []
+    for i, (board, board_moves) in enumerate(zip(boards, moves)):
+        for move in board_moves:
+            board_index.append(i)
+            parameters.append(_move_parameters(board, move))
+    if not parameters:
+        return [np.empty(0) for _ in boards]
+
+    with profiling.span("static_eval.evaluate", pairs=len(parameters)):
+        board_index = np.array(board_index)
+        moved, result, from_square, to_square, rook_from, rook_to, ep_square = np.array(parameters, dtype=np.int64).T
+        movers = np.array([board.turn for board in boards], dtype=bool)[board_index]
+        rows = np.arange(len(board_index))
+
+        # play the moves
+        planes = np.stack([board_planes(board) for board in boards])[board_index]
+        from_bb = _ONE << from_square.astype(np.uint64)
+        to_bb = _ONE << to_square.astype(np.uint64)
+        planes &= ~to_bb[:, None]
+        planes[rows, moved] &= ~from_bb
+        planes[rows, result] |= to_bb
+        castling = rook_from >= 0
+        if castling.any():
+            rook_planes = np.where(movers[castling], _plane(chess.ROOK, chess.WHITE), _plane(chess.ROOK, chess.BLACK))
+            planes[rows[castling], rook_planes] &= ~(_ONE << rook_from[castling].astype(np.uint64))
+            planes[rows[castling], rook_planes] |= _ONE << rook_to[castling].astype(np.uint64)
+        en_passant = ep_square >= 0
+        if en_passant.any():
+            pawn_planes = np.where(movers[en_passant], _plane(chess.PAWN, chess.BLACK), _plane(chess.PAWN, chess.WHITE))
+            planes[rows[en_passant], pawn_planes] &= ~(_ONE << ep_square[en_passant].astype(np.uint64))
+
+        # material and piece-square tables, white minus black
+        bits = np.unpackbits(planes.view(np.uint8).reshape(len(rows), 12, 8), axis=2, bitorder="little")
+        score = np.einsum("npq,pq->n", bits.astype(np.int32), SQUARE_VALUES)
+        score = np.where(movers, score, -score)
+
+        # best capture the opponent has against the mover's pieces
+        occupied = np.bitwise_or.reduce(planes, axis=1)
+        opponent_attacks = _attacks_by_type(planes, ~movers, occupied)
+        defended = np.bitwise_or.reduce(_attacks_by_type(planes, movers, occupied), axis=1)
+        mover_offset = np.where(movers, 0, 6)
+        threat = np.zeros(len(rows), dtype=np.int32)
+        for victim in (chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN):
+            victims = planes[rows, mover_offset + victim - 1]
+            for attacker in chess.PIECE_TYPES:
+                targets = victims & opponent_attacks[:, attacker - 1]
+                hit = targets != 0
+                if not hit.any():
+                    continue
+                undefended = (targets & ~defended) != 0
+                gain = np.where(undefended, PIECE_VALUES[victim], PIECE_VALUES[victim] - PIECE_VALUES[attacker])
+                # a defended target can't be taken by the king
+                if attacker == chess.KING:
+                    gain = np.where(undefended, gain, 0)
+                threat = np.maximum(threat, np.where(hit, gain, 0))
+
+        q_values = np.round((score - threat) / 100.0, 2)
+
+    starts = np.concatenate([[0], np.cumsum([len(board_moves) for board_moves in moves])])
+    return [q_values[start:end] for start, end in zip(starts[:-1], starts[1:])]
+
+class StaticEvaluator:
+    """
+    Q-value provider with the `Engine.q_values` contract. `prefetch` scores
+    many boards in one pass, later `q_values` calls for them are lookups.
+    """
+
+    def __init__(self, cache_size: int = 100_000):
+        self.cache_size = cache_size
+        self._cache: OrderedDict[int, dict[str, float]] = OrderedDict()
+
+    def prefetch(self, boards: list[chess.Board]):
+        """
+        Scores every legal move of every board that isn't cached yet
+        """
+        keys = [position_hash(board) for board in boards]
+        missing = {key: board for key, board in zip(keys, boards) if key not in self._cache}
+        if not missing:
+            return
+        missing_boards = list(missing.values())
+        moves = [list(board.legal_moves) for board in missing_boards]
+        for key, board_moves, q_values in zip(missing, moves, evaluate_moves(missing_boards, moves)):
+            self._cache[key] = {move.uci(): float(q_value) for move, q_value in zip(board_moves, q_values)}
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, float], str]:
+        key = position_hash(board)
+        if key not in self._cache:
+            self.prefetch([board])
+        all_q_values = self._cache[key]
+
+        # its own span name, so engine statistics (calls, search time, nodes) count only real searches
+        with profiling.span("static_eval.q_values", multipv=multipv):
+            # the top `multipv` lines over every legal move, then only the candidates, like `Engine`
+            ranked = sorted(all_q_values.items(), key=lambda item: (-item[1], item[0]))[:multipv]
+            candidates = {move.uci() for move in candidate_actions}
+            score_per_move = {move: q_value for move, q_value in ranked if move in candidates}
+
+        optimal_action: str = max(score_per_move, key=score_per_move.get)
+        return score_per_move, optimal_action
+
+def static_saliency(evaluator: StaticEvaluator, fen: str, action: chess.Move | None = None, perturber_class: type[Perturber] = RemovalPerturber) -> dict[str, float]:
+    """
+    `sarfa_baseline_saliency` on the static evaluator, the original board and
+    every perturbation are scored in one vectorized pass first
+    """
+    board = chess.Board(fen)
+    evaluator.prefetch([board] + [perturbed_board for perturbed_board, _ in perturber_class(board).process()])
+    return sarfa_baseline_saliency(evaluator, fen, action)
+
+def agreement_report(engine, max_puzzles: int | None = None, limit: chess.engine.Limit | None = None, top_k: int = 3) -> dict:
+    """
+    Static against engine-based baseline saliency on the dataset: rank
+    correlation and top-k overlap of the maps, accuracy/ROC AUC of both
+    against the ground truth and the time per puzzle
+    """
+    from scipy.stats import spearmanr
+    from chess_dataset import load_dataset
+    from chess_dataset.sweep import score_variants
+
+    dataset = load_dataset()
+    count = len(dataset) if max_puzzles is None else min(max_puzzles, len(dataset))
+    evaluator = StaticEvaluator()
+
+    predicted = np.zeros((2, count, 64))
+    evaluated = np.zeros((2, count, 64), dtype=bool)
+    ground_truth = np.zeros((count, 64), dtype=bool)
+    correlations, overlaps = [], []
+    seconds = np.zeros(2)
+    for i in range(count):
+        fen = dataset.get_fen(i)
+        action = chess.Board(fen).parse_san(dataset.get_solution(i)[0])
+        for square in dataset.get_saliency_ground_truth(i):
+            ground_truth[i, chess.parse_square(square)] = True
+
+        start = time.perf_counter()
+        static = static_saliency(evaluator, fen, action)
+        seconds[0] += time.perf_counter() - start
+        start = time.perf_counter()
+        reference = sarfa_baseline_saliency(engine, fen, action, limit=limit)
+        seconds[1] += time.perf_counter() - start
+
+        for variant, saliency in enumerate((static, reference)):
+            for square, value in saliency.items():
+                predicted[variant, i, chess.parse_square(square)] = value
+                evaluated[variant, i, chess.parse_square(square)] = True
+
+        squares = sorted(set(static) | set(reference))
+        static_values = [static.get(square, 0.0) for square in squares]
+        reference_values = [reference.get(square, 0.0) for square in squares]
+        if len(squares) > 1 and np.ptp(static_values) > 0 and np.ptp(reference_values) > 0:
+            correlations.append(spearmanr(static_values, reference_values).statistic)
+        top_static = set(sorted(squares, key=lambda square: -static.get(square, 0.0))[:top_k])
+        top_reference = set(sorted(squares, key=lambda square: -reference.get(square, 0.0))[:top_k])
+        overlaps.append(len(top_static & top_reference) / max(min(top_k, len(squares)), 1))
+
+    accuracy, aucs = score_variants(predicted, evaluated, ground_truth)
+    return {
+        "puzzles": count,
+        "spearman": float(np.mean(correlations)) if correlations else None,
+        f"top{top_k}_overlap": float(np.mean(overlaps)) if overlaps else None,
+        "static": {"accuracy": float(accuracy[0]), "auc": aucs[0], "seconds_per_puzzle": seconds[0] / max(count, 1)},
+        "engine": {"accuracy": float(accuracy[1]), "auc": aucs[1], "seconds_per_puzzle": seconds[1] / max(count, 1)},
+    }
+
+def main(argv: list[str] | None = None):
+    from .engine import make_engine
+
+    parser = argparse.ArgumentParser(description="Agreement of static-evaluator saliency with engine saliency on the dataset")
+    parser.add_argument("--engine", default="auto", help='"fake", "fake-uci", "auto" (Stockfish if found, else fake) or a path to a UCI engine')
+    parser.add_argument("--nodes", type=int, default=20_000, help="node limit per engine search")
+    parser.add_argument("--max-puzzles", type=int, default=None)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    engine = make_engine(args.engine)
+    try:
+        report = agreement_report(engine, args.max_puzzles, chess.engine.Limit(nodes=args.nodes), args.top_k)
+    finally:
+        engine.close()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
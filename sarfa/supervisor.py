@@ -0,0 +1,127 @@
+"""
+Engine that survives crashes and hangs of its UCI process.
+
+```python
+with SupervisedEngine("./stockfish_15_x64_avx2", {"Threads": 4}, timeout=30) as engine:
+    q_values, best_move = engine.q_values(board, set(board.legal_moves), limit=chess.engine.Limit(depth=12))
+```
+
+- every search runs under a watchdog, a search that takes `timeout` seconds
+  longer than its time limit (or `timeout` seconds for node and depth limits)
+  gets its process killed
+- a dead or killed process is replaced by a fresh one with the same options
+- the failed request is retried on the new process, at most `retries` times,
+  before `EngineUnavailable` is raised
+- any other `chess.engine.EngineError` (e.g. MultiPV 0 on a finished game)
+  is raised at once, without a restart
+- every new process answers `isready` and runs a short warm-up search before
+  it takes requests, so the first real search doesn't pay for start-up
+  (hash allocation, network loading)
+"""
+
+import threading
+
+import chess
+import chess.engine
+
+from . import profiling
+from .engine import Engine
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_RETRIES = 2
+WARMUP_LIMIT = chess.engine.Limit(depth=4)
+
+# what a crashed, hung or killed engine process raises, other `EngineError`s are
+# deterministic (bad position or arguments) and a restart would only repeat them
+ENGINE_FAILURES = (chess.engine.EngineTerminatedError, TimeoutError, OSError)
+
+class EngineUnavailable(RuntimeError):
+    """
+    The engine kept failing after every retry
+    """
+
+class SupervisedEngine(Engine):
+    def __init__(self, engine_path: str | list[str], options: dict | None = None, timeout: float | None = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES, warmup_limit: chess.engine.Limit | None = WARMUP_LIMIT):
+        """
+        Params
+        - engine_path, options: as for `Engine`, the options are re-applied after every restart
+        - timeout: float (seconds a search may run past its time limit, None disables the watchdog)
+        - retries: int (restarts per request before giving up)
+        - warmup_limit: chess.engine.Limit (search run by every new process, None to skip it)
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.warmup_limit = warmup_limit
+        self.restarts = 0
+        self.timeouts = 0
+        self._restart_lock = threading.Lock()
+        super().__init__(engine_path, options)
+
+    def _open(self) -> chess.engine.SimpleEngine:
+        chess_engine = super()._open()
+        try:
+            chess_engine.ping()
+            if self.warmup_limit is not None:
+                chess_engine.analyse(chess.Board(), self.warmup_limit)
+        except BaseException:
+            chess_engine.close()
+            raise
+        return chess_engine
+
+    def _watchdog_timeout(self, limit: chess.engine.Limit) -> float | None:
+        if self.timeout is None:
+            return None
+        return (limit.time or 0.0) + self.timeout
+
+    def _expire(self, chess_engine: chess.engine.SimpleEngine):
+        self.timeouts += 1
+        # kills the process, the pending analyse raises EngineTerminatedError
+        chess_engine.close()
+
+    def _analyse(self, board: chess.Board, limit: chess.engine.Limit, multipv: int) -> list[chess.engine.InfoDict]:
+        timeout = self._watchdog_timeout(limit)
+        if timeout is None:
+            return super()._analyse(board, limit, multipv)
+
+        watchdog = threading.Timer(timeout, self._expire, args=(self.chess_engine,))
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            return super()._analyse(board, limit, multipv)
+        finally:
+            watchdog.cancel()
+
+    def restart(self, failed: chess.engine.SimpleEngine | None = None):
+        """
+        Replaces the engine process. With `failed`, only if it is still the current one
+        (another thread may have restarted it already).
+        """
+        with self._restart_lock:
+            if failed is not None and self.chess_engine is not failed:
+                return
+            with profiling.span("engine.restart", engine=str(self.engine_path)):
+                self.close()
+                self.chess_engine = self._open()
+                self.restarts += 1
+
+    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, float], str]:
+        failure: BaseException | None = None
+        for _ in range(self.retries + 1):
+            chess_engine = self.chess_engine
+            try:
+                return super().q_values(board, candidate_actions, multipv=multipv, runtime=runtime, limit=limit)
+            except ENGINE_FAILURES as error:
+                failure = error
+
+            try:
+                self.restart(chess_engine)
+            except (chess.engine.EngineError, *ENGINE_FAILURES) as error:
+                # the next attempt fails fast on the dead process and restarts again
+                failure = error
+        raise EngineUnavailable(f"{self.engine_path} failed {self.retries + 1} times, last error: {failure!r}") from failure
+
+    def close(self):
+        try:
+            super().close()
+        except ENGINE_FAILURES:
+            self.chess_engine.close()
@@ -0,0 +1,272 @@
+"""
+Learned surrogate of SARFA that answers in milliseconds without an engine.
+
+An ensemble of ridge regressions maps board features to the 64-square
+saliency map. The features are 12x64 piece planes, 2x64 attack counts and
+the from/to squares of the explained move, always seen from the side to
+move (black to move positions are mirrored). The members are fit on
+bootstrap resamples of stored SARFA results, their disagreement is the
+uncertainty of a prediction. The uncertainty threshold is calibrated on
+positions held out of the fit, the members are more certain about the
+positions they were trained on. `SurrogateExplainer` answers confident
+positions from the model and sends the rest to the real engine pipeline.
+Training on the result store lives in `chess_dataset.surrogate`.
+
+```python
+explainer = SurrogateExplainer(SurrogateModel.load("output/surrogate.npz"), engine=pool)
+explanations = explainer.explain_batch([(fen, move), ...])
+explanations[0].saliency, explanations[0].source # "surrogate" or "engine"
+```
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Sequence
+
+import chess
+import chess.engine
+import numpy as np
+
+from .algorithms import sarfa_baseline_saliency
+from .perturbation_handler import Perturber, RemovalPerturber
+
+PIECE_PLANES = 12
+FEATURES = (PIECE_PLANES + 2 + 2) * 64 + 1 # piece planes, attack counts, move from/to, in check
+DEFAULT_MEMBERS = 8
+DEFAULT_ALPHA = 10.0
+# uncertainty quantile of the calibration positions that is still answered by the surrogate
+DEFAULT_CONFIDENT_QUANTILE = 0.8
+# share of the positions held out of the fit to calibrate the threshold on
+DEFAULT_CALIBRATION = 0.2
+MODEL_PATH = "output/surrogate.npz"
+
+def _bitboard_array(mask: int) -> np.ndarray:
+    return np.unpackbits(np.array([mask], dtype="<u8").view(np.uint8), bitorder="little")
+
+def _oriented(board: chess.Board, action: chess.Move | None) -> tuple[chess.Board, chess.Move | None]:
+    """
+    The board from the point of view of the side to move, as white
+    """
+    if board.turn == chess.WHITE:
+        return board, action
+    if action is not None:
+        action = chess.Move(chess.square_mirror(action.from_square), chess.square_mirror(action.to_square), action.promotion)
+    return board.mirror(), action
+
+def _orient_squares(values: np.ndarray, turn: chess.Color) -> np.ndarray:
+    """
+    Maps (..., 64) square values between the board and its oriented view (the mapping is its own inverse)
+    """
+    if turn == chess.WHITE:
+        return values
+    return values[..., [chess.square_mirror(square) for square in chess.SQUARES]]
+
+def board_features(board: chess.Board, action: chess.Move | None = None) -> np.ndarray:
+    """
+    (FEATURES,) float32 features of a position and the move to explain
+    """
+    board, action = _oriented(board, action)
+    features = np.zeros(FEATURES, dtype=np.float32)
+
+    planes = features[:PIECE_PLANES * 64].reshape(PIECE_PLANES, 64)
+    for color in chess.COLORS:
+        for piece_type in chess.PIECE_TYPES:
+            planes[(piece_type - 1) + (0 if color == chess.WHITE else 6)] = _bitboard_array(board.pieces_mask(piece_type, color))
+
+    attacks = features[PIECE_PLANES * 64:(PIECE_PLANES + 2) * 64].reshape(2, 64)
+    for square, piece in board.piece_map().items():
+        attacks[0 if piece.color == chess.WHITE else 1] += _bitboard_array(board.attacks_mask(square))
+
+    move = features[(PIECE_PLANES + 2) * 64:(PIECE_PLANES + 4) * 64].reshape(2, 64)
+    if action is not None:
+        move[0, action.from_square] = 1
+        move[1, action.to_square] = 1
+
+    features[-1] = board.is_check()
+    return features
+
+def ridge(X: np.ndarray, Y: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    (features, targets) ridge weights of centred X and Y, from the smaller of
+    the two equivalent systems: primal (features x features) when there are
+    more positions than features, dual (positions x positions) otherwise
+    """
+    positions, features = X.shape
+    if positions > features:
+        return np.linalg.solve(X.T @ X + alpha * np.eye(features), X.T @ Y)
+    return X.T @ np.linalg.solve(X @ X.T + alpha * np.eye(positions), Y)
+
+@dataclass()
+class SurrogatePrediction:
+    saliency: np.ndarray # (n, 64) by chess square
+    uncertainty: np.ndarray # (n,) ensemble standard deviation, averaged over the explained squares
+    squares: np.ndarray # (n, 64) squares an engine sweep would have explained
+
+class SurrogateModel:
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, mean: np.ndarray, threshold: float = np.inf, perturber_class: type[Perturber] = RemovalPerturber, metadata: dict[str, Any] | None = None):
+        """
+        Params
+        - weights: (members, FEATURES, 64)
+        - bias: (members, 64)
+        - mean: (FEATURES,) feature mean the members were centred on
+        - threshold: float (predictions with a higher uncertainty are routed to the engine)
+        """
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.threshold = threshold
+        self.perturber_class = perturber_class
+        self.metadata = metadata or {}
+
+    @classmethod
+    def fit(cls, boards: Sequence[chess.Board], actions: Sequence[chess.Move | None], saliency: np.ndarray, members: int = DEFAULT_MEMBERS, alpha: float = DEFAULT_ALPHA, confident_quantile: float = DEFAULT_CONFIDENT_QUANTILE, calibration: float = DEFAULT_CALIBRATION, seed: int = 0, perturber_class: type[Perturber] = RemovalPerturber) -> "SurrogateModel":
+        """
+        Params
+        - saliency: (n, 64) stored saliency maps by chess square, NaN (not evaluated) counts as 0
+        - members: int (bootstrap resamples in the ensemble)
+        - alpha: float (ridge penalty)
+        - confident_quantile: float (share of new positions the surrogate answers itself)
+        - calibration: float (share of the FENs held out of the fit to calibrate the threshold on,
+          with too few positions for a split the training positions are used)
+        """
+        rng = np.random.default_rng(seed)
+        fens = [board.fen() for board in boards]
+        unique_fens = sorted(set(fens))
+        held_out = set(rng.permutation(unique_fens)[:int(round(calibration * len(unique_fens)))].tolist())
+        calibrate = np.array([fen in held_out for fen in fens], dtype=bool)
+        split = calibrate.any() and not calibrate.all()
+        if not split:
+            calibrate = np.ones(len(fens), dtype=bool)
+        fit = ~calibrate if split else calibrate
+
+        fit_indices = np.flatnonzero(fit)
+        X = np.stack([board_features(boards[i], actions[i]) for i in fit_indices]).astype(np.float64)
+        Y = np.stack([_orient_squares(np.nan_to_num(saliency[i]), boards[i].turn) for i in fit_indices]).astype(np.float64)
+        mean = X.mean(axis=0)
+
+        weights = np.empty((members, FEATURES, 64))
+        bias = np.empty((members, 64))
+        for member in range(members):
+            sample = rng.integers(0, len(X), len(X))
+            Xs = X[sample] - mean
+            Ys = Y[sample]
+            bias[member] = Ys.mean(axis=0)
+            weights[member] = ridge(Xs, Ys - bias[member], alpha)
+
+        calibrate_indices = np.flatnonzero(calibrate)
+        model = cls(weights.astype(np.float32), bias.astype(np.float32), mean.astype(np.float32), perturber_class=perturber_class, metadata={"positions": len(X), "calibration_positions": int(len(calibrate_indices)) if split else 0, "members": members, "alpha": alpha})
+        uncertainty = model.predict([boards[i] for i in calibrate_indices], [actions[i] for i in calibrate_indices]).uncertainty
+        model.threshold = float(np.quantile(uncertainty, confident_quantile))
+        return model
+
+    def predict(self, boards: Sequence[chess.Board], actions: Sequence[chess.Move | None] | None = None) -> SurrogatePrediction:
+        """
+        Batched prediction, one feature matrix product per ensemble member
+        """
+        actions = actions if actions is not None else [None] * len(boards)
+        X = np.stack([board_features(board, action) for board, action in zip(boards, actions)]) - self.mean
+        # (members, n, 64) in the oriented view
+        oriented = np.einsum("nf,mfs->mns", X, self.weights) + self.bias[:, None, :]
+
+        squares = np.stack([_bitboard_array(self.perturber_class(board).candidate_squares()).astype(bool) for board in boards])
+        mean = np.empty((len(boards), 64), dtype=np.float32)
+        std = np.empty((len(boards), 64), dtype=np.float32)
+        for i, board in enumerate(boards):
+            mean[i] = _orient_squares(oriented[:, i].mean(axis=0), board.turn)
+            std[i] = _orient_squares(oriented[:, i].std(axis=0), board.turn)
+
+        uncertainty = np.array([std[i][squares[i]].mean() if squares[i].any() else 0.0 for i in range(len(boards))])
+        return SurrogatePrediction(saliency=np.clip(mean, 0, 1), uncertainty=uncertainty, squares=squares)
+
+    def saliency_map(self, board: chess.Board, action: chess.Move | None = None) -> tuple[dict[str, float], float]:
+        prediction = self.predict([board], [action])
+        row = prediction.saliency[0]
+        return {chess.square_name(square): float(row[square]) for square in np.flatnonzero(prediction.squares[0])}, float(prediction.uncertainty[0])
+
+    def save(self, path: str = MODEL_PATH):
+        np.savez(
+            path,
+            weights=self.weights,
+            bias=self.bias,
+            mean=self.mean,
+            threshold=self.threshold,
+            perturber=self.perturber_class.__name__,
+            metadata=json.dumps(self.metadata),
+        )
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> "SurrogateModel":
+        from . import perturbation_handler
+        with np.load(path) as data:
+            return cls(
+                data["weights"],
+                data["bias"],
+                data["mean"],
+                threshold=float(data["threshold"]),
+                perturber_class=getattr(perturbation_handler, str(data["perturber"])),
+                metadata=json.loads(str(data["metadata"])),
+            )
+
+@dataclass()
+class SurrogateExplanation:
+    fen: str
+    saliency: dict[str, float]
+    uncertainty: float
+    source: str # "surrogate" or "engine"
+    elapsed: float
+
+class SurrogateExplainer:
+    def __init__(self, model: SurrogateModel, engine=None, algorithm: Callable[..., dict[str, float]] = sarfa_baseline_saliency, limit: chess.engine.Limit | None = None, threshold: float | None = None, workers: int = 1):
+        """
+        Params
+        - engine: anything with the `q_values` contract, None to always answer from the surrogate
+        - algorithm: saliency algorithm used for low-confidence positions
+        - threshold: float (overrides the uncertainty threshold calibrated at training time)
+        - workers: int (low-confidence positions explained at the same time, useful with an EnginePool)
+        """
+        self.model = model
+        self.engine = engine
+        self.algorithm = algorithm
+        self.limit = limit
+        self.threshold = model.threshold if threshold is None else threshold
+        self.workers = workers
+
+    def explain_batch(self, items: Sequence[tuple[str, chess.Move | None]]) -> list[SurrogateExplanation]:
+        start = time.perf_counter()
+        boards = [chess.Board(fen) for fen, _ in items]
+        prediction = self.model.predict(boards, [action for _, action in items])
+        surrogate_elapsed = (time.perf_counter() - start) / max(len(items), 1)
+
+        explanations = []
+        routed = []
+        for i, (fen, _) in enumerate(items):
+            row, squares = prediction.saliency[i], prediction.squares[i]
+            explanations.append(SurrogateExplanation(
+                fen=fen,
+                saliency={chess.square_name(square): float(row[square]) for square in np.flatnonzero(squares)},
+                uncertainty=float(prediction.uncertainty[i]),
+                source="surrogate",
+                elapsed=surrogate_elapsed,
+            ))
+            if self.engine is not None and prediction.uncertainty[i] > self.threshold:
+                routed.append(i)
+
+        def explain_with_engine(i: int):
+            engine_start = time.perf_counter()
+            fen, action = items[i]
+            explanations[i].saliency = dict(self.algorithm(self.engine, fen, action, limit=self.limit))
+            explanations[i].source = "engine"
+            explanations[i].elapsed = surrogate_elapsed + time.perf_counter() - engine_start
+
+        if self.workers > 1 and len(routed) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(explain_with_engine, routed))
+        else:
+            for i in routed:
+                explain_with_engine(i)
+        return explanations
+
+    def explain(self, fen: str, action: chess.Move | None = None) -> SurrogateExplanation:
+        return self.explain_batch([(fen, action)])[0]
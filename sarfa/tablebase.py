@@ -0,0 +1,109 @@
+"""
+Syzygy tablebase backend for endgame q-values.
+
+Positions covered by the local tablebase files are scored exactly by probing
+every candidate move, everything else goes to the fallback engine.
+
+```python
+engine = TablebaseEngine("./syzygy", fallback=Engine("./stockfish_15_x64_avx2"))
+saliency_calculator = SarfaBaseline(engine, board)
+```
+"""
+
+import threading
+
+import chess
+import chess.engine
+import chess.syzygy
+
+from . import profiling
+
+MATE_SCORE = 40 # same scale as `Engine.q_values`
+DTZ_STEP = 0.1 # a win (loss) scores 0.1 less (more) per ply to the next zeroing move
+MAX_DTZ = 100
+
+def wdl_to_q_value(wdl: int, dtz: int) -> float:
+    """
+    Maps WDL/DTZ of the side that just moved to the `Engine` q-value scale.
+    Wins score in [30, 40], faster wins higher, losses mirror that and
+    draws (including cursed wins and blessed losses) score 0.
+    """
+    if wdl == 2:
+        return round(MATE_SCORE - DTZ_STEP * min(abs(dtz), MAX_DTZ), 2)
+    if wdl == -2:
+        return round(-MATE_SCORE + DTZ_STEP * min(abs(dtz), MAX_DTZ), 2)
+    return 0.0
+
+class TablebaseEngine:
+    """
+    `q_values` contract backed by Syzygy tables, falling back to `fallback`
+    (Engine, QValueDispatcher, ...) for positions the tables don't cover
+    """
+
+    def __init__(self, tablebase_path: str | list[str], fallback=None):
+        """
+        Params
+        - tablebase_path: str or list of directories with .rtbw/.rtbz files
+        - fallback: anything with the `q_values` contract (None raises for uncovered positions)
+        """
+        paths = [tablebase_path] if isinstance(tablebase_path, str) else tablebase_path
+        self.tablebase = chess.syzygy.Tablebase()
+        for path in paths:
+            self.tablebase.add_directory(path)
+        self.fallback = fallback
+        # table names look like "KRPvKR"
+        self.max_pieces = max((len(name) - 1 for name in self.tablebase.wdl), default=0)
+
+        self.hits = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def covers(self, board: chess.Board) -> bool:
+        return not board.castling_rights and chess.popcount(board.occupied) <= self.max_pieces
+
+    def probe(self, board: chess.Board, candidate_actions) -> dict[str, float] | None:
+        """
+        Exact q-value of every candidate move, None when any of them can't be probed
+        """
+        board = board.copy(stack=False)
+        score_per_move = {}
+        for move in candidate_actions:
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    score = MATE_SCORE
+                elif board.is_stalemate() or board.is_insufficient_material():
+                    score = 0.0
+                else:
+                    # probes are from the point of view of the opponent
+                    wdl = self.tablebase.get_wdl(board)
+                    dtz = self.tablebase.get_dtz(board)
+                    if wdl is None or dtz is None:
+                        return None
+                    score = wdl_to_q_value(-wdl, abs(dtz) + 1)
+            finally:
+                board.pop()
+            score_per_move[str(move)] = score
+        return score_per_move
+
+    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0, limit: chess.engine.Limit | None = None) -> tuple[dict[str, float], str]:
+        with profiling.span("tablebase.q_values") as span_attrs:
+            score_per_move = self.probe(board, candidate_actions) if self.covers(board) else None
+            span_attrs["outcome"] = "fallback" if score_per_move is None else "hit"
+
+        with self._lock:
+            if score_per_move is None:
+                self.fallbacks += 1
+            else:
+                self.hits += 1
+
+        if score_per_move is None:
+            if self.fallback is None:
+                raise chess.syzygy.MissingTableError(f"position not covered by the tablebase: {board.fen()}")
+            return self.fallback.q_values(board, candidate_actions, multipv=multipv, runtime=runtime, limit=limit)
+
+        optimal_action: str = max(score_per_move, key=score_per_move.get)
+        return score_per_move, optimal_action
+
+    def close(self):
+        self.tablebase.close()
@@ -0,0 +1,175 @@
+"""
+Calibrates the engine layout (processes x Threads x Hash) for this machine.
+
+```bash
+python -m sarfa.tuning --engine ./stockfish_15_x64_avx2 --fens 8 --depth 12
+```
+
+Every layout runs the same depth-limited work, so the quality of each
+search is comparable, and is measured for
+- nps: nodes per second summed over all processes
+- time_to_depth: mean seconds per search to reach the target depth
+- throughput: SARFA explanations per second on an `EnginePool` of the layout
+- stability: 1 - mean absolute saliency difference between two runs of
+  every explanation (multi-threaded search is not deterministic)
+
+The hash is cleared before every timed pass and before both explanation
+passes, so no measurement is served from the searches of the previous one.
+
+The fastest layout whose stability is within `--stability-tolerance` of the
+most stable one is written to `LAYOUT_PATH`. `EnginePool.from_spec` (the
+server, PGN pipeline) and the work queue workers use it, other callers opt
+in with `make_engine(..., layout=True)`.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import chess
+import chess.engine
+
+from .algorithms import sarfa_baseline_saliency
+from .engine import Engine, EngineLayout, LAYOUT_PATH, make_engine, resolve_engine_spec, save_layout
+from .server import EnginePool
+
+DEFAULT_DEPTH = 12
+DEFAULT_HASH_MB = (16, 64)
+STABILITY_TOLERANCE = 0.05
+
+def default_layouts(cpus: int | None = None, hash_sizes: tuple[int, ...] = DEFAULT_HASH_MB) -> list[tuple[int, int, int]]:
+    """
+    (processes, threads, hash) layouts that use every core once
+    """
+    cpus = cpus or os.cpu_count() or 1
+    thread_counts = [threads for threads in (1, 2, 4, 8, 16, 32) if threads <= cpus and cpus % threads == 0]
+    return [(cpus // threads, threads, hash_mb) for threads, hash_mb in itertools.product(thread_counts, hash_sizes)]
+
+def parse_layout(layout: str) -> tuple[int, int, int]:
+    """
+    "8x4x64" -> 8 processes, 4 threads, 64 MB hash
+    """
+    processes, threads, hash_mb = (int(part) for part in layout.lower().split("x"))
+    return processes, threads, hash_mb
+
+def _saliency_difference(first: dict[str, float], second: dict[str, float]) -> float:
+    positions = set(first) | set(second)
+    if not positions:
+        return 0.0
+    return sum(abs(first.get(position, 0) - second.get(position, 0)) for position in positions) / len(positions)
+
+def _clear_hash(engine: Engine):
+    """
+    python-chess sends `ucinewgame`, which clears the hash, whenever the `game` of a search changes
+    """
+    engine.chess_engine.analyse(chess.Board(), chess.engine.Limit(depth=1), game=object())
+
+def _clear_hashes(engines: list[Engine]):
+    for engine in engines:
+        _clear_hash(engine)
+
+def measure_layout(engine_spec: str, processes: int, threads: int, hash_mb: int, fens: list[str], depth: int = DEFAULT_DEPTH) -> dict[str, Any]:
+    options = {"Threads": threads, "Hash": hash_mb}
+    engines = [make_engine(engine_spec, options) for _ in range(processes)]
+    if not all(isinstance(engine, Engine) for engine in engines):
+        raise ValueError("calibration needs a UCI engine")
+    limit = chess.engine.Limit(depth=depth)
+
+    try:
+        # raw search speed, every process searches its share of the FENs
+        def search(index: int) -> list[tuple[int, float]]:
+            chess_engine = engines[index].chess_engine
+            searches = []
+            for fen in fens[index::processes]:
+                start = time.perf_counter()
+                info = chess_engine.analyse(chess.Board(fen), limit)
+                searches.append((info.get("nodes", 0), time.perf_counter() - start))
+            return searches
+
+        _clear_hashes(engines)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=processes) as executor:
+            searches = [item for result in executor.map(search, range(processes)) for item in result]
+        search_wall = time.perf_counter() - start
+
+        # explanations through the pool, one explanation per process at a time,
+        # from a cold hash so the searches above don't inflate the throughput
+        pool = EnginePool(engines)
+        _clear_hashes(engines)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=processes) as executor:
+            saliency_maps = list(executor.map(lambda fen: sarfa_baseline_saliency(pool, fen, limit=limit), fens))
+        explain_wall = time.perf_counter() - start
+
+        # the same explanations again from a cold hash, a warm one would hide non-determinism
+        _clear_hashes(engines)
+        with ThreadPoolExecutor(max_workers=processes) as executor:
+            repeated = list(executor.map(lambda fen: sarfa_baseline_saliency(pool, fen, limit=limit), fens))
+        stability = 1 - sum(_saliency_difference(first, second) for first, second in zip(saliency_maps, repeated)) / len(fens)
+    finally:
+        for engine in engines:
+            engine.close()
+
+    return {
+        "processes": processes,
+        "threads": threads,
+        "hash_mb": hash_mb,
+        "nps": sum(nodes for nodes, _ in searches) / search_wall if search_wall > 0 else 0.0,
+        "time_to_depth": sum(seconds for _, seconds in searches) / len(searches) if searches else 0.0,
+        "throughput": len(fens) / explain_wall if explain_wall > 0 else 0.0,
+        "stability": float(stability),
+    }
+
+def choose_layout(measurements: list[dict[str, Any]], stability_tolerance: float = STABILITY_TOLERANCE) -> dict[str, Any]:
+    """
+    Highest explanation throughput among the layouts that are about as stable as the most stable one
+    """
+    most_stable = max(measurement["stability"] for measurement in measurements)
+    candidates = [measurement for measurement in measurements if measurement["stability"] >= most_stable - stability_tolerance]
+    return max(candidates, key=lambda measurement: measurement["throughput"])
+
+def calibrate(engine_spec: str, layouts: list[tuple[int, int, int]], fens: list[str], depth: int = DEFAULT_DEPTH, stability_tolerance: float = STABILITY_TOLERANCE, path: str | None = LAYOUT_PATH, verbose: bool = True) -> EngineLayout:
+    engine_spec = resolve_engine_spec(engine_spec)
+    measurements = []
+    for processes, threads, hash_mb in layouts:
+        measurement = measure_layout(engine_spec, processes, threads, hash_mb, fens, depth=depth)
+        measurements.append(measurement)
+        if verbose:
+            print(json.dumps(measurement))
+
+    best = choose_layout(measurements, stability_tolerance)
+    layout = EngineLayout(
+        engine=engine_spec,
+        processes=best["processes"],
+        threads=best["threads"],
+        hash_mb=best["hash_mb"],
+        measurements={"depth": depth, "fens": len(fens), "layouts": measurements},
+    )
+    if path:
+        save_layout(layout, path)
+    return layout
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Calibrate processes x Threads x Hash for the engine pool")
+    parser.add_argument("--engine", default="auto", help='"fake-uci", "auto" (Stockfish if found) or a path to a UCI engine')
+    parser.add_argument("--layouts", nargs="*", default=None, metavar="PROCESSESxTHREADSxHASH", help="e.g. 8x1x16 2x4x64, defaults to every split of the cores")
+    parser.add_argument("--fens", type=int, default=8, help="number of dataset FENs to measure on")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="search depth of every measured search")
+    parser.add_argument("--stability-tolerance", type=float, default=STABILITY_TOLERANCE)
+    parser.add_argument("--output", default=LAYOUT_PATH)
+    args = parser.parse_args(argv)
+
+    from chess_dataset import load_dataset
+    dataset = load_dataset()
+    fens = [dataset.get_fen(i) for i in range(min(args.fens, len(dataset)))]
+    layouts = [parse_layout(layout) for layout in args.layouts] if args.layouts else default_layouts()
+
+    layout = calibrate(args.engine, layouts, fens, depth=args.depth, stability_tolerance=args.stability_tolerance, path=args.output)
+    print(f"best layout: {layout.processes} processes x {layout.threads} threads x {layout.hash_mb} MB hash, written to {args.output}")
+
+if __name__ == "__main__":
+    main()
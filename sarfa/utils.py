@@ -1,6 +1,4 @@
 import chess
-import networkx as nx
-import matplotlib.pyplot as plt
 
 def get_pos_obj(board_position: str) -> "chess-like-object":
     mapping = {
@@ -92,6 +90,9 @@ def visualize_directed_graph(graph):
     """
     Visualize a directed graph
     """
+    # plotting stack is only needed here, keep it off the compute path
+    import networkx as nx
+    import matplotlib.pyplot as plt
 
     G = nx.DiGraph()
     
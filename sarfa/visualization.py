@@ -1,17 +1,46 @@
 from chess import Board, Move
 import numpy as np
-import cv2
+from . import profiling
 from .utils import pos_to_index_mapping
 import svg_custom.svg_custom as svg_custom 
-import cairosvg
 import matplotlib.pyplot as plt
 import chess
 from PIL import Image as PILImage
 
+def _square(i: int, j: int) -> chess.Square:
+    """
+    Square (i, j) of the flipped heatmap, row 0 is rank 8
+    """
+    return chess.square(j, 7 - i)
+
+def _rgb(r: float, g: float, b: float) -> str:
+    # truncated into 0-255 like the OpenCV frames the colors were tuned on
+    return "rgb({}, {}, {})".format(*(min(max(int(channel), 0), 255) for channel in (r, g, b)))
+
+def _best_move_arrows(best_move: Move) -> list[svg_custom.Arrow]:
+    if not best_move:
+        return []
+    return [svg_custom.Arrow(tail =  best_move.from_square, head = best_move.to_square, color = '#e6e600')]
+
+def _write_drawing(drawing_file: str, svg: str) -> str:
+    """
+    Writes the SVG next to its single rasterisation and returns the PNG path
+    """
+    import cairosvg
+
+    with open(f"{drawing_file}.svg", 'w+') as f:
+        f.write(svg)
+    cairosvg.svg2png(url=f"{drawing_file}.svg", write_to=f"{drawing_file}.png")
+    return f"{drawing_file}.png"
+
 class BoardVisualization():
     DRAWING_FILE = "svg_custom/board"
-    def __init__(self, board: Board):
+    def __init__(self, board: Board, drawing_file: str | None = None):
+        """
+        drawing_file: path without extension of the SVG/PNG written by `show_heatmap`, defaults to `DRAWING_FILE`
+        """
         self.board : Board = board
+        self.drawing_file = drawing_file or self.DRAWING_FILE
 
     def only_board(self) -> "displayable":
         """
@@ -31,80 +60,57 @@ class BoardVisualization():
 
         return heatmap
 
-    def _add_labels(self, board_array: np.array):
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.5
-        thickness = 1
-        color = (255, 255, 255)  # White text
-
-        # Add column labels (a to h) towards the center of each square
-        for j, label in enumerate("abcdefgh"):
-            position = (45 * j + 37, 395)  # Adjusted to center the label in the square
-            cv2.putText(board_array, label, position, font, font_scale, color, thickness)
-
-        # Add row labels (1 to 8) slightly lower than before
-        for i, label in enumerate("87654321"):
-            position = (5, 45 * i + 47)  # Slightly lower text for rows
-            cv2.putText(board_array, label, position, font, font_scale, color, thickness)
-
-    def _draw_saliency_boxes(self, heatmap: np.array):
-        # original board as a numpy array
-        board_array = cv2.imread(f"{self.DRAWING_FILE}.png")
-        self._add_labels(board_array)
+    def get_overlays(self, heatmap: np.array) -> list[svg_custom.Overlay]:
         if not heatmap.any():
-            cv2.imwrite(f"{self.DRAWING_FILE}.png", board_array)
-            return
+            return []
 
         threshold = (10/256)*np.max(heatmap) # percentage threshold. Saliency values above this threshold won't be mapped onto board
 
-        # Create bounding boxes with saliency colours for every square on chess board
+        # bounding boxes with saliency colours for every square on chess board
+        overlays = []
         for i in range(0, 8, 1):
             for j in range(0, 8, 1):
-                ii = 45*i+20
-                jj = 45*j+20
                 value_of_square =  heatmap[i, j]
                 if value_of_square < threshold:
                     continue
-                for box_i in range(ii, ii+44, 1):
-                    for box_j in range(jj, jj+44, 1):
-                        if box_i > ii+4 and box_i < ii+40 and box_j > jj+4 and box_j < jj+40:
-                            continue
-                        board_array[box_i, box_j, 0] = 256 - 0.8*256*heatmap[i, j]/(np.max(heatmap) + 1e-10)
-                        board_array[box_i, box_j, 1] = 256 - 0.84*256*heatmap[i, j]/(np.max(heatmap) + 1e-10)
-                        board_array[box_i, box_j, 2] = 256 - 0.19*256*heatmap[i, j]/(np.max(heatmap) + 1e-10)
-        cv2.imwrite(f"{self.DRAWING_FILE}.png", board_array)
+                overlays.append(svg_custom.Overlay(_square(i, j), _rgb(
+                    256 - 0.19*256*heatmap[i, j]/(np.max(heatmap) + 1e-10),
+                    256 - 0.84*256*heatmap[i, j]/(np.max(heatmap) + 1e-10),
+                    256 - 0.8*256*heatmap[i, j]/(np.max(heatmap) + 1e-10),
+                )))
+        return overlays
+
+    def svg(self, position_to_saliency: dict[str, float], best_move: Move) -> str:
+        """
+        The board with the best move arrow and saliency boxes as one SVG
+        image, without rasterising it
+        """
+        overlays = self.get_overlays(self.get_heatmap(position_to_saliency))
+        # white coordinates on an opaque black margin, readable on any page
+        return svg_custom.board(self.board, arrows = _best_move_arrows(best_move), overlays = overlays, coordinate_color = "#fff", margin_color = "#000")
 
+    @profiling.profiled("render.heatmap")
     def show_heatmap(self, position_to_saliency: dict[str, float], best_move: Move) -> str:
         """
         Generates heatmap for saliency evaluation of the best move
 
-        Returns path (string) to SVG image with correct drawings.
+        Returns path (string) to PNG image with correct drawings, the SVG is next to it.
 
         ```bash
         board_path = Visualizer.show_heatmap(...)
         display(Image(board_path))
         ```
         """
-        heatmap = self.get_heatmap(position_to_saliency)
-
-        # draw svg with arrow best_move
-        arrows = []
-        if best_move:
-            arrows = [svg_custom.Arrow(tail =  best_move.from_square, head = best_move.to_square, color = '#e6e600')]
-        svg = svg_custom.board(self.board, arrows = arrows)
-
-        with open(f"{self.DRAWING_FILE}.svg", 'w+') as f:
-            f.write(svg)
-        cairosvg.svg2png(url=f"{self.DRAWING_FILE}.svg", write_to=f"{self.DRAWING_FILE}.png")
-
-        self._draw_saliency_boxes(heatmap)
-
-        return f"{self.DRAWING_FILE}.png"
+        return _write_drawing(self.drawing_file, self.svg(position_to_saliency, best_move))
 
 class OffenseDefenseBoardVisualization():
     DRAWING_FILE = "svg_custom/board"
-    def __init__(self, board: Board):
+    def __init__(self, board: Board, drawing_file: str | None = None):
+        """
+        drawing_file: path without extension of the SVG/PNG written by `show_heatmap`, defaults to `DRAWING_FILE`
+        """
         self.board : Board = board
+        self.drawing_file = drawing_file or self.DRAWING_FILE
 
     def only_board(self) -> "displayable":
         """
@@ -131,21 +137,19 @@ class OffenseDefenseBoardVisualization():
 
         return heatmap, offense_defense_heatmap
 
-    def _draw_saliency_boxes(self, heatmap: np.array, offense_defense_heatmap:np.array):
-        # original board as a numpy array
-        board_array = cv2.imread(f"{self.DRAWING_FILE}.png")
-
-        defensive_threshold = (100/256)*np.max(heatmap[offense_defense_heatmap == -1]) # percentage threshold. Saliency values above this threshold won't be mapped onto board
-        defensive_max = np.max(heatmap[offense_defense_heatmap == -1])
+    def get_overlays(self, heatmap: np.array, offense_defense_heatmap:np.array) -> list[svg_custom.Overlay]:
+        defensive_values = heatmap[offense_defense_heatmap == -1]
+        defensive_max = np.max(defensive_values) if defensive_values.size else 0
+        defensive_threshold = (100/256)*defensive_max # percentage threshold. Saliency values above this threshold won't be mapped onto board
 
-        offensive_threshold = (100/256)*np.max(heatmap[offense_defense_heatmap == 1]) # percentage threshold. Saliency values above this threshold won't be mapped onto board
-        offensive_max = np.max(heatmap[offense_defense_heatmap == 1])
+        offensive_values = heatmap[offense_defense_heatmap == 1]
+        offensive_max = np.max(offensive_values) if offensive_values.size else 0
+        offensive_threshold = (100/256)*offensive_max # percentage threshold. Saliency values above this threshold won't be mapped onto board
 
-        # Create bounding boxes with saliency colours for every square on chess board
+        # bounding boxes with saliency colours for every square on chess board
+        overlays = []
         for i in range(0, 8, 1):
             for j in range(0, 8, 1):
-                ii = 45*i+20
-                jj = 45*j+20
                 value_of_square =  heatmap[i, j]
 
                 if (int(offense_defense_heatmap[i, j]) == 1 and value_of_square < offensive_threshold):
@@ -153,54 +157,52 @@ class OffenseDefenseBoardVisualization():
                 elif (int(offense_defense_heatmap[i, j]) == -1 and value_of_square < defensive_threshold):
                     continue
 
-                for box_i in range(ii, ii+44, 1):
-                    for box_j in range(jj, jj+44, 1):
-                        if box_i > ii+4 and box_i < ii+40 and box_j > jj+4 and box_j < jj+40:
-                            continue
-                        # offensive
-                        if (int(offense_defense_heatmap[i, j]) == 1):
-                            board_array[box_i, box_j, 0] = 256 - 0.8*256*heatmap[i, j]/(offensive_max + 1e-10)
-                            board_array[box_i, box_j, 1] = 256 - 0.84*256*heatmap[i, j]/(offensive_max + 1e-10)
-                            board_array[box_i, box_j, 2] = 256 - 0.19*256*heatmap[i, j]/(offensive_max + 1e-10)
-                        elif ((int(offense_defense_heatmap[i, j]) == -1)):
-                            # defensive
-                            board_array[box_i, box_j, 0] = 256 - 0.19*256*heatmap[i, j]/(defensive_max + 1e-10)
-                            board_array[box_i, box_j, 1] = 256 - 0.84*256*heatmap[i, j]/(defensive_max + 1e-10)
-                            board_array[box_i, box_j, 2] = 256 - 0.8*256*heatmap[i, j]/(defensive_max + 1e-10)
-
-        cv2.imwrite(f"{self.DRAWING_FILE}.png", board_array)
+                # offensive
+                if (int(offense_defense_heatmap[i, j]) == 1):
+                    overlays.append(svg_custom.Overlay(_square(i, j), _rgb(
+                        256 - 0.19*256*heatmap[i, j]/(offensive_max + 1e-10),
+                        256 - 0.84*256*heatmap[i, j]/(offensive_max + 1e-10),
+                        256 - 0.8*256*heatmap[i, j]/(offensive_max + 1e-10),
+                    )))
+                elif ((int(offense_defense_heatmap[i, j]) == -1)):
+                    # defensive
+                    overlays.append(svg_custom.Overlay(_square(i, j), _rgb(
+                        256 - 0.8*256*heatmap[i, j]/(defensive_max + 1e-10),
+                        256 - 0.84*256*heatmap[i, j]/(defensive_max + 1e-10),
+                        256 - 0.19*256*heatmap[i, j]/(defensive_max + 1e-10),
+                    )))
+        return overlays
+
+    def svg(self, position_to_saliency: dict[str, tuple[str, float]], best_move: Move) -> str:
+        """
+        The board with the best move arrow and offensive/defensive saliency
+        boxes as one SVG image, without rasterising it
+        """
+        overlays = self.get_overlays(*self.get_heatmap(position_to_saliency))
+        return svg_custom.board(self.board, arrows = _best_move_arrows(best_move), overlays = overlays)
 
+    @profiling.profiled("render.heatmap")
     def show_heatmap(self, position_to_saliency: dict[str, tuple[str, float]], best_move: Move) -> str:
         """
         Generates heatmap for saliency evaluation of the best move
 
-        Returns path (string) to SVG image with correct drawings.
+        Returns path (string) to PNG image with correct drawings, the SVG is next to it.
 
         ```bash
         board_path = Visualizer.show_heatmap(...)
         display(Image(board_path))
         ```
         """
-        heatmap, offense_defense_heatmap = self.get_heatmap(position_to_saliency)
-
-        # draw svg with arrow best_move
-        arrows = []
-        if best_move:
-            arrows = [svg_custom.Arrow(tail =  best_move.from_square, head = best_move.to_square, color = '#e6e600')]
-        svg = svg_custom.board(self.board, arrows = arrows)
-
-        with open(f"{self.DRAWING_FILE}.svg", 'w+') as f:
-            f.write(svg)
-        cairosvg.svg2png(url=f"{self.DRAWING_FILE}.svg", write_to=f"{self.DRAWING_FILE}.png")
-
-        self._draw_saliency_boxes(heatmap, offense_defense_heatmap)
-
-        return f"{self.DRAWING_FILE}.png"
+        return _write_drawing(self.drawing_file, self.svg(position_to_saliency, best_move))
 
 class PairsBoardVisualization():
     DRAWING_FILE = "svg_custom/board"
-    def __init__(self, board: Board):
+    def __init__(self, board: Board, drawing_file: str | None = None):
+        """
+        drawing_file: path without extension of the SVG/PNG written by `show_heatmap`, defaults to `DRAWING_FILE`
+        """
         self.board : Board = board
+        self.drawing_file = drawing_file or self.DRAWING_FILE
 
     def only_board(self) -> "displayable":
         """
@@ -222,60 +224,43 @@ class PairsBoardVisualization():
 
         return heatmap
 
-    def _draw_saliency_boxes(self, heatmap: np.array):
+    def get_overlays(self, heatmap: np.array) -> list[svg_custom.Overlay]:
         # define group colors with RGB
         colors = [(255, 0, 0), (255, 153, 51), (255, 255, 51), (153, 255, 51), (51, 255, 255), (0,0,255), (127,0,255), (255,0,255), (128, 128, 128)]
 
-        # original board as a numpy array
-        board_array = cv2.imread(f"{self.DRAWING_FILE}.png")
-
         threshold = 0
 
-        # Create bounding boxes with saliency colours for every square on chess board
+        # bounding boxes with the group colour for every square on chess board
+        overlays = []
         for i in range(0, 8, 1):
             for j in range(0, 8, 1):
-                ii = 45*i+20
-                jj = 45*j+20
                 value_of_square =  heatmap[i, j]
                 if value_of_square < threshold:
                     continue
-                for box_i in range(ii, ii+44, 1):
-                    for box_j in range(jj, jj+44, 1):
-                        if box_i > ii+4 and box_i < ii+40 and box_j > jj+4 and box_j < jj+40:
-                            continue
-
-                        board_array[box_i, box_j, 0] = colors[int(heatmap[i, j])][2]
-                        board_array[box_i, box_j, 1] = colors[int(heatmap[i, j])][1]
-                        board_array[box_i, box_j, 2] = colors[int(heatmap[i, j])][0]
+                overlays.append(svg_custom.Overlay(_square(i, j), _rgb(*colors[int(heatmap[i, j])])))
+        return overlays
 
-        cv2.imwrite(f"{self.DRAWING_FILE}.png", board_array)
+    def svg(self, important_groups: list[list[str]], best_move: Move) -> str:
+        """
+        The board with the best move arrow and a coloured box per group as
+        one SVG image, without rasterising it
+        """
+        overlays = self.get_overlays(self.get_heatmap(important_groups))
+        return svg_custom.board(self.board, arrows = _best_move_arrows(best_move), overlays = overlays)
 
+    @profiling.profiled("render.heatmap")
     def show_heatmap(self, important_groups: list[list[str]], best_move: Move) -> str:
         """
         Generates heatmap for saliency evaluation of the best move
 
-        Returns path (string) to SVG image with correct drawings.
+        Returns path (string) to PNG image with correct drawings, the SVG is next to it.
 
         ```bash
         board_path = Visualizer.show_heatmap(...)
         display(Image(board_path))
         ```
         """
-        heatmap = self.get_heatmap(important_groups)
-
-        # draw svg with arrow best_move
-        arrows = []
-        if best_move:
-            arrows = [svg_custom.Arrow(tail =  best_move.from_square, head = best_move.to_square, color = '#e6e600')]
-        svg = svg_custom.board(self.board, arrows = arrows)
-
-        with open(f"{self.DRAWING_FILE}.svg", 'w+') as f:
-            f.write(svg)
-        cairosvg.svg2png(url=f"{self.DRAWING_FILE}.svg", write_to=f"{self.DRAWING_FILE}.png")
-
-        self._draw_saliency_boxes(heatmap)
-
-        return f"{self.DRAWING_FILE}.png"
+        return _write_drawing(self.drawing_file, self.svg(important_groups, best_move))
 
 class ProgressionVisualizer:
     def __init__(self, saliency_timestep, moves_taken: list[chess.Move]):
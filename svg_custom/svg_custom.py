@@ -48,6 +48,11 @@ XX = """<g id="xx"><path d="M35.865 9.135a1.89 1.89 0 0 1 0 2.673L25.173 22.5l10
 
 CHECK_GRADIENT = """<radialGradient id="check_gradient"><stop offset="0%" stop-color="#ff0000" stop-opacity="1.0" /><stop offset="50%" stop-color="#e70000" stop-opacity="1.0" /><stop offset="100%" stop-color="#9e0000" stop-opacity="0.0" /></radialGradient>"""  # noqa: E501
 
+# parsed once, every board appends the same elements
+PIECE_ELEMENTS = {symbol: ET.fromstring(svg) for symbol, svg in PIECES.items()}
+XX_ELEMENT = ET.fromstring(XX)
+CHECK_GRADIENT_ELEMENT = ET.fromstring(CHECK_GRADIENT)
+
 DEFAULT_COLORS = {
     "square light": "#c2c2c2",
     "square dark": "#696969",
@@ -65,6 +70,15 @@ class Arrow:
         self.color = color
 
 
+class Overlay:
+    """Colored frame inside a square, drawn over pieces and arrows."""
+
+    def __init__(self, square, color, *, width=5):
+        self.square = square
+        self.color = color
+        self.width = width
+
+
 class SvgWrapper(str):
     def _repr_svg_(self):
         return self
@@ -85,7 +99,7 @@ def _svg(viewbox, size):
     return svg
 
 
-def _text(content, x, y, width, height):
+def _text(content, x, y, width, height, color=None):
     t = ET.Element("text", {
         "x": str(x + width // 2),
         "y": str(y + height // 2),
@@ -93,6 +107,8 @@ def _text(content, x, y, width, height):
         "text-anchor": "middle",
         "alignment-baseline": "middle",
     })
+    if color is not None:
+        t.set("fill", color)
     t.text = content
     return t
 
@@ -109,11 +125,11 @@ def piece(piece, size=None):
     .. image:: ../docs/wR.svg
     """
     svg = _svg(SQUARE_SIZE, size)
-    svg.append(ET.fromstring(PIECES[piece.symbol()]))
+    svg.append(PIECE_ELEMENTS[piece.symbol()])
     return SvgWrapper(ET.tostring(svg).decode("utf-8"))
 
 
-def board(board=None, *, squares=None, flipped=False, coordinates=True, lastmove=None, check=None, arrows=(), size=None, style=None):
+def board(board=None, *, squares=None, flipped=False, coordinates=True, lastmove=None, check=None, arrows=(), overlays=(), coordinate_color=None, margin_color=None, size=None, style=None):
     """
     Renders a board with pieces and/or selected squares as an SVG image.
 
@@ -128,6 +144,12 @@ def board(board=None, *, squares=None, flipped=False, coordinates=True, lastmove
         ``[chess.svg.Arrow(chess.E2, chess.E4)]`` or a list of tuples like
         ``[(chess.E2, chess.E4)]``. An arrow from a square pointing to the same
         square is drawn as a circle, like ``[(chess.E2, chess.E2)]``.
+    :param overlays: A list of :class:`Overlay` frames like
+        ``[Overlay(chess.E4, "rgb(255, 0, 0)")]``, drawn last.
+    :param coordinate_color: Fill color of the coordinates or ``None`` (the
+        default) for black.
+    :param margin_color: Fill color of an opaque margin behind the
+        coordinates or ``None`` (the default) for a transparent one.
     :param size: The size of the image in pixels (e.g., ``400`` for a 400 by
         400 board) or ``None`` (the default) for no size limit.
     :param style: A CSS stylesheet to include in the SVG image.
@@ -148,18 +170,28 @@ def board(board=None, *, squares=None, flipped=False, coordinates=True, lastmove
         ET.SubElement(svg, "style").text = style
 
     defs = ET.SubElement(svg, "defs")
+    if margin_color is not None and margin:
+        ET.SubElement(svg, "rect", {
+            "x": "0",
+            "y": "0",
+            "width": str(8 * SQUARE_SIZE + 2 * margin),
+            "height": str(8 * SQUARE_SIZE + 2 * margin),
+            "fill": margin_color,
+            "class": "margin",
+        })
+
     if board:
         for color in chess.COLORS:
             for piece_type in chess.PIECE_TYPES:
                 if board.pieces_mask(piece_type, color):
-                    defs.append(ET.fromstring(PIECES[chess.Piece(piece_type, color).symbol()]))
+                    defs.append(PIECE_ELEMENTS[chess.Piece(piece_type, color).symbol()])
 
     squares = chess.SquareSet(squares) if squares else chess.SquareSet()
     if squares:
-        defs.append(ET.fromstring(XX))
+        defs.append(XX_ELEMENT)
 
     if check is not None:
-        defs.append(ET.fromstring(CHECK_GRADIENT))
+        defs.append(CHECK_GRADIENT_ELEMENT)
 
     if lastmove:
         try:
@@ -221,12 +253,12 @@ def board(board=None, *, squares=None, flipped=False, coordinates=True, lastmove
     if coordinates:
         for file_index, file_name in enumerate(chess.FILE_NAMES):
             x = (file_index if not flipped else 7 - file_index) * SQUARE_SIZE + margin
-            svg.append(_text(file_name, x, 0, SQUARE_SIZE, margin))
-            svg.append(_text(file_name, x, margin + 8 * SQUARE_SIZE, SQUARE_SIZE, margin))
+            svg.append(_text(file_name, x, 0, SQUARE_SIZE, margin, coordinate_color))
+            svg.append(_text(file_name, x, margin + 8 * SQUARE_SIZE, SQUARE_SIZE, margin, coordinate_color))
         for rank_index, rank_name in enumerate(chess.RANK_NAMES):
             y = (7 - rank_index if not flipped else rank_index) * SQUARE_SIZE + margin
-            svg.append(_text(rank_name, 0, y, margin, SQUARE_SIZE))
-            svg.append(_text(rank_name, margin + 8 * SQUARE_SIZE, y, margin, SQUARE_SIZE))
+            svg.append(_text(rank_name, 0, y, margin, SQUARE_SIZE, coordinate_color))
+            svg.append(_text(rank_name, margin + 8 * SQUARE_SIZE, y, margin, SQUARE_SIZE, coordinate_color))
 
     for arrow in arrows:
         try:
@@ -293,4 +325,22 @@ def board(board=None, *, squares=None, flipped=False, coordinates=True, lastmove
                 "class": "arrow",
             })
 
-    return SvgWrapper(ET.tostring(svg).decode("utf-8"))
\ No newline at end of file
+    for overlay in overlays:
+        file_index = chess.square_file(overlay.square)
+        rank_index = chess.square_rank(overlay.square)
+
+        x = (file_index if not flipped else 7 - file_index) * SQUARE_SIZE + margin
+        y = (7 - rank_index if not flipped else rank_index) * SQUARE_SIZE + margin
+        outer = SQUARE_SIZE - 1
+        inner = SQUARE_SIZE - 2 * overlay.width
+
+        # the square with its inside cut out by the even-odd rule
+        ET.SubElement(svg, "path", {
+            "d": "M{} {}h{outer}v{outer}h-{outer}zM{} {}v{inner}h{inner}v-{inner}z".format(
+                x, y, x + overlay.width, y + overlay.width, outer=outer, inner=inner),
+            "fill": overlay.color,
+            "fill-rule": "evenodd",
+            "class": "overlay {}".format(chess.SQUARE_NAMES[overlay.square]),
+        })
+
+    return SvgWrapper(ET.tostring(svg).decode("utf-8"))
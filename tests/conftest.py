@@ -0,0 +1,30 @@
+import glob
+import os
+
+import pytest
+
+from chess_dataset import load_dataset
+from sarfa.utils import read_fens
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def in_repo(monkeypatch):
+    """
+    Runs the test from the repository root, the dataset and output paths are relative to it
+    """
+    monkeypatch.chdir(ROOT)
+
+@pytest.fixture(scope="session")
+def dataset():
+    return load_dataset(prefix=ROOT + "/")
+
+@pytest.fixture(scope="session")
+def all_fens(dataset) -> list[str]:
+    """
+    The dataset puzzles and every FEN in test_fens/
+    """
+    fens = [dataset.get_fen(i) for i in range(len(dataset))]
+    for path in sorted(glob.glob(os.path.join(ROOT, "test_fens", "*.txt"))):
+        fens.extend(read_fens(path))
+    return fens
@@ -0,0 +1,33 @@
+import chess.engine
+import pytest
+
+from sarfa import FakeEngine
+from sarfa.adaptive import adaptive_sarfa_saliency
+
+LIMIT = chess.engine.Limit(nodes=20000)
+
+class CountingEngine:
+    def __init__(self):
+        self.engine = FakeEngine()
+        self.calls = 0
+
+    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0, limit=None):
+        self.calls += 1
+        return self.engine.q_values(board, candidate_actions, multipv=multipv, runtime=runtime, limit=limit)
+
+@pytest.fixture(scope="module")
+def results(dataset):
+    engine = CountingEngine()
+    results = [adaptive_sarfa_saliency(engine, dataset.get_fen(i), limit=LIMIT) for i in range(0, len(dataset), 4)]
+    return engine, results
+
+def test_default_schedule_stays_under_half_the_nodes(results):
+    _, results = results
+    assert sum(result.spent for result in results) <= 0.5 * sum(result.uniform_cost for result in results)
+    # the last round of a complete schedule is at the full budget
+    assert any(LIMIT.nodes in result.budget.values() for result in results)
+
+def test_default_schedule_does_not_double_the_engine_calls(results):
+    engine, results = results
+    uniform_calls = sum(result.uniform_cost / LIMIT.nodes for result in results)
+    assert engine.calls < 1.6 * uniform_calls
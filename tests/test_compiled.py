@@ -0,0 +1,55 @@
+import zlib
+
+import chess
+import numpy as np
+import pytest
+from sklearn.metrics import auc
+
+from chess_dataset import ResultStore, SarfaBenchmark, bitmask_metrics
+from chess_dataset.compiled import pack_masks, unpack_masks
+from chess_dataset.result_store import saliency_row, squares_mask
+
+PUZZLES = 30
+
+def random_saliency(fen: str, action: chess.Move | None = None) -> dict[str, float]:
+    """
+    Deterministic stand-in for an algorithm: a value for every non-king piece, seeded by the FEN
+    """
+    board = chess.Board(fen)
+    rng = np.random.default_rng(zlib.crc32(board.board_fen().encode()))
+    squares = [square for square, piece in board.piece_map().items() if piece.piece_type != chess.KING]
+    return {chess.square_name(square): float(value) for square, value in zip(squares, rng.random(len(squares)))}
+
+@pytest.fixture
+def benchmark(in_repo):
+    benchmark = SarfaBenchmark(random_saliency)
+    benchmark.name = "random"
+    benchmark._run_test(max_puzzles=PUZZLES, verbose=False)
+    return benchmark
+
+def test_masks_round_trip():
+    squares = np.random.default_rng(0).random((10, 64)) < 0.3
+    assert (unpack_masks(pack_masks(squares)) == squares).all()
+    assert pack_masks(squares)[0] == squares_mask(chess.square_name(square) for square in np.flatnonzero(squares[0]))
+
+def test_bitmask_metrics_match_benchmark(benchmark):
+    predicted = np.stack([saliency_row(result.saliency) for result in benchmark.results])
+    ground_truth = np.array([squares_mask(result.ground_truth) for result in benchmark.results], dtype=np.uint64)
+    metrics = bitmask_metrics(predicted, ground_truth)
+
+    fpr, tpr = benchmark.roc_curve()
+    assert metrics["accuracy"] == pytest.approx(benchmark.accuracy())
+    assert metrics["auc"] == pytest.approx(auc(fpr, tpr))
+    assert metrics == benchmark.bitmask_metrics()
+
+def test_stored_results_score_like_the_run(benchmark, tmp_path):
+    store = ResultStore(str(tmp_path / "results"))
+    store.append(benchmark.results)
+    loaded = SarfaBenchmark.load_results(random_saliency, "random", store=store)
+
+    assert len(loaded.index_to_position_strs) == PUZZLES
+    assert loaded.accuracy() == pytest.approx(benchmark.accuracy())
+    fpr, tpr = loaded.roc_curve()
+    assert auc(fpr, tpr) == pytest.approx(auc(*benchmark.roc_curve()))
+    for metric, value in benchmark.bitmask_metrics().items():
+        assert loaded.bitmask_metrics()[metric] == pytest.approx(value)
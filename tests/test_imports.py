@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from chess_dataset.perf import PLOTTING_MODULES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import json, sys
+{statement}
+print(json.dumps(sorted(name for name in {modules!r} if name in sys.modules)))
+"""
+
+def loaded_plotting_modules(statement: str) -> list[str]:
+    """
+    Plotting modules loaded by `statement` in a fresh interpreter
+    """
+    script = SCRIPT.format(statement=statement, modules=PLOTTING_MODULES)
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, cwd=ROOT).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+@pytest.mark.parametrize("statement", [
+    "import sarfa",
+    "from sarfa import Engine, RemovalPerturber, SarfaBaseline",
+    "from sarfa.algorithms import sarfa_baseline_saliency",
+])
+def test_compute_path_loads_no_plotting_module(statement):
+    assert loaded_plotting_modules(statement) == []
+
+@pytest.mark.parametrize("module", [
+    "chess_dataset.compiled",
+    "chess_dataset.significance",
+    "chess_dataset.move_delta",
+    "sarfa.static_eval",
+])
+def test_cli_is_not_imported_by_its_package(module):
+    # runpy warns when the package already imported the module it is about to run as __main__
+    subprocess.run([sys.executable, "-W", "error::RuntimeWarning", "-m", module, "--help"], capture_output=True, check=True, cwd=ROOT)
@@ -0,0 +1,31 @@
+import chess
+import pytest
+
+from sarfa.move_delta import MoveDelta, validate
+from sarfa.perturbation_handler import PERTURBERS, RemovalPerturber
+
+@pytest.mark.parametrize("perturber", sorted(PERTURBERS))
+def test_common_actions_match_full_generation(all_fens, perturber):
+    stats = validate(all_fens, [perturber])
+    assert stats["boards"] > 0
+    assert stats["mismatches"] == 0
+
+@pytest.mark.parametrize("fen", [
+    # castling both ways, a removed rook or a piece on the king's path changes it
+    "r3k2r/pppq1ppp/2n1bn2/2bpp3/2BPP3/2N1BN2/PPPQ1PPP/R3K2R w KQkq - 0 1",
+    # en passant on d6, and a pin of the capturing pawn along the fifth rank
+    "8/8/8/K2pP2r/8/8/8/7k w - d6 0 1",
+    # in check, only evasions are legal
+    "4k3/8/8/8/7b/8/3P4/4K3 w - - 0 1",
+])
+def test_special_moves(fen):
+    board = chess.Board(fen)
+    delta = MoveDelta(board)
+    for perturbed_board, position_str in RemovalPerturber(board).process():
+        assert delta.common_actions(perturbed_board) == delta.root_actions & set(perturbed_board.legal_moves), position_str
+
+def test_unchanged_board_keeps_every_root_action():
+    board = chess.Board()
+    delta = MoveDelta(board)
+    assert delta.common_actions(board.copy()) == set(board.legal_moves)
+    assert delta.rechecked == 0
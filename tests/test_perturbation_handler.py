@@ -0,0 +1,40 @@
+import chess
+
+from sarfa.perturbation_handler import CompositePerturber, FileMaskPerturber, RemovalPerturber, position_hash
+
+# removable pieces only on the e-file
+E_FILE = "7k/4p3/8/8/4R3/8/4P3/K7 w - - 0 1"
+
+def test_file_mask_yields_one_board_per_file():
+    board = chess.Board(E_FILE)
+    unique = list(FileMaskPerturber(board).process_unique())
+    assert len(unique) == 1
+    perturbed_board, position_strs = unique[0]
+    assert sorted(position_strs) == [f"e{rank}" for rank in range(1, 9)]
+    assert perturbed_board.piece_map().keys() == {chess.A1, chess.H8}
+
+def test_score_unique_scores_every_board_once():
+    board = chess.Board(E_FILE)
+    scored_boards = []
+
+    def score(perturbed_board: chess.Board) -> int:
+        scored_boards.append(perturbed_board)
+        return len(scored_boards)
+
+    results = FileMaskPerturber(board).score_unique(score)
+    assert len(scored_boards) == 1
+    assert sorted(results) == [(f"e{rank}", 1) for rank in range(1, 9)]
+
+def test_composite_duplicates_reach_every_position_string():
+    board = chess.Board(E_FILE)
+    perturber = CompositePerturber(board, ["removal", "file_mask"])
+    results = perturber.score_unique(position_hash)
+
+    expected = [(position_str, position_hash(perturbed_board)) for perturbed_board, position_str in perturber.process()]
+    assert sorted(results) == sorted(expected)
+    assert len({result for _, result in results}) == len({position_hash(perturbed_board) for perturbed_board, _ in perturber.process()})
+
+def test_removal_keeps_one_entry_per_piece():
+    board = chess.Board()
+    results = RemovalPerturber(board).score_unique(position_hash)
+    assert len(results) == len({result for _, result in results}) == 30
@@ -0,0 +1,108 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import chess
+import pytest
+
+from sarfa.fake_engine import FakeEngine
+from sarfa.server import DEFAULT_BUDGET, DEFAULT_DEADLINE, BadRequest, EnginePool, ExplanationServer, ExplanationService
+
+FEN = "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3"
+CHECKMATE = "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3"
+STALEMATE = "7k/5Q2/6K1/8/8/8/8/8 b - - 0 1"
+
+@pytest.fixture
+def service():
+    pool = EnginePool([FakeEngine()])
+    service = ExplanationService(pool)
+    yield service
+    service.close()
+
+def test_parse_request_defaults(service):
+    fen, algorithm, action, budget, deadline, png, svg = service.parse_request({"fen": FEN})
+    assert (fen, algorithm, action) == (FEN, "baseline", None)
+    assert budget == DEFAULT_BUDGET
+    assert deadline == DEFAULT_DEADLINE
+    assert (png, svg) == (False, False)
+
+def test_parse_request_normalizes(service):
+    _, algorithm, action, budget, deadline, _, svg = service.parse_request({
+        "fen": FEN, "algorithm": "add_pawn", "action": "f1b5", "budget": {"nodes": 500.0, "time": 1}, "deadline": 5, "svg": True,
+    })
+    assert algorithm == "add_pawn"
+    assert action == chess.Move.from_uci("f1b5")
+    assert budget == {"nodes": 500, "time": 1.0}
+    assert deadline == 5.0 and svg
+
+@pytest.mark.parametrize("request_body", [
+    [FEN],
+    {},
+    {"fen": 1},
+    {"fen": "not a fen"},
+    {"fen": "8/8/8/8/8/8/8/8 w - - 0 1"},
+    {"fen": CHECKMATE},
+    {"fen": STALEMATE},
+    {"fen": FEN, "algorithm": "unknown"},
+    {"fen": FEN, "action": 1},
+    {"fen": FEN, "action": "e2"},
+    {"fen": FEN, "action": "e1e3"},
+    {"fen": FEN, "budget": {"nodes": None}},
+    {"fen": FEN, "budget": {"nodes": True}},
+    {"fen": FEN, "budget": {"nodes": -1}},
+    {"fen": FEN, "budget": {"nodes": "100"}},
+    {"fen": FEN, "budget": {"plies": 3}},
+    {"fen": FEN, "budget": [1000]},
+    {"fen": FEN, "deadline": 0},
+    {"fen": FEN, "deadline": "5"},
+    {"fen": FEN, "deadline": True},
+    {"fen": FEN, "deadline": None},
+])
+def test_bad_requests_raise_bad_request(service, request_body):
+    with pytest.raises(BadRequest):
+        service.explain(request_body)
+    assert service.counters["bad_requests"] == 1
+    assert service.counters["errors"] == 0
+
+def test_explain(service):
+    result = service.explain({"fen": FEN, "action": "f1b5", "budget": {"nodes": 100}})
+    assert result["best_move"] == "f1b5"
+    assert result["saliency"]
+    assert not result["coalesced"]
+    assert service.counters["requests"] == 1
+    assert service.counters["bad_requests"] == service.counters["errors"] == 0
+
+class BrokenEngine(FakeEngine):
+    def q_values(self, board, candidate_actions, multipv=100, runtime=5.0, limit=None):
+        raise ValueError("engine returned garbage")
+
+def post(server: ExplanationServer, body: bytes) -> tuple[int, dict]:
+    request = urllib.request.Request(f"http://127.0.0.1:{server.server_address[1]}/explain", data=body, method="POST")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+@pytest.fixture
+def broken_server():
+    service = ExplanationService(EnginePool([BrokenEngine()]))
+    server = ExplanationServer(("127.0.0.1", 0), service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+def test_http_status_codes(broken_server):
+    assert post(broken_server, b"not json")[0] == 400
+    assert post(broken_server, json.dumps({"fen": "not a fen"}).encode())[0] == 400
+
+    # a ValueError while computing is the server's fault, not the request's
+    status, payload = post(broken_server, json.dumps({"fen": FEN}).encode())
+    assert status == 500
+    assert "engine returned garbage" in payload["error"]
+    assert broken_server.service.counters["bad_requests"] == 1
+    assert broken_server.service.counters["errors"] == 1
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from sklearn.metrics import roc_auc_score
+
+from chess_dataset import bitmask_metrics
+from chess_dataset.compiled import pack_masks, scale_saliency
+from chess_dataset.significance import ResultSet, _Scores, bootstrap
+
+PUZZLES = 40
+
+def result_set(name: str, seed: int, ground_truth: np.ndarray) -> ResultSet:
+    rng = np.random.default_rng(seed)
+    # rounded so that scores tie within and across puzzles
+    saliency = np.round(rng.random((PUZZLES, 64)), 1)
+    saliency[rng.random((PUZZLES, 64)) < 0.5] = np.nan
+    fens = np.array([f"fen {i}".encode() for i in range(PUZZLES)])
+    return ResultSet(name=name, fens=fens, saliency=saliency, ground_truth=ground_truth)
+
+@pytest.fixture(scope="module")
+def result_sets() -> list[ResultSet]:
+    ground_truth = pack_masks(np.random.default_rng(0).random((PUZZLES, 64)) < 0.1)
+    return [result_set("reference", 1, ground_truth), result_set("other", 2, ground_truth)]
+
+def sklearn_auc(result_set: ResultSet, weights: np.ndarray) -> float:
+    scaled, union, truth = scale_saliency(result_set.saliency, result_set.ground_truth)
+    scored = union & ~np.isnan(scaled)
+    sample_weight = np.broadcast_to(weights[:, None], scaled.shape)[scored]
+    return roc_auc_score(truth[scored], scaled[scored], sample_weight=sample_weight)
+
+def test_point_estimates_match_sklearn(result_sets):
+    comparison, _ = bootstrap(result_sets, resamples=10, processes=1)
+    for i, result_set in enumerate(result_sets):
+        metrics = bitmask_metrics(result_set.saliency, result_set.ground_truth)
+        assert comparison.estimate["accuracy"][i] == pytest.approx(metrics["accuracy"])
+        assert comparison.estimate["auc"][i] == pytest.approx(metrics["auc"])
+        assert comparison.estimate["auc"][i] == pytest.approx(sklearn_auc(result_set, np.ones(PUZZLES)))
+
+def test_weighted_auc_matches_sklearn(result_sets):
+    weights = np.random.default_rng(3).integers(0, 4, PUZZLES).astype(np.float64)
+    for result_set in result_sets:
+        assert _Scores(result_set).auc(weights[:, None])[0] == pytest.approx(sklearn_auc(result_set, weights))
+
+def test_reference_differs_from_itself_by_zero(result_sets):
+    comparison, _ = bootstrap(result_sets, resamples=50, processes=1)
+    for metric in ("accuracy", "auc"):
+        assert comparison.difference[metric][0] == (0.0, 0.0)
+        assert comparison.p_value[metric][0] == 1.0
+
+def test_distribution_does_not_depend_on_processes(result_sets):
+    _, in_process = bootstrap(result_sets, resamples=30, processes=1, block=8)
+    _, pooled = bootstrap(result_sets, resamples=30, processes=2, block=8)
+    np.testing.assert_array_equal(in_process, pooled)
@@ -0,0 +1,36 @@
+import chess
+import numpy as np
+import pytest
+
+from sarfa.surrogate import SurrogateModel, ridge
+
+def test_primal_and_dual_ridge_agree():
+    rng = np.random.default_rng(0)
+    X = rng.random((50, 20))
+    Y = rng.random((50, 3))
+    # 50 positions > 20 features takes the primal system, 10 positions the dual one
+    primal = ridge(X, Y, 1.0)
+    dual = X.T @ np.linalg.solve(X @ X.T + np.eye(50), Y)
+    np.testing.assert_allclose(primal, dual, atol=1e-10)
+    np.testing.assert_allclose(ridge(X[:10], Y[:10], 1.0), np.linalg.solve(X[:10].T @ X[:10] + np.eye(20), X[:10].T @ Y[:10]), atol=1e-10)
+
+@pytest.fixture(scope="module")
+def training(dataset):
+    boards = [chess.Board(dataset.get_fen(i)) for i in range(40)]
+    saliency = np.random.default_rng(1).random((len(boards), 64))
+    return boards, [None] * len(boards), saliency
+
+def test_threshold_is_calibrated_on_held_out_positions(training):
+    boards, actions, saliency = training
+    model = SurrogateModel.fit(boards, actions, saliency, members=3, calibration=0.25, confident_quantile=0.5)
+    assert model.metadata["positions"] == 30
+    assert model.metadata["calibration_positions"] == 10
+
+    uncertainty = model.predict(boards, actions).uncertainty
+    assert uncertainty.min() <= model.threshold <= uncertainty.max()
+
+def test_too_few_positions_calibrate_on_the_fit(training):
+    boards, actions, saliency = training
+    model = SurrogateModel.fit(boards[:2], actions[:2], saliency[:2], members=2, calibration=0.1)
+    assert model.metadata["positions"] == 2
+    assert model.metadata["calibration_positions"] == 0
@@ -0,0 +1,81 @@
+import pytest
+
+from chess_dataset import ResultStore
+from chess_dataset.work_queue import DONE, FAILED, LEASED, PENDING, Job, SQLiteBroker, export_results
+
+FEN = "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3"
+
+@pytest.fixture
+def broker(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "queue.sqlite"))
+    yield broker
+    broker.close()
+
+def jobs(count: int = 1) -> list[Job]:
+    return [Job(fen=FEN, algorithm="baseline", config={"nodes": 1000 + i}, action="f1b5", ground_truth=["c6"]) for i in range(count)]
+
+def status(broker: SQLiteBroker, job_id: int) -> str:
+    return broker._connection.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+def test_enqueue_ignores_queued_jobs(broker):
+    assert broker.enqueue(jobs(2)) == 2
+    assert broker.enqueue(jobs(3)) == 1
+    assert broker.progress()["total"] == 3
+
+def test_lease_and_complete_once(broker):
+    broker.enqueue(jobs(2))
+    leased = broker.lease("a", count=5)
+    assert [job.attempts for job in leased] == [1, 1]
+    assert broker.lease("b") == []
+
+    assert broker.complete(leased[0].id, "a", {"c6": 0.5}, elapsed=1.0)
+    assert not broker.complete(leased[0].id, "b", {"c6": 0.1}, elapsed=1.0)
+    assert [saliency for _, saliency in broker.results()] == [{"c6": 0.5}]
+    assert status(broker, leased[0].id) == DONE
+    assert status(broker, leased[1].id) == LEASED
+
+def test_expired_lease_is_leased_again(broker):
+    broker.enqueue(jobs())
+    job, = broker.lease("a", visibility_timeout=-1)
+    assert broker.progress()["pending"] == 1
+
+    retried, = broker.lease("b")
+    assert retried.id == job.id and retried.attempts == 2
+    # the first worker lost its lease
+    assert broker.heartbeat("a", [job.id]) == [job.id]
+    assert broker.heartbeat("b", [job.id]) == []
+
+def test_expired_lease_fails_after_max_attempts(broker):
+    broker.enqueue(jobs())
+    for _ in range(2):
+        job, = broker.lease("a", visibility_timeout=-1, max_attempts=2)
+    assert broker.lease("a", max_attempts=2) == []
+    assert status(broker, job.id) == FAILED
+    assert broker.progress()["failed"] == 1
+
+def test_fail_requeues_until_max_attempts(broker):
+    broker.enqueue(jobs())
+    job, = broker.lease("a")
+    broker.fail(job.id, "a", "crash", max_attempts=2)
+    assert status(broker, job.id) == PENDING
+
+    job, = broker.lease("a")
+    broker.fail(job.id, "a", "crash", max_attempts=2)
+    assert status(broker, job.id) == FAILED
+    assert broker.lease("a") == []
+
+def test_export_appends_each_result_once(broker, tmp_path):
+    store = ResultStore(str(tmp_path / "results"))
+    broker.enqueue(jobs(3))
+    for job in broker.lease("a", count=2):
+        broker.complete(job.id, "a", {"c6": 0.5, "f3": 0.0}, elapsed=1.0)
+
+    assert export_results(broker, store) == 2
+    assert export_results(broker, store) == 0
+    assert len(store) == 2
+
+    job, = broker.lease("a")
+    broker.complete(job.id, "a", {"c6": 1.0}, elapsed=1.0)
+    assert export_results(broker, store) == 1
+    assert len(store) == 3
+    assert store.row(2).ground_truth == ["c6"]